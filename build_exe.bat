@@ -32,6 +32,10 @@ if exist VERSION (
 )
 if not "%VERSION%"=="0.0.0" set NAME=tamil-mp3-downloader-v%VERSION%
 
+echo Compiling the catalog index...
+call python tools\build_catalog.py
+if not "%ERRORLEVEL%"=="0" echo Failed to build data\catalog.index.json; the app will compile it at startup.
+
 echo Running PyInstaller (this may take several minutes)...
 if exist "%SPEC_FILE%" (
   call pyinstaller --clean --noconfirm %ICON_PATH% "%SPEC_FILE%"
@@ -1,10 +1,10 @@
 from pathlib import Path
-from bs4 import BeautifulSoup
-import requests
 from urllib.parse import unquote
 import sys
 import json
 import os
+import argparse
+from typing import Optional
 
 # colorama init (cross-platform ANSI support)
 try:
@@ -19,17 +19,35 @@ except Exception:
 
 # Import helpers from split modules
 from utils.helper import (
-    collect_filtered_hrefs,
-    count_audio_hrefs,
     parse_star_selection,
     ensure_emoji_spacing,
+    PARSER_BACKENDS,
     clear_screen,
     print_banner,
     clear_below_banner,
     format_terminal_link,
     supports_terminal_links,
 )
-from utils.downloader import download_links
+from utils.downloader import audio_items, download_items, DownloadPool, DEFAULT_WORKERS, DEFAULT_PER_HOST
+from utils.session import configure_session, get_session, close_session, preload_in_background
+from utils.listing_cache import ListingCache, DEFAULT_TTL, DEFAULT_MAX_ENTRIES
+from utils.crawler import list_folders, DEFAULT_MAX_DEPTH
+from utils.ratelimit import RateLimiter, parse_rate, parse_schedule, format_rate
+from utils.retry import CircuitBreaker, DEFAULT_RETRIES
+from utils.batch import build_plan, enqueue_plan, estimate_plan, parse_batch_spec, resolve_plan, work_queue
+from utils.store import ContentStore
+from utils.manifest import Manifests
+from utils.sync import format_sync_counts, sync_folders
+from utils.segmented import DEFAULT_SEGMENT_THRESHOLD
+from utils.planner import (ThroughputLog, enough_space, estimate_folders, estimated_bytes, format_plan,
+                           free_space, listing_sizes, resolve_all)
+from utils.schedule import ORDER_DESCRIPTIONS, ORDER_POLICIES
+# only the constant: the queue itself (and sqlite3) is imported by run_queue
+from utils.workqueue import DEFAULT_LEASE
+from utils.daemon import DEFAULT_PORT
+from utils.progress import format_bytes, format_eta
+from utils.catalog import CatalogIndex, DATA_FILE_CATEGORIES
+from utils.telemetry import Telemetry, instrument_session, format_summary, profile_call
 
 # Re-export parse_star_selection for backward compatibility
 __all__ = ["parse_star_selection"]
@@ -65,6 +83,42 @@ CATEGORIES = {
     '4': 'Old Songs',
     '5': 'Ring tones / Instrumentals',
     '6': 'By Genre',
+    '7': 'Search all collections',
+}
+
+# Runtime options filled from the command line in main(); the menu handlers read them
+SETTINGS = {
+    'workers': DEFAULT_WORKERS,
+    'per_host': DEFAULT_PER_HOST,
+    'listing_cache': None,
+    'parser': 'fast',
+    'recursive': False,
+    'max_depth': DEFAULT_MAX_DEPTH,
+    'output_root': 'output',
+    'limiter': None,
+    'retries': DEFAULT_RETRIES,
+    # shared across collections so a host that went down stays known as down
+    'breaker': None,
+    # content index under <output_root>/.cache; None disables deduplication
+    'store': None,
+    # per-folder .manifest.json with each file's hash and format check; None with --no-manifest
+    'manifests': None,
+    # file of the searchable index of downloaded songs and their tags (opened by get_library());
+    # None with --no-library or --no-manifest
+    'library': None,
+    # split large files over this many connections (1 = off) once they reach the threshold
+    'segments': 1,
+    'segment_threshold': DEFAULT_SEGMENT_THRESHOLD,
+    # per-file metrics written to the --report file; None when not requested
+    'telemetry': None,
+    # --sync: fetch only files the listing shows as new or changed; --prune also deletes
+    # local files that are gone from the listing
+    'sync': False,
+    'prune': False,
+    # recent overall download rates (output/.cache/throughput.json), for the planner's ETA
+    'throughput': None,
+    # order queued files are handed to the workers in (utils.schedule)
+    'order': 'page',
 }
 
 
@@ -73,9 +127,17 @@ def goodbye_and_exit():
         print('\n' + INFO_COLOR + 'GoodBye Nanba/Nanbis!' + RESET)
     except Exception:
         print('\nGoodBye Nanba/Nanbis!')
+    end_session()
     sys.exit(0)
 
 
+def end_session():
+    """Write out the listing cache (it saves in batches) and close the shared HTTP session."""
+    if SETTINGS['listing_cache'] is not None:
+        SETTINGS['listing_cache'].flush()
+    close_session()
+
+
 def get_resource_path(rel_path: str) -> str:
     """Return an absolute path to a resource, working both when running from source
     and when bundled by PyInstaller (where resources are extracted to sys._MEIPASS).
@@ -148,37 +210,169 @@ def prompt_choice(prompt: str, default: str = '') -> str:
     return input(PROMPT_COLOR + prompt + RESET).strip() or default
 
 
-def show_and_download(index_url: str, category_name: str, save_subpath_default: str):
+def resolve_collection(index_url: str):
+    """List a collection (and its sub-folders with --recursive) as [(folder_url, rel_parts, hrefs, meta)]."""
+    return list_folders(index_url, get_session(), SETTINGS['listing_cache'], SETTINGS['parser'],
+                        recursive=SETTINGS['recursive'], max_depth=SETTINGS['max_depth'],
+                        workers=SETTINGS['workers'])
+
+
+def show_and_download(index_url: str, category_name: str, save_subpath_default: str, listed=None):
+    """Fetch the index (unless `listed`, a Future from resolve_collection, has it) and download.
+
+    With --recursive every sub-folder is listed too and its files land in the matching folder.
+    """
     clear_below_banner(BANNER, BANNER_COLOR, RESET)
+    out_dir = Path(SETTINGS['output_root']) / category_name / save_subpath_default
     try:
-        page = requests.get(index_url, timeout=30)
-        page.raise_for_status()
+        folders = listed.result() if listed is not None else resolve_collection(index_url)
     except Exception as e:
         print(ERROR_COLOR + f"Failed to fetch URL {index_url}: {e}" + RESET)
         return
 
-    soup = BeautifulSoup(page.content, 'html.parser')
-    hrefs = collect_filtered_hrefs(soup)
-    audio_count = count_audio_hrefs(hrefs)
+    sync_counts = None
+    if SETTINGS['sync']:
+        items, sync_counts = sync_folders(folders, out_dir, SETTINGS['manifests'], SETTINGS['prune'],
+                                          SETTINGS['store'], get_library())
+    else:
+        items = []
+        for folder_url, rel_parts, folder_hrefs, _ in folders:
+            items.extend(audio_items(folder_hrefs, folder_url, out_dir.joinpath(*rel_parts)))
+    audio_count = len(items)
+    found_in = f" in {len(folders)} folders" if len(folders) > 1 else ''
 
     print("")
-    print(INFO_COLOR + ensure_emoji_spacing(f"👋  I found {audio_count} audio links for {save_subpath_default}.\n") + RESET)
+    if sync_counts is not None:
+        print(INFO_COLOR + ensure_emoji_spacing(f"🔄  Sync{found_in} for {save_subpath_default}: {format_sync_counts(sync_counts)}.\n") + RESET)
+    else:
+        print(INFO_COLOR + ensure_emoji_spacing(f"👋  I found {audio_count} audio links{found_in} for {save_subpath_default}"
+                                                f"{describe_estimate(estimate_folders(folders))}.\n") + RESET)
 
     # build output directory
-    out_dir = Path(f'output/{category_name}/{save_subpath_default}')
     print(INFO_COLOR + f"Saving to: {out_dir}" + RESET)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    # Download audio links (downloader.download_links provides a default chunk_size)
-    total_audio, successful, failed = download_links(hrefs, index_url, out_dir)
+    # Download audio files (downloader provides a default chunk_size)
+    total_audio, successful, failed = download_items(items,
+                                                     workers=SETTINGS['workers'],
+                                                     per_host=SETTINGS['per_host'],
+                                                     session=get_session(),
+                                                     limiter=SETTINGS['limiter'],
+                                                     retries=SETTINGS['retries'],
+                                                     breaker=SETTINGS['breaker'],
+                                                     store=SETTINGS['store'],
+                                                     telemetry=SETTINGS['telemetry'],
+                                                     manifests=SETTINGS['manifests'],
+                                                     segments=SETTINGS['segments'],
+                                                     segment_threshold=SETTINGS['segment_threshold'],
+                                                     throughput=SETTINGS['throughput'],
+                                                     order=SETTINGS['order'],
+                                                     library=get_library(),
+                                                     sizes=listing_sizes(folders))
 
     print(INFO_COLOR + ensure_emoji_spacing('\n\n' + '-----------------------------------------------------------') + RESET)
     print(INFO_COLOR + ensure_emoji_spacing(f'💁\u200d♂️  Total Downloadable files: {total_audio}') + RESET)
     print(SUCCESS_COLOR + ensure_emoji_spacing(f'✅  Successful: {successful}') + RESET)
     print(ERROR_COLOR + ensure_emoji_spacing(f"❌  Couldn't download: {failed}") + RESET)
+    print(INFO_COLOR + ensure_emoji_spacing(f"🔀  Order: {ORDER_DESCRIPTIONS[SETTINGS['order']]}") + RESET)
+    print_report_summary()
     print(INFO_COLOR + ensure_emoji_spacing('-----------------------------------------------------------') + RESET)
 
 
+def describe_estimate(estimate: dict) -> str:
+    """' (~120.5 MB, about 2:10)' from the listing's size column, or '' when it shows none."""
+    if not estimate['sized']:
+        return ''
+    total = estimated_bytes(estimate)
+    approx = '~' if estimate['sized'] < estimate['files'] else ''
+    rate = SETTINGS['throughput'].rate() if SETTINGS['throughput'] is not None else None
+    eta = f", about {format_eta(total / rate)}" if rate else ''
+    return f" ({approx}{format_bytes(total)}{eta})"
+
+
+def print_plan(rows) -> bool:
+    """Print what a multi-collection job amounts to; False if it won't fit on the disk.
+
+    rows are (name, estimate or None, error or None) per collection.
+    """
+    rate = SETTINGS['throughput'].rate() if SETTINGS['throughput'] is not None else None
+    free = free_space(Path(SETTINGS['output_root']))
+    for line in format_plan(rows, rate, free):
+        print(INFO_COLOR + line + RESET)
+    total = sum(estimated_bytes(estimate) for _, estimate, _ in rows if estimate is not None)
+    if not enough_space(total, free):
+        print(ERROR_COLOR + f"Not enough free space under {SETTINGS['output_root']}: "
+                            f"~{format_bytes(total)} needed, {format_bytes(free)} free." + RESET)
+        return False
+    return True
+
+
+def print_report_summary():
+    """With --report, add the aggregate timings to the summary and start a fresh tally."""
+    telemetry = SETTINGS['telemetry']
+    if telemetry is None:
+        return
+    for line in format_summary(telemetry.write_summary()):
+        print(INFO_COLOR + line + RESET)
+    telemetry.reset()
+
+
+_catalog_index = None
+
+
+def get_catalog() -> CatalogIndex:
+    """The compiled index of every bundled catalog, loaded once per run."""
+    global _catalog_index
+    if _catalog_index is None:
+        _catalog_index = CatalogIndex.load(get_resource_path)
+    return _catalog_index
+
+
+_library = None
+
+
+def get_library():
+    """The song library, opened on first use so sqlite3 isn't loaded before the menu."""
+    global _library
+    if _library is None and SETTINGS['library'] is not None:
+        from utils.library import Library
+        _library = Library(SETTINGS['library'], SETTINGS['output_root'])
+    return _library
+
+
+def _catalog_key(data_file: str) -> Optional[str]:
+    """'./data/star-hits.json' (or its absolute path) -> 'data/star-hits.json'; None outside the project."""
+    path = os.path.normpath(data_file)
+    if os.path.isabs(path):
+        path = os.path.relpath(path, get_resource_path(''))
+    key = path.replace(os.sep, '/')
+    return None if key == '..' or key.startswith('../') else key
+
+
+def load_data_file(data_file: str) -> list:
+    """Load a JSON list of {id, href/path, name} from data/ (bundled or on disk)."""
+    key = _catalog_key(data_file)
+    if key in DATA_FILE_CATEGORIES:
+        catalog = get_catalog()
+        if key in catalog:
+            return catalog.items(key)
+    data_path = get_resource_path(data_file)
+    if not os.path.exists(data_path) and os.path.exists(data_file):
+        # batch mode may point at a catalog file outside the bundle
+        data_path = data_file
+    with open(data_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def category_for_data_file(data_file: str) -> str:
+    key = _catalog_key(data_file)
+    if key in DATA_FILE_CATEGORIES:
+        return DATA_FILE_CATEGORIES[key]
+    # unknown catalog: 'my-collection.json' -> 'My Collection'
+    stem = os.path.splitext(os.path.basename(data_file))[0]
+    return stem.replace('-', ' ').replace('_', ' ').title()
+
+
 def handle_data_category(data_file: str, category_name: str):
     """Load a JSON list of {id, href/path, name} and drive the same flow as Star Hits.
 
@@ -186,9 +380,7 @@ def handle_data_category(data_file: str, category_name: str):
     category_name: top-level category used for output path
     """
     try:
-        data_path = get_resource_path(data_file)
-        with open(data_path, 'r', encoding='utf-8') as f:
-            data_list = json.load(f)
+        data_list = load_data_file(data_file)
     except Exception as e:
         print(ERROR_COLOR + f"Failed to load {data_file}: {e}" + RESET)
         return
@@ -223,38 +415,111 @@ def handle_data_category(data_file: str, category_name: str):
         # ignore and continue with normal flow on unexpected errors
         pass
 
-    selected_items, missing = parse_star_selection(sel, data_list)
+    catalog = get_catalog()
+    key = _catalog_key(data_file)
+    by_id = catalog.by_id(key) if key in catalog else None
+    selected_items, missing = parse_star_selection(sel, data_list, by_id)
     for mid in missing:
         print(ERROR_COLOR + f"No item with id {mid}, skipping." + RESET)
     if not selected_items:
         print(ERROR_COLOR + f"No valid selections found, returning to menu." + RESET)
         return
 
-    for item in selected_items:
-        item_name = item.get('name')
-        # prefer 'href' then 'path'
-        index_url = item.get('href') or item.get('path')
-        if not index_url:
-            print(ERROR_COLOR + f"No URL for '{item_name}', skipping." + RESET)
-            continue
+    download_selection([(item, category_name) for item in selected_items])
 
-        user_path = prompt_choice(f"Enter The Path To Save Files inside '{category_name}/{item_name}': (DEFAULT: {item_name}) (skip/back/exit): ", item_name)
-        if user_path.lower() in ('skip', 's'):
-            print(INFO_COLOR + f"Skipped {item_name}" + RESET)
-            continue
-        if user_path.lower() in ('back', 'b'):
+
+def download_selection(selection):
+    """Download (item, category_name) pairs one after another, prompting for each save path.
+
+    With several items every collection is listed first (concurrently, a request per folder
+    and none per file) to show the total size, ETA and free space; the downloads then reuse
+    those listings. Nothing is downloaded before that plan is confirmed, so listing and
+    downloading don't overlap here (batch mode streams listings into its pool instead).
+    """
+    # prefer 'href' then 'path'
+    urls = [item.get('href') or item.get('path') for item, _ in selection]
+    futures = [None] * len(selection)
+    if len(selection) > 1:
+        print(INFO_COLOR + f"Listing {len(selection)} collections..." + RESET)
+        futures = resolve_all(resolve_collection, urls, SETTINGS['workers'])
+        rows = []
+        for (item, _), fut in zip(selection, futures):
+            if fut is None:
+                rows.append((item.get('name'), None, 'no URL'))
+                continue
+            try:
+                rows.append((item.get('name'), estimate_folders(fut.result()), None))
+            except Exception as e:
+                rows.append((item.get('name'), None, str(e)))
+        fits = print_plan(rows)
+        answer = prompt_choice(f"Start downloading? ({'Y/n' if fits else 'y/N'}): ", 'y' if fits else 'n')
+        if answer.lower() not in ('y', 'yes'):
+            return
+    for pos, (item, category_name) in enumerate(selection):
+        if not download_selected_item(item, urls[pos], category_name, futures[pos]):
             break
-        if user_path.lower() in ('exit', '0', 'quit'):
-            goodbye_and_exit()
 
-        dir_path = Path(f'output/{category_name}/{user_path}')
-        print(INFO_COLOR + '----------------------------------------------')
-        print(INFO_COLOR + f' 🎼   Files will be saved to: {dir_path}')
-        print(INFO_COLOR + '----------------------------------------------' + RESET)
-        dir_path.mkdir(parents=True, exist_ok=True)
 
-        # Reuse show_and_download which fetches index, filters links and downloads
-        show_and_download(index_url, category_name, user_path)
+def handle_search():
+    """Search collection names across every catalog and download the chosen results."""
+    clear_below_banner(BANNER, BANNER_COLOR, RESET)
+    query = prompt_choice("Search for a star, singer, music director or collection (back/exit): ")
+    if not query or query.lower() in ('back', 'b'):
+        return
+    if query.lower() in ('exit', '0', 'quit'):
+        goodbye_and_exit()
+
+    results = get_catalog().search(query)
+    if not results:
+        print(ERROR_COLOR + f"Nothing matches '{query}'." + RESET)
+        _ = prompt_choice('\nPress Enter to return to the main menu...')
+        return
+
+    print(MENU_COLOR + f"Results for '{query}':" + RESET)
+    numbered = []
+    for pos, (_, category, item) in enumerate(results, start=1):
+        print(f" {Fore.CYAN}{pos}{RESET}. {item.get('name')} {Style.DIM}({category}){RESET}")
+        numbered.append({'id': pos, 'item': item, 'category': category})
+    print(f" {Fore.CYAN}all{RESET}. Download ALL results")
+    print(f"")
+
+    sel = prompt_choice("Select number(s)/ranges (e.g. 1,3,5 or 2-4) or 'all' (back/exit): ")
+    if not sel or sel.lower() in ('back', 'b'):
+        return
+    if sel.lower() in ('exit', '0', 'quit'):
+        goodbye_and_exit()
+    chosen, missing = parse_star_selection(sel, numbered)
+    for mid in missing:
+        print(ERROR_COLOR + f"No result {mid}, skipping." + RESET)
+    if chosen:
+        download_selection([(entry['item'], entry['category']) for entry in chosen])
+
+
+def download_selected_item(item: dict, index_url: str, category_name: str, listed=None) -> bool:
+    """Ask where to save one selected item and download it; False means 'back' was chosen."""
+    item_name = item.get('name')
+    if not index_url:
+        print(ERROR_COLOR + f"No URL for '{item_name}', skipping." + RESET)
+        return True
+
+    user_path = prompt_choice(f"Enter The Path To Save Files inside '{category_name}/{item_name}': (DEFAULT: {item_name}) (skip/back/exit): ", item_name)
+    if user_path.lower() in ('skip', 's'):
+        print(INFO_COLOR + f"Skipped {item_name}" + RESET)
+        return True
+    if user_path.lower() in ('back', 'b'):
+        return False
+    if user_path.lower() in ('exit', '0', 'quit'):
+        goodbye_and_exit()
+
+    dir_path = Path(SETTINGS['output_root']) / category_name / user_path
+    print(INFO_COLOR + '----------------------------------------------')
+    print(INFO_COLOR + f' 🎼   Files will be saved to: {dir_path}')
+    print(INFO_COLOR + '----------------------------------------------' + RESET)
+    dir_path.mkdir(parents=True, exist_ok=True)
+
+    # Reuse show_and_download, which lists the collection unless the planner already did
+    show_and_download(index_url, category_name, user_path, listed)
+    return True
 
 
 def handle_old_songs():
@@ -321,10 +586,385 @@ def handle_ringtones_instrumentals():
         print(ERROR_COLOR + f"Invalid choice '{sel}', returning to menu." + RESET)
 
 
-def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Tamil MP3 Downloader')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'number of files to download in parallel (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help=f'max simultaneous connections per host (default: {DEFAULT_PER_HOST})')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL,
+                        help=f'seconds to reuse a cached "Index Of" listing before revalidating (default: {DEFAULT_TTL})')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help=f'max listings kept in the on-disk cache (default: {DEFAULT_MAX_ENTRIES})')
+    parser.add_argument('--no-cache', action='store_true', help='always fetch listings from the server')
+    parser.add_argument('--parser', choices=PARSER_BACKENDS, default='fast',
+                        help='listing parser: streaming "fast" extractor or the BeautifulSoup fallback (default: fast)')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='also download sub-folders of each listing, mirroring their structure')
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH,
+                        help=f'how many sub-folder levels --recursive follows (default: {DEFAULT_MAX_DEPTH})')
+    parser.add_argument('--limit', type=parse_rate, default=0, metavar='RATE',
+                        help='total bandwidth cap shared fairly by all downloads, e.g. 500K or 2M (default: unlimited)')
+    parser.add_argument('--host-limit', type=parse_rate, default=0, metavar='RATE',
+                        help='bandwidth cap per host (default: unlimited)')
+    parser.add_argument('--limit-schedule', type=parse_schedule, default=None, metavar='WINDOWS',
+                        help='time-of-day caps overriding --limit, e.g. "09:00-18:00=1M,18:00-23:00=4M"')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'retries for resets, timeouts and 5xx errors, with jittered backoff (default: {DEFAULT_RETRIES})')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='store every file separately instead of linking songs already downloaded elsewhere')
+    parser.add_argument('--segments', type=int, default=1, metavar='N',
+                        help='fetch large files over up to N connections when the server supports ranges (default: 1, off)')
+    parser.add_argument('--segment-threshold', type=parse_rate, default=DEFAULT_SEGMENT_THRESHOLD, metavar='SIZE',
+                        help='only split files at least this large, e.g. 16M (default: 32M)')
+    parser.add_argument('--no-manifest', action='store_true',
+                        help="don't write a .manifest.json (size, SHA-256, format check) into each download folder")
+    parser.add_argument('--no-library', action='store_true',
+                        help="don't index downloaded songs (title, artist, album, duration, bitrate) in "
+                             "<output-root>/.cache/library.sqlite")
+    parser.add_argument('--find', metavar='QUERY',
+                        help="search the downloaded songs and exit, e.g. --find 'ilaiyaraaja raja' or "
+                             "--find artist:yuvan")
+    parser.add_argument('--library-import', action='store_true',
+                        help='index songs already recorded in the download folders\' manifests (e.g. from '
+                             'before the library existed) and exit')
+    parser.add_argument('--order', choices=ORDER_POLICIES, default='page',
+                        help='order files are downloaded in: listing order (default), smallest or largest first '
+                             '(by the listing\'s sizes), or interleaved across hosts and folders')
+    parser.add_argument('--sync', action='store_true',
+                        help='only fetch files that are new or changed since the last run (by the listing\'s date/size columns)')
+    parser.add_argument('--prune', action='store_true',
+                        help='with --sync, delete downloaded files that were removed from the listing')
+    parser.add_argument('--report', metavar='FILE',
+                        help='append per-file timings (DNS, connect, first byte, speed, retries) to FILE as JSON lines')
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE',
+                        help='run under cProfile and save the stats (default: <output-root>/.cache/profile.pstats)')
+    parser.add_argument('-o', '--output-root', default='output',
+                        help='folder that receives <Category>/<Name>/ downloads (default: output)')
+    parser.add_argument('--batch', nargs='+', metavar='FILE[:SELECTION]',
+                        help='download without prompts, e.g. data/star-hits.json:all data/singer-hits.json:1-5,8')
+    parser.add_argument('--queue', metavar='FILE',
+                        help='with --batch, share the work with other processes/machines started with the same '
+                             'queue file (SQLite, e.g. on the shared output drive)')
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE, metavar='SECONDS',
+                        help=f'with --queue, how long a crashed worker\'s jobs stay reserved (default: {DEFAULT_LEASE:.0f})')
+    parser.add_argument('--serve', nargs='?', type=int, const=DEFAULT_PORT, metavar='PORT',
+                        help=f'run as a service taking jobs over a local HTTP API (default port {DEFAULT_PORT}); '
+                             'see utils/daemon.py')
+    parser.add_argument('--plan', action='store_true',
+                        help='with --batch, only list the selection and print its size, ETA and free space')
+    args = parser.parse_args(argv)
+    if args.sync and args.no_manifest:
+        parser.error('--sync keeps its state in the .manifest.json files; drop --no-manifest')
+    if args.serve is not None and (args.batch or args.plan):
+        parser.error('--serve takes its jobs over HTTP; drop --batch/--plan')
+    if args.queue and not args.batch:
+        parser.error('--queue only works together with --batch')
+    if args.plan and not args.batch:
+        parser.error('--plan only works together with --batch')
+    if args.prune and not args.sync:
+        parser.error('--prune only works together with --sync')
+    if (args.find is not None or args.library_import) and (args.no_library or args.no_manifest):
+        parser.error('--find/--library-import use the library, which is built from the manifests; '
+                     'drop --no-library/--no-manifest')
+    return args
+
+
+def run_plan(specs) -> int:
+    """--batch --plan: list the selection and print its size and ETA; nothing is downloaded.
+
+    Exits with 1 when the estimate doesn't fit in the free space under the output folder.
+    """
+    plan, problems = build_plan(specs, load_data_file, category_for_data_file, Path(SETTINGS['output_root']))
+    for msg in problems:
+        print(ERROR_COLOR + msg + RESET)
+    if not plan:
+        print(ERROR_COLOR + 'Nothing to download.' + RESET)
+        return 2
+    print(INFO_COLOR + f"Listing {len(plan)} collections..." + RESET)
+    problems = estimate_plan(plan, workers=SETTINGS['workers'], session=get_session(),
+                             cache=SETTINGS['listing_cache'], parser=SETTINGS['parser'],
+                             recursive=SETTINGS['recursive'], max_depth=SETTINGS['max_depth'])
+    rows = [(f"{entry['category']}/{entry['name']}", entry.get('estimate'), entry.get('error')) for entry in plan]
+    return 0 if print_plan(rows) and not problems else 1
+
+
+def run_queue(specs, queue_path: str, lease: float = DEFAULT_LEASE) -> int:
+    """--batch with --queue: mirror the selection together with every other worker on the queue.
+
+    Each worker adds the selection's collections (workers started with the same command add
+    nothing new), then lists collections and downloads files as it claims them, until the
+    queue is drained. Start one per machine, or several on one machine, with the same
+    queue file and output root.
+    """
+    from utils.workqueue import WorkQueue
+
+    plan, problems = build_plan(specs, load_data_file, category_for_data_file, Path(SETTINGS['output_root']))
+    for msg in problems:
+        print(ERROR_COLOR + msg + RESET)
+    queue = WorkQueue(Path(queue_path), lease=lease)
+    added = enqueue_plan(queue, plan)
+    print(INFO_COLOR + f"Worker {queue.owner}: {added} new collections queued, joining {queue_path}" + RESET)
+
+    def on_finish(file_url, out_path, ok, error):
+        queue.finish(str(out_path), ok, None if ok else str(error))
+
+    queue.start_heartbeat()
+    try:
+        with DownloadPool(SETTINGS['workers'], SETTINGS['per_host'], get_session(),
+                          limiter=SETTINGS['limiter'], retries=SETTINGS['retries'],
+                          breaker=SETTINGS['breaker'], store=SETTINGS['store'],
+                          telemetry=SETTINGS['telemetry'], manifests=SETTINGS['manifests'],
+                          segments=SETTINGS['segments'], segment_threshold=SETTINGS['segment_threshold'],
+                          throughput=SETTINGS['throughput'], order=SETTINGS['order'],
+                          on_finish=on_finish, library=get_library()) as pool:
+            try:
+                listed = work_queue(queue, pool, SETTINGS['workers'] * 2,
+                                    log=lambda msg: pool.log(ERROR_COLOR + msg + RESET),
+                                    session=get_session(), cache=SETTINGS['listing_cache'],
+                                    parser=SETTINGS['parser'], recursive=SETTINGS['recursive'],
+                                    max_depth=SETTINGS['max_depth'],
+                                    sync=SETTINGS['manifests'] if SETTINGS['sync'] else None,
+                                    prune=SETTINGS['prune'], store=SETTINGS['store'], library=get_library())
+            except BaseException:
+                # give back what this worker holds so the others needn't wait for the lease
+                pool.cancel()
+                queue.release()
+                raise
+            total_audio, successful, failed = pool.wait()
+        counts = queue.counts()
+        failures = queue.failures()
+    finally:
+        queue.close()
+
+    print(INFO_COLOR + '-----------------------------------------------------------' + RESET)
+    print(INFO_COLOR + f"This worker: listed {listed} collections, downloaded {successful} of {total_audio} files"
+          + (f", {failed} failed" if failed else '') + RESET)
+    print(INFO_COLOR + "Queue: " + ', '.join(f"{n} {state}" for state, n in sorted(counts.items())) + RESET)
+    for key, error in failures:
+        print(ERROR_COLOR + f"  {key}: {error}" + RESET)
+    print(INFO_COLOR + f"Order: {ORDER_DESCRIPTIONS[SETTINGS['order']]}" + RESET)
+    print_report_summary()
+    print(INFO_COLOR + '-----------------------------------------------------------' + RESET)
+    return 1 if counts.get('failed') else 0
+
+
+def mirror_plan(plan, sync: bool = None, prune: bool = None, order: str = None, on_pool=None):
+    """List and download every plan entry through one pool; returns (total, ok, failed, problems).
+
+    sync/prune/order default to the command line's; on_pool(pool) is called once the pool
+    exists (the daemon uses it to follow and cancel a job).
+    """
+    sync = SETTINGS['sync'] if sync is None else sync
+    prune = SETTINGS['prune'] if prune is None else prune
+    order = order or SETTINGS['order']
+    # listing and downloading overlap: each collection's files are queued as soon as its
+    # index is parsed, so the download workers start after the first listing, not the last
+    with DownloadPool(SETTINGS['workers'], SETTINGS['per_host'], get_session(),
+                      limiter=SETTINGS['limiter'], retries=SETTINGS['retries'],
+                      breaker=SETTINGS['breaker'], store=SETTINGS['store'],
+                      telemetry=SETTINGS['telemetry'], manifests=SETTINGS['manifests'],
+                      segments=SETTINGS['segments'], segment_threshold=SETTINGS['segment_threshold'],
+                      throughput=SETTINGS['throughput'], order=order, library=get_library()) as pool:
+        if on_pool is not None:
+            on_pool(pool)
+        _, problems = resolve_plan(plan, workers=SETTINGS['workers'], on_items=pool.add,
+                                   session=get_session(), cache=SETTINGS['listing_cache'],
+                                   parser=SETTINGS['parser'], recursive=SETTINGS['recursive'],
+                                   max_depth=SETTINGS['max_depth'],
+                                   sync=SETTINGS['manifests'] if sync else None,
+                                   prune=prune, store=SETTINGS['store'], library=get_library(),
+                                   log=lambda msg: pool.log(ERROR_COLOR + msg + RESET))
+        for msg in problems:
+            pool.log(ERROR_COLOR + msg + RESET)
+        total_audio, successful, failed = pool.wait()
+    return total_audio, successful, failed, problems
+
+
+def run_daemon(port: int) -> None:
+    """--serve: take --batch style jobs over HTTP, keeping sessions, listings and catalogs warm."""
+    from utils.daemon import JobDaemon, JobStore, serve
+
+    def validate(request):
+        for spec in request['specs']:
+            data_file = parse_batch_spec(spec)[0]
+            # any other path would let a client make the daemon read arbitrary JSON files
+            if _catalog_key(data_file) not in DATA_FILE_CATEGORIES:
+                return f"'{data_file}' is not a bundled catalog (use one of {', '.join(sorted(DATA_FILE_CATEGORIES))})"
+        if request.get('order', 'page') not in ORDER_POLICIES:
+            return f"'order' must be one of {', '.join(ORDER_POLICIES)}"
+        if request.get('sync') and SETTINGS['manifests'] is None:
+            return "'sync' needs the manifests, which this daemon was started without (--no-manifest)"
+        if request.get('prune') and not request.get('sync'):
+            return "'prune' only works together with 'sync'"
+        return None
+
+    def run_job(request, on_pool):
+        pools = []
+
+        def attach(pool):
+            pools.append(pool)
+            on_pool(pool)
+
+        plan, problems = build_plan(request['specs'], load_data_file, category_for_data_file,
+                                    Path(SETTINGS['output_root']))
+        if not plan:
+            raise ValueError('nothing to download' + (': ' + '; '.join(problems) if problems else ''))
+        total, successful, failed, list_problems = mirror_plan(plan, bool(request.get('sync')),
+                                                               bool(request.get('prune')),
+                                                               request.get('order'), attach)
+        cancelled = pools[0].cancelled if pools else 0
+        return {'collections': len(plan), 'files': total, 'done': successful, 'failed': failed - cancelled,
+                'cancelled': cancelled,
+                'problems': problems + list_problems,
+                'sync': {f"{e['category']}/{e['name']}": e['sync'] for e in plan if 'sync' in e}}
+
+    def info():
+        return {'output_root': SETTINGS['output_root'], 'workers': SETTINGS['workers'],
+                'per_host': SETTINGS['per_host'], 'catalog_loaded': _catalog_index is not None,
+                'limits': limits({})}
+
+    def limits(changes):
+        limiter = SETTINGS['limiter']
+        # parse both first so a bad value changes nothing
+        rates = {key: parse_rate(str(value)) for key, value in changes.items()}
+        if 'rate' in rates:
+            limiter.set_rate(rates['rate'])
+        if 'host' in rates:
+            limiter.set_host_rate(rates['host'])
+        return {'rate': format_rate(limiter.rate), 'host': format_rate(limiter.per_host_rate),
+                'scheduled': bool(limiter.schedule)}
+
+    # warm up once: the catalog index and the listing cache stay loaded for every job
+    get_catalog()
+    store = JobStore(Path(SETTINGS['output_root']) / '.cache' / 'jobs.sqlite')
+    serve(JobDaemon(store, run_job, validate, info, limits), port)
+
+
+def run_batch(specs) -> int:
+    """Non-interactive mirror of catalog selections; returns a process exit code.
+
+    Every selected collection is listed concurrently and all their files go through one
+    download pool, which starts as soon as the first listing is in.
+    """
+    output_root = Path(SETTINGS['output_root'])
+    plan, problems = build_plan(specs, load_data_file, category_for_data_file, output_root)
+    for msg in problems:
+        print(ERROR_COLOR + msg + RESET)
+    if not plan:
+        print(ERROR_COLOR + 'Nothing to download.' + RESET)
+        return 2
+
+    print(INFO_COLOR + f"Listing {len(plan)} collections..." + RESET)
+    total_audio, successful, failed, problems = mirror_plan(plan)
+
+    for entry in plan:
+        if 'sync' in entry:
+            print(f" {entry['audio_count']:>5}  {entry['category']}/{entry['name']} ({format_sync_counts(entry['sync'])})")
+        elif 'audio_count' in entry:
+            print(f" {entry['audio_count']:>5}  {entry['category']}/{entry['name']}")
+    print(INFO_COLOR + '-----------------------------------------------------------' + RESET)
+    print(INFO_COLOR + f"Collections: {len(plan)} ({len(problems)} could not be listed)" + RESET)
+    print(INFO_COLOR + f"Total Downloadable files: {total_audio}" + RESET)
+    print(SUCCESS_COLOR + f"Successful: {successful}" + RESET)
+    print(ERROR_COLOR + f"Couldn't download: {failed}" + RESET)
+    print(INFO_COLOR + f"Order: {ORDER_DESCRIPTIONS[SETTINGS['order']]}" + RESET)
+    print_report_summary()
+    print(INFO_COLOR + '-----------------------------------------------------------' + RESET)
+    return 1 if failed or problems else 0
+
+
+def run_library(query: str = None, import_manifests: bool = False) -> int:
+    """--library-import / --find: index the manifests already on disk and/or search the library."""
+    from utils.library import format_track
+
+    library = get_library()
+    if import_manifests:
+        count = library.import_manifests()
+        print(INFO_COLOR + f"Indexed {count} songs from the manifests under {SETTINGS['output_root']}" + RESET)
+    if query is not None:
+        tracks = library.search(query)
+        for track in tracks:
+            print(format_track(track))
+        if not tracks:
+            print(ERROR_COLOR + f"No songs match '{query}' ({library.count()} in the library)" + RESET)
+            return 1
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile is not None:
+        out = args.profile or Path(args.output_root) / '.cache' / 'profile.pstats'
+        return profile_call(lambda: run(args), out)
+    return run(args)
+
+
+def run(args):
+    SETTINGS['workers'] = max(1, args.workers)
+    SETTINGS['per_host'] = max(1, args.per_host)
+    SETTINGS['parser'] = args.parser
+    SETTINGS['recursive'] = args.recursive
+    SETTINGS['max_depth'] = max(0, args.max_depth)
+    SETTINGS['output_root'] = args.output_root
+    SETTINGS['retries'] = max(0, args.retries)
+    SETTINGS['segments'] = max(1, args.segments)
+    SETTINGS['segment_threshold'] = int(args.segment_threshold)
+    SETTINGS['sync'] = args.sync
+    SETTINGS['order'] = args.order
+    SETTINGS['prune'] = args.prune
+    SETTINGS['breaker'] = CircuitBreaker()
+    SETTINGS['limiter'] = RateLimiter(args.limit, args.host_limit, args.limit_schedule)
+    if SETTINGS['limiter'].enabled:
+        print(INFO_COLOR + f"Bandwidth limit: {format_rate(SETTINGS['limiter'].rate)}"
+              + (f", {format_rate(args.host_limit)} per host" if args.host_limit else '') + RESET)
+    if args.report:
+        SETTINGS['telemetry'] = Telemetry(args.report, args.order)
+    # one keep-alive pool for the whole menu session: index pages and files share it
+    # (segmented downloads may use every per-host slot, so the pool must hold that many too)
+    connections = max(SETTINGS['workers'], SETTINGS['per_host'] if SETTINGS['segments'] > 1 else 0)
+    configure_session(connections + 1, instrument_session if args.report else None)
+    if not args.no_cache:
+        SETTINGS['listing_cache'] = ListingCache(Path(args.output_root) / '.cache' / 'listings.json',
+                                                 ttl=args.cache_ttl, max_entries=args.cache_size)
+    if not args.no_dedup:
+        SETTINGS['store'] = ContentStore(Path(args.output_root) / '.cache' / 'content-index.json')
+    if not args.no_manifest:
+        SETTINGS['manifests'] = Manifests(args.output_root)
+        if not args.no_library:
+            # rows come from the manifest entries, tags read while each file streamed in
+            SETTINGS['library'] = Path(args.output_root) / '.cache' / 'library.sqlite'
+    SETTINGS['throughput'] = ThroughputLog(Path(args.output_root) / '.cache' / 'throughput.json')
+
+    if args.find is not None or args.library_import:
+        code = run_library(args.find, args.library_import)
+        get_library().close()
+        sys.exit(code)
+
+    if args.serve is not None:
+        try:
+            run_daemon(args.serve)
+        finally:
+            end_session()
+        return 0
+
+    if args.batch:
+        try:
+            if args.plan:
+                code = run_plan(args.batch)
+            elif args.queue:
+                code = run_queue(args.batch, args.queue, args.lease)
+            else:
+                code = run_batch(args.batch)
+        finally:
+            end_session()
+        sys.exit(code)
+
     while True:
         # Show banner and menu, get a valid choice
         print_banner_and_menu()
+        # the menu is up: load the networking stack while the user picks
+        preload_in_background()
         choice = prompt_choice('Enter choice (1-7) [default 1]: ', '1').lower()
         if choice in ('0', 'exit', 'quit'):
             goodbye_and_exit()
@@ -363,6 +1003,10 @@ def main():
             _ = prompt_choice('\nPress Enter to return to the main menu...')
             continue
 
+        if choice == '7':
+            handle_search()
+            continue
+
         # Generic flow for other categories
         index_url = prompt_choice("Enter 'Index Of' URL (back/exit): ")
         if not index_url:
@@ -384,7 +1028,7 @@ def main():
         if user_path.lower() in ('exit', '0', 'quit'):
             goodbye_and_exit()
 
-        dir_path = Path(f'output/{category_name}/{user_path}')
+        dir_path = Path(SETTINGS['output_root']) / category_name / user_path
         print(INFO_COLOR + str(dir_path) + RESET)
         dir_path.mkdir(parents=True, exist_ok=True)
 
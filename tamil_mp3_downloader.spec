@@ -2,13 +2,15 @@
 """
 Compatibility-focused PyInstaller spec for tamil-mp3-downloader
 This spec does not rely on Tree or other helpers that may move between PyInstaller versions.
-It walks the `data/` and `screenshots/` folders and creates a list of (src, dest) file tuples.
+It walks the `data/` folder and creates a list of (src, dest) file tuples.
 Build with:
     pyinstaller tamil_mp3_downloader.spec
+Set TAMIL_MP3_ONEDIR=1 to build a folder (dist/<name>/) instead of a single file: it starts
+faster because nothing has to be unpacked to a temp folder on each launch.
 """
 
 import os
-from PyInstaller.building.build_main import Analysis, PYZ, EXE
+from PyInstaller.building.build_main import Analysis, PYZ, EXE, COLLECT
 
 block_cipher = None
 
@@ -41,16 +43,43 @@ def collect_folder(src_folder, dest_folder):
             out.append((src_path, dest_path))
     return out
 
+# compile the catalogs into data/catalog.index.json so the bundle ships a current index
+try:
+    import sys
+    sys.path.insert(0, os.path.abspath('.'))
+    from utils.catalog import CATALOG_INDEX, build_index, write_index
+    write_index(build_index(lambda rel: rel.replace('/', os.sep)), CATALOG_INDEX.replace('/', os.sep))
+except Exception as e:
+    print(f"WARNING: could not build the catalog index ({e}); the app will compile it at startup")
+
 # collect data files
 datas = []
 datas += collect_folder('data', 'data')
-datas += collect_folder('screenshots', 'screenshots')
+# screenshots are only used by the README; a onefile EXE would unpack them on every launch
+
+# stdlib and third-party modules the app never imports; leaving them out shrinks what the
+# onefile bootloader has to extract at startup. bs4 only ever uses 'html.parser'.
+excludes = [
+    'tkinter',
+    'unittest',
+    'pydoc',
+    'doctest',
+    'pdb',
+    'lib2to3',
+    'xmlrpc',
+    'distutils',
+    'setuptools',
+    'pip',
+    'lxml',
+    'html5lib',
+]
+
+ONEDIR = os.environ.get('TAMIL_MP3_ONEDIR') == '1'
 
 hiddenimports = [
     'bs4',
     'requests',
     'colorama',
-    'clint',
 ]
 
 a = Analysis(
@@ -61,7 +90,7 @@ a = Analysis(
     hiddenimports=hiddenimports,
     hookspath=[],
     runtime_hooks=[],
-    excludes=[],
+    excludes=excludes,
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -69,16 +98,31 @@ a = Analysis(
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    name=EXE_NAME,
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    console=True,
-)
+if ONEDIR:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name=EXE_NAME,
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        console=True,
+    )
+    coll = COLLECT(exe, a.binaries, a.zipfiles, a.datas, strip=False, upx=True, name=EXE_NAME)
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        name=EXE_NAME,
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        console=True,
+    )
@@ -0,0 +1,211 @@
+"""Offline end-to-end benchmark against the local stand-in server (tools/index_server.py).
+
+Starts the server in a child process (its CPU is not counted), then runs each scenario in a
+fresh interpreter so peak RSS belongs to that scenario alone:
+
+    parse              collect_filtered_hrefs (BeautifulSoup) and the fast extractor on one
+                       large listing page
+    download_links     utils.downloader.download_links for one collection
+    show_and_download  main.show_and_download: listing + download, as the menu runs it
+
+Reports files/s, MB/s, CPU seconds and peak RSS. --save writes the results as JSON and
+--baseline compares a run with saved results, so a change can be checked before merging.
+
+Usage:
+    python tools/bench_offline.py [--files 200 --size 512K --workers 4]
+                                  [--latency 0.02 --throttle 4M --error-rate 0.01]
+                                  [--scenarios parse,download_links] [--save base.json]
+                                  [--baseline base.json [--fail-over 10]]
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from index_server import add_config_args, config_from_args, serve  # noqa: E402
+
+SCENARIOS = ('parse', 'download_links', 'show_and_download')
+# higher is better for these; everything else (time, CPU, memory) lower is better
+_HIGHER_IS_BETTER = ('files_per_s', 'mb_per_s', 'entries_per_s')
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _tree_size(path: str):
+    files = total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            if name.endswith('.mp3'):
+                files += 1
+                total += os.path.getsize(os.path.join(root, name))
+    return files, total
+
+
+def _scenario_parse(base_url: str, opts: dict) -> dict:
+    from bs4 import BeautifulSoup
+    from utils.helper import collect_filtered_hrefs, extract_listing
+    from utils.session import get_session
+
+    page = get_session().get(base_url + 'Collection%2001/', timeout=30).content
+    runs = opts['parse_runs']
+    start = time.perf_counter()
+    for _ in range(runs):
+        soup_hrefs = collect_filtered_hrefs(BeautifulSoup(page, 'html.parser'))
+    bs4_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(runs):
+        fast_hrefs = extract_listing([page])[0]
+    fast_s = time.perf_counter() - start
+    if [h for h in soup_hrefs if not h.endswith('/')] != fast_hrefs:
+        raise RuntimeError('parsers disagree')
+    return {
+        'entries': len(fast_hrefs),
+        'page_kb': round(len(page) / 1024, 1),
+        'bs4_ms': round(bs4_s / runs * 1000, 2),
+        'fast_ms': round(fast_s / runs * 1000, 2),
+        'entries_per_s': round(len(fast_hrefs) * runs / (bs4_s + fast_s), 1),
+    }
+
+
+def _scenario_download_links(base_url: str, opts: dict) -> dict:
+    from utils.downloader import download_links
+    from utils.listing import fetch_listing
+
+    url = base_url + 'Collection%2001/'
+    with tempfile.TemporaryDirectory() as out:
+        hrefs = fetch_listing(url)
+        with contextlib.redirect_stdout(io.StringIO()):
+            total, ok, failed = download_links(hrefs, url, out, workers=opts['workers'])
+        files, size = _tree_size(out)
+    return {'files': files, 'bytes': size, 'failed': failed}
+
+
+def _scenario_show_and_download(base_url: str, opts: dict) -> dict:
+    import main
+
+    # the menu clears the terminal through os.system, which stdout redirection can't catch
+    main.clear_below_banner = lambda *args, **kwargs: None
+    main.SETTINGS['workers'] = opts['workers']
+    main.configure_session(opts['workers'] + 1)
+    with tempfile.TemporaryDirectory() as out:
+        main.SETTINGS['output_root'] = out
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.show_and_download(base_url + 'Collection%2001/', 'Bench', 'Collection 01')
+        files, size = _tree_size(out)
+    return {'files': files, 'bytes': size}
+
+
+def _run_scenario(name: str, base_url: str, opts: dict, results) -> None:
+    """Child-process entry point: run one scenario and put its metrics on `results`."""
+    try:
+        cpu0 = time.process_time()
+        wall0 = time.perf_counter()
+        metrics = globals()['_scenario_' + name](base_url, opts)
+        wall = time.perf_counter() - wall0
+        metrics['wall_s'] = round(wall, 3)
+        metrics['cpu_s'] = round(time.process_time() - cpu0, 3)
+        metrics['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+        if 'bytes' in metrics:
+            metrics['files_per_s'] = round(metrics['files'] / wall, 2)
+            metrics['mb_per_s'] = round(metrics['bytes'] / wall / (1024 * 1024), 2)
+        results.put((name, metrics))
+    except Exception as e:
+        results.put((name, {'error': f'{type(e).__name__}: {e}'}))
+
+
+def compare(current: dict, baseline: dict, fail_over: float) -> bool:
+    """Print per-metric changes against a baseline; returns False if any got worse than fail_over %."""
+    ok = True
+    print('\nChange vs baseline:')
+    for name, metrics in current.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'error' in metrics:
+            continue
+        for key in ('files_per_s', 'mb_per_s', 'entries_per_s', 'cpu_s', 'peak_rss_mb', 'fast_ms', 'bs4_ms'):
+            if key not in metrics or not base.get(key):
+                continue
+            change = (metrics[key] - base[key]) / base[key] * 100
+            worse = -change if key in _HIGHER_IS_BETTER else change
+            flag = ''
+            if fail_over and worse > fail_over:
+                flag = '  <-- regression'
+                ok = False
+            print(f"  {name:<18} {key:<14} {base[key]:>10} -> {metrics[key]:>10} ({change:+.1f}%){flag}")
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Offline benchmark against a local "Index Of" server')
+    add_config_args(parser)
+    parser.set_defaults(collections=1, files=200, size=512 * 1024)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma separated, any of: {", ".join(SCENARIOS)}')
+    parser.add_argument('--parse-runs', type=int, default=20)
+    parser.add_argument('--save', help='write the results (and the settings used) to this JSON file')
+    parser.add_argument('--baseline', help='compare with results saved by --save')
+    parser.add_argument('--fail-over', type=float, default=0,
+                        help='exit 1 if a metric is more than this many percent worse than the baseline')
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    for n in names:
+        if n not in SCENARIOS:
+            parser.error(f'unknown scenario {n}')
+
+    ctx = multiprocessing.get_context('spawn')
+    port_queue = ctx.Queue()
+    server = ctx.Process(target=serve, args=(config_from_args(args), 0, port_queue), daemon=True)
+    server.start()
+    base_url = f'http://127.0.0.1:{port_queue.get(timeout=30)}/'
+    opts = {'workers': max(1, args.workers), 'parse_runs': max(1, args.parse_runs)}
+
+    results = {}
+    try:
+        for name in names:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_scenario, args=(name, base_url, opts, queue))
+            proc.start()
+            _, metrics = queue.get()
+            proc.join()
+            results[name] = metrics
+            shown = ', '.join(f'{k}={v}' for k, v in metrics.items())
+            print(f"{name:<18} {shown}")
+    finally:
+        server.terminate()
+
+    settings = {k: v for k, v in vars(args).items() if k not in ('save', 'baseline', 'fail_over')}
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'settings': settings,
+                       'results': results}, f, indent=2)
+    code = 1 if any('error' in m for m in results.values()) else 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != settings:
+            print('WARNING: baseline was recorded with different settings')
+        if not compare(results, baseline, args.fail_over):
+            code = 1
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Benchmark the listing parser backends on large synthetic "Index Of" pages.
+
+Generates Apache- and nginx-style autoindex pages with N entries, checks that every
+backend returns the same filtered hrefs, then reports parse time and peak traced memory.
+
+Usage:
+    python tools/bench_parse.py [--entries 5000] [--runs 5]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.helper import parse_listing_hrefs, PARSER_BACKENDS  # noqa: E402
+
+
+def apache_page(entries: int) -> bytes:
+    rows = [
+        '<tr><th valign="top"><img src="/icons/blank.gif" alt="[ICO]"></th>'
+        '<th><a href="?C=N;O=D">Name</a></th><th><a href="?C=M;O=A">Last modified</a></th>'
+        '<th><a href="?C=S;O=A">Size</a></th></tr>',
+        '<tr><td valign="top"><img src="/icons/back.gif" alt="[PARENTDIR]"></td>'
+        '<td><a href="/songs2/">Parent Directory</a></td><td>&nbsp;</td><td align="right">  - </td></tr>',
+    ]
+    for i in range(entries):
+        name = f"{i:05d} - Kadhal Rojave &amp; Friends (From Roja).mp3" if i % 3 else f"Folder {i}/"
+        href = quote(name.replace('&amp;', '&'))
+        rows.append(
+            f'<tr><td valign="top"><img src="/icons/sound2.gif" alt="[SND]"></td>'
+            f'<td><a href="{href}">{name}</a></td><td align="right">2021-03-04 10:{i % 60:02d}  </td>'
+            f'<td align="right">{(i % 9) + 1}.{i % 10}M</td></tr>'
+        )
+    return ('<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN"><html><head>'
+            '<title>Index of /songs2/Star Hits</title></head><body><h1>Index of /songs2/Star Hits</h1>'
+            '<table>' + '\n'.join(rows) + '</table></body></html>').encode('utf-8')
+
+
+def nginx_page(entries: int) -> bytes:
+    lines = ['<a href="../">../</a>']
+    for i in range(entries):
+        name = f"{i:05d}_Ringtone.mp3"
+        lines.append(f'<a href="{name}">{name}</a>{" " * 20}04-Mar-2021 10:{i % 60:02d}{" " * 12}{i * 37}')
+    return ('<html><head><title>Index of /rt/</title></head><body><h1>Index of /rt/</h1><hr><pre>'
+            + '\n'.join(lines) + '</pre><hr></body></html>').encode('utf-8')
+
+
+def measure(backend, content, runs):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        parse_listing_hrefs(content, backend)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    parse_listing_hrefs(content, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for style, page in (('apache', apache_page(args.entries)), ('nginx', nginx_page(args.entries))):
+        results = {b: parse_listing_hrefs(page, b) for b in PARSER_BACKENDS}
+        reference = results['bs4']
+        for backend, hrefs in results.items():
+            if hrefs != reference:
+                raise SystemExit(f"{style}: backend '{backend}' differs from bs4 ({len(hrefs)} vs {len(reference)} hrefs)")
+        print(f"{style}: {args.entries} entries, {len(page) / 1024:.0f} KiB, {len(reference)} hrefs (identical)")
+        for backend in PARSER_BACKENDS:
+            secs, peak = measure(backend, page, args.runs)
+            print(f"  {backend:<5} {secs * 1000:9.1f} ms  peak {peak / (1024 * 1024):7.2f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Measure how long the app takes to start: import time of main.py and time until the menu prompt.
+
+Runs `python -X importtime -c "import main"` a few times and reports the median total plus the
+modules that cost the most, then launches the app (or a built EXE with --exe) and times how long
+it takes to print the "Enter choice" prompt. With --json the numbers are appended to a file, one
+record per line, so they can be compared across releases.
+
+Usage:
+    python tools/bench_startup.py [--runs 5] [--top 15] [--exe dist/tamil-mp3-downloader-vX.exe]
+                                  [--json bench/startup.jsonl]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MENU_PROMPT = b'Enter choice'
+# modules whose presence at the menu means a deferred import has crept back in
+HEAVY_MODULES = ('requests', 'urllib3', 'bs4', 'soupsieve', 'clint', 'charset_normalizer', 'idna',
+                 'sqlite3', 'http.server', 'ssl')
+
+
+def import_times(runs: int):
+    """Return (median total ms, {module: (self_us, cumulative_us)} from the median run)."""
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                              cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise SystemExit(proc.stderr)
+        modules = {}
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        samples.append((modules.get('main', (0, 0))[1] / 1000.0, modules))
+    samples.sort(key=lambda s: s[0])
+    return samples[len(samples) // 2]
+
+
+def loaded_at_menu():
+    """Heavy modules already imported once main.py is loaded (should be none)."""
+    code = 'import sys, main; print(",".join(m for m in %r if m in sys.modules))' % (HEAVY_MODULES,)
+    proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    return [m for m in proc.stdout.strip().split(',') if m]
+
+
+def time_to_menu(cmd, runs: int) -> float:
+    """Median ms from process start until the main menu prompt is printed."""
+    env = dict(os.environ, PYTHONUNBUFFERED='1', TERM='dumb')
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        seen = b''
+        while MENU_PROMPT not in seen:
+            chunk = proc.stdout.read1(4096)
+            if not chunk:
+                break
+            seen = seen[-64:] + chunk
+        elapsed = (time.perf_counter() - start) * 1000
+        try:
+            proc.communicate(b'0\n', timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        if MENU_PROMPT not in seen:
+            raise SystemExit('the menu prompt never appeared')
+        samples.append(elapsed)
+    return statistics.median(samples)
+
+
+def read_version() -> str:
+    try:
+        with open(os.path.join(ROOT, 'VERSION'), 'r', encoding='utf-8') as f:
+            return f.read().strip() or '0.0.0'
+    except OSError:
+        return '0.0.0'
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Startup benchmark for main.py')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='how many of the slowest imports to list')
+    parser.add_argument('--exe', help='time a built executable instead of "python main.py"')
+    parser.add_argument('--json', help='append the results to this JSON-lines file')
+    args = parser.parse_args(argv)
+
+    total_ms, modules = import_times(args.runs)
+    print(f"import main: {total_ms:.1f} ms (median of {args.runs})")
+    print(f"{'self ms':>9} {'cumul ms':>9}  module")
+    slowest = sorted(modules.items(), key=lambda kv: kv[1][0], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{self_us / 1000:9.2f} {cumulative_us / 1000:9.2f}  {name}")
+
+    heavy = loaded_at_menu()
+    if heavy:
+        print(f"WARNING: imported before the menu: {', '.join(heavy)}")
+
+    cmd = [args.exe] if args.exe else [sys.executable, os.path.join(ROOT, 'main.py')]
+    menu_ms = time_to_menu(cmd, args.runs)
+    print(f"time to menu ({'exe' if args.exe else 'source'}): {menu_ms:.1f} ms")
+
+    if args.json:
+        record = {
+            'version': read_version(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': 'exe' if args.exe else 'source',
+            'import_ms': round(total_ms, 1),
+            'menu_ms': round(menu_ms, 1),
+            'heavy_at_menu': heavy,
+            'slowest': [[name, round(self_us / 1000, 2)] for name, (self_us, _) in slowest],
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
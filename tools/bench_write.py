@@ -0,0 +1,96 @@
+"""Compare the legacy 256-byte streaming loop with the adaptive write path.
+
+Serves a random payload from a local HTTP server (in a child process, so its CPU time is
+not counted) and downloads it several times with each strategy, reporting wall-clock
+throughput and client CPU seconds per MB.
+
+Usage:
+    python tools/bench_write.py [--size-mb 10] [--runs 3]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clint.textui import progress  # noqa: E402
+from utils.downloader import _fetch_to_file  # noqa: E402
+from utils.session import create_session  # noqa: E402
+
+
+def _serve(port_queue, size):
+    payload = os.urandom(size)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def legacy_download(session, url, out_path, chunk_size=256):
+    """The original loop: one progress.bar step and one write per 256-byte chunk."""
+    req = session.get(url, stream=True, timeout=30)
+    length = int(req.headers.get('content-length') or 0)
+    with open(str(out_path), 'wb') as fh:
+        bar = progress.bar(req.iter_content(chunk_size), expected_size=max(1, length // chunk_size), hide=True)
+        for chunk in bar:
+            if chunk:
+                fh.write(chunk)
+
+
+def adaptive_download(session, url, out_path):
+    _fetch_to_file(session, url, out_path, 64 * 1024)
+
+
+def measure(name, fn, size, runs):
+    walls, cpus = [], []
+    for _ in range(runs):
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        fn()
+        walls.append(time.perf_counter() - wall0)
+        cpus.append(time.process_time() - cpu0)
+    mb = size / (1024 * 1024)
+    wall, cpu = min(walls), min(cpus)
+    print(f"{name:<10} {mb / wall:10.1f} MB/s {cpu / mb * 1000:10.2f} ms CPU/MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=10)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+    size = int(args.size_mb * 1024 * 1024)
+
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(queue, size), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{queue.get(timeout=10)}/song.mp3"
+    session = create_session()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / 'song.mp3'
+        print(f"payload: {args.size_mb:g} MB, best of {args.runs} runs")
+        measure('legacy', lambda: legacy_download(session, url, out), size, args.runs)
+        measure('adaptive', lambda: adaptive_download(session, url, out), size, args.runs)
+
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Compile every data/*.json catalog into one indexed file (data/catalog.index.json).
+
+The app loads this single file instead of parsing each catalog per menu action, and uses
+its word index for the "Search all collections" menu. The PyInstaller spec runs the same
+build, so the EXE always ships a current index; from source a stale index is ignored.
+
+Usage:
+    python tools/build_catalog.py [--output data/catalog.index.json] [--check]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.catalog import CATALOG_INDEX, CatalogIndex, build_index, write_index  # noqa: E402
+
+
+def _resolve(rel_path: str) -> str:
+    return os.path.join(ROOT, rel_path.replace('/', os.sep))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=_resolve(CATALOG_INDEX))
+    parser.add_argument('--check', action='store_true', help='also time id lookups and a search')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = build_index(_resolve)
+    write_index(index, args.output)
+    items = sum(len(entry[2]) for entry in index['catalogs'])
+    print(f"{args.output}: {len(index['catalogs'])} catalogs, {items} collections, "
+          f"{len(index['tokens'])} words, {os.path.getsize(args.output)} bytes "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.check:
+        start = time.perf_counter()
+        catalog = CatalogIndex.load(_resolve)
+        print(f"load: {(time.perf_counter() - start) * 1000:.2f} ms")
+        for data_file, _, entries in index['catalogs']:
+            by_id = catalog.by_id(data_file)
+            assert all(by_id[int(e['id'])] is not None for e in entries), data_file
+        start = time.perf_counter()
+        results = catalog.search('raja')
+        print(f"search 'raja': {len(results)} results in {(time.perf_counter() - start) * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,459 @@
+"""Behaviour checks against the local stand-in server (tools/index_server.py).
+
+Each check starts its own server in this process, with whatever resets, errors or file
+sizes it needs, drives one feature end to end in a temporary folder and fails with an
+AssertionError if the feature misbehaves. Needs no network; takes a few seconds.
+
+    resume      an interrupted download leaves a .part file that the next run completes
+                with Range + If-Range, and fetches whole if the file changed meanwhile
+    breaker     a host answering only 503s gets its circuit opened (queued files fail fast
+                without a request), and after the cooldown one probe closes it again
+    store       a song already downloaded into another folder is linked without reading
+                its body (same URL), or replaced by a link once hashed (other URL)
+    sync        a second --sync run of an unchanged collection finds it all up to date;
+                files re-uploaded or deleted on the server are fetched again or pruned
+    order       one worker takes queued files in the order each --order policy promises,
+                using the sizes the listing shows
+    queue       a --queue worker takes over the jobs of a worker that died once their
+                lease runs out, and a job whose lease keeps expiring is given up
+    tags        ID3v2/ID3v1 + Xing, FLAC and M4A tags come out the same however the stream
+                is chunked; downloads are indexed in the library from their manifest entries
+
+Usage:
+    python tools/check_behaviour.py [resume breaker store sync order queue tags ...]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from index_server import IndexConfig, make_handler  # noqa: E402
+from utils.batch import enqueue_plan, resolve_entry, work_queue  # noqa: E402
+from utils.crawler import list_folders  # noqa: E402
+from utils.downloader import DownloadPool, audio_items, part_path_for  # noqa: E402
+from utils.library import Library  # noqa: E402
+from utils.manifest import Manifests  # noqa: E402
+from utils.planner import listing_sizes  # noqa: E402
+from utils.progress import Progress  # noqa: E402
+from utils.retry import CircuitBreaker, CircuitOpen  # noqa: E402
+from utils.schedule import ORDER_POLICIES  # noqa: E402
+from utils.session import create_session  # noqa: E402
+from utils.store import ContentStore  # noqa: E402
+from utils.sync import format_sync_counts  # noqa: E402
+from utils.tags import TagReader  # noqa: E402
+from utils.workqueue import MAX_ATTEMPTS, WorkQueue  # noqa: E402
+
+# name -> function, in the order they are defined (and run)
+CHECKS = {}
+
+
+def check(fn):
+    CHECKS[fn.__name__[len('check_'):]] = fn
+    return fn
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients hanging up mid-body is what several checks are about
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class Server:
+    """An index_server running on a free port until close(); `config` may be changed while
+    it runs (the handler reads it on every request) and `stats` holds its counters."""
+
+    def __init__(self, **config):
+        self.config = IndexConfig(**config)
+        self.stats = {}
+        self._httpd = _QuietHTTPServer(('127.0.0.1', 0), make_handler(self.config, self.stats))
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/'
+        threading.Thread(target=self._httpd.serve_forever, name='index-server', daemon=True).start()
+
+    def file_url(self, collection: int = 1, track: int = 1) -> str:
+        return f'{self.url}Collection%20{collection:02d}/{track:03d}%20-%20Track%20{track:03d}.mp3'
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@contextlib.contextmanager
+def serving(**config):
+    server = Server(**config)
+    try:
+        yield server
+    finally:
+        server.close()
+
+
+def download(items, sizes: dict = None, **pool_kwargs) -> DownloadPool:
+    """Run (file_url, out_path) items through a quiet DownloadPool and return it once done."""
+    pool_kwargs.setdefault('session', create_session())
+    pool_kwargs.setdefault('progress', Progress(io.StringIO(), live=False))
+    with DownloadPool(**pool_kwargs) as pool:
+        pool.add(items, sizes)
+    return pool
+
+
+def fetch(url: str) -> bytes:
+    return create_session().get(url, timeout=10).content
+
+
+def fetch_headers(url: str):
+    return create_session().head(url, timeout=10).headers
+
+
+@check
+def check_resume(tmp: Path) -> None:
+    with serving(size=256 * 1024, reset_rate=1.0) as server:
+        url = server.file_url()
+        out = tmp / 'song.mp3'
+        part = part_path_for(out)
+        # every body is cut off halfway: the file fails and what arrived stays in the .part
+        pool = download([(url, out)], retries=0)
+        assert pool.failed == 1 and not out.exists(), 'a cut-off body must not be saved as the song'
+        kept = part.stat().st_size
+        assert 0 < kept < 256 * 1024, f'.part holds {kept} bytes'
+
+        server.config.reset_rate = 0.0
+        sent = server.stats.get('bytes', 0)
+        pool = download([(url, out)], retries=0)
+        assert pool.success == 1 and not part.exists(), 'the resumed download did not finish'
+        assert server.stats['bytes'] - sent == 256 * 1024 - kept, 'the resume fetched bytes the .part had'
+        assert not server.stats.get('if_range_mismatches'), 'If-Range did not match an unchanged file'
+        assert out.read_bytes() == fetch(url), 'the resumed file differs from the original'
+
+        # a file re-uploaded between the two runs must not be spliced onto the old half
+        out.unlink()
+        server.config.reset_rate = 1.0
+        download([(url, out)], retries=0)
+        server.config.reset_rate = 0.0
+        server.config.revision = 1
+        pool = download([(url, out)], retries=0)
+        assert pool.success == 1, 'the changed file was not downloaded'
+        assert server.stats.get('if_range_mismatches') == 1, 'the resume was not sent with If-Range'
+        assert out.read_bytes() == fetch(url), 'old and new content were spliced together'
+        assert os.listdir(tmp) == ['song.mp3'], f'left behind: {sorted(os.listdir(tmp))}'
+
+
+@check
+def check_breaker(tmp: Path) -> None:
+    with serving(size=16 * 1024, error_rate=1.0) as server:
+        host = server.url.split('/')[2]
+        breaker = CircuitBreaker(threshold=2, cooldown=1.0, max_defer=0.0)
+        # two 503s in a row (one retry after the server's Retry-After: 1) open the circuit
+        pool = download([(server.file_url(track=1), tmp / '1.mp3')], retries=1, breaker=breaker)
+        assert pool.failed == 1 and breaker.is_open(host), 'two 503s in a row did not open the circuit'
+
+        # while it is open, queued files fail at once instead of each asking the dead host
+        asked = server.stats['errors']
+        items = [(server.file_url(track=n), tmp / f'{n}.mp3') for n in range(2, 5)]
+        pool = download(items, retries=3, breaker=breaker)
+        assert pool.failed == 3 and server.stats['errors'] == asked, 'an open circuit still sent requests'
+
+        # the host recovers: after the cooldown a single probe goes out and closes the circuit
+        server.config.error_rate = 0.0
+        breaker.max_defer = 5.0
+        pool = download(items, workers=3, breaker=breaker)
+        assert pool.success == 3, f'{pool.failed} files failed after the host recovered'
+        assert not breaker.is_open(host) and breaker.before_request(host) is False, 'the circuit stayed open'
+
+        # a probe that fails for reasons of its own (here: cancelled) must not leave the host half-open
+        for _ in range(breaker.threshold):
+            breaker.record_failure(host)
+        time.sleep(breaker.cooldown)
+        assert breaker.before_request(host) is True, 'no probe was let through after the cooldown'
+        breaker.end_probe(host)
+        assert breaker.before_request(host) is True, 'the host stayed half-open after its probe ended'
+        breaker.end_probe(host)
+        try:
+            breaker.max_defer = 0.0
+            breaker.record_failure(host)
+            breaker.before_request(host)
+        except CircuitOpen:
+            pass
+        else:
+            raise AssertionError('a failed probe did not re-open the circuit')
+
+
+@check
+def check_store(tmp: Path) -> None:
+    size = 1024 * 1024
+    with serving(size=size) as server:
+        store = ContentStore(tmp / '.cache' / 'content-index.json')
+        url = server.file_url()
+        first = tmp / 'Actor Hits' / 'song.mp3'
+        download([(url, first)], store=store)
+
+        # same URL, size and ETag: a HEAD shows it and the first copy is linked without a GET
+        sent, gets = server.stats['bytes'], server.stats['files']
+        linked = tmp / 'Director Hits' / 'song.mp3'
+        pool = download([(url, linked)], store=store)
+        assert pool.success == 1 and pool.deduplicated == 1, 'the second copy was not linked'
+        assert os.path.samefile(first, linked), 'the second copy is not a hardlink of the first'
+        assert (server.stats['bytes'], server.stats['files']) == (sent, gets), \
+            'the file was requested although the store knew it'
+        assert server.stats.get('heads') == 1, 'the store was not checked with a HEAD request'
+
+        # the same bytes under another URL (here: another host name) are fetched, hashed and
+        # then collapsed into the first copy
+        other = url.replace('127.0.0.1', 'localhost')
+        copy = tmp / 'Singer Hits' / 'song.mp3'
+        pool = download([(other, copy)], store=store)
+        assert pool.success == 1 and pool.deduplicated == 1, 'the identical download was not deduplicated'
+        assert os.path.samefile(first, copy), 'the duplicate was kept as a separate file'
+
+        # the key includes the URL: another song of the same size and ETag is not taken for it
+        etag = fetch_headers(url)['ETag']
+        assert store.find_by_key(size, etag, url) is not None
+        assert store.find_by_key(size, etag, server.file_url(track=2)) is None, 'a different URL matched'
+
+
+@check
+def check_sync(tmp: Path) -> None:
+    with serving(files=5, size=32 * 1024) as server:
+        store = ContentStore(tmp / '.cache' / 'content-index.json')
+        library = Library(tmp / '.cache' / 'library.sqlite', tmp)
+
+        def sync_run(prune=False):
+            # a new Manifests per run, as each run of the app reads them from disk again
+            manifests = Manifests(tmp)
+            entry = {'url': server.url + 'Collection%2001/', 'out_dir': tmp / 'Hits'}
+            items = resolve_entry(entry, create_session(), sync=manifests, prune=prune, store=store,
+                                  library=library)
+            pool = download(items, manifests=manifests, store=store, library=library)
+            assert pool.failed == 0, f'{pool.failed} files failed'
+            manifests.flush()
+            library.flush()
+            return entry['sync'], len(items)
+
+        counts, fetched = sync_run()
+        assert (counts['new'], fetched) == (5, 5), format_sync_counts(counts)
+        requests_before = server.stats['files']
+        counts, fetched = sync_run()
+        assert format_sync_counts(counts) == '0 new, 0 changed, 5 up to date', format_sync_counts(counts)
+        assert fetched == 0 and server.stats['files'] == requests_before, 'a rerun downloaded files again'
+
+        # the site is re-uploaded (new dates in the listing) and loses two tracks
+        server.config.revision = 1
+        server.config.files = 3
+        counts, fetched = sync_run(prune=True)
+        assert (counts['changed'], counts['pruned'], fetched) == (3, 2, 3), format_sync_counts(counts)
+        kept = [f'{n:03d} - Track {n:03d}.mp3' for n in range(1, 4)]
+        assert sorted(p.name for p in (tmp / 'Hits').glob('*.mp3')) == kept, 'pruned files are still there'
+        assert sorted(track['name'] for track in library.search('track')) == kept, \
+            'pruned files are still in the library'
+        stored = [os.path.basename(p) for paths in store._load()['hashes'].values() for p in paths]
+        assert sorted(stored) == kept, 'pruned files are still in the content store'
+        assert format_sync_counts(sync_run()[0]) == '0 new, 0 changed, 3 up to date'
+
+
+@check
+def check_order(tmp: Path) -> None:
+    with serving(collections=2, files=6, size=1024 * 1024, size_jitter=0.9) as server:
+        session = create_session()
+        items, sizes = [], {}
+        for collection in ('Collection%2001/', 'Collection%2002/'):
+            folders = list_folders(server.url + collection, session)
+            sizes.update(listing_sizes(folders))
+            items.extend(audio_items(folders[0][2], folders[0][0], tmp / collection))
+        assert len(sizes) == len(items) == 12, 'the listing sizes were not parsed'
+        urls = [url for url, _ in items]
+        expected = {
+            'page': urls,
+            # sorted() is stable, like the scheduler with equal sizes
+            'smallest': sorted(urls, key=lambda url: sizes[url]),
+            'largest': sorted(urls, key=lambda url: -sizes[url]),
+            'interleave': [url for pair in zip(urls[:6], urls[6:]) for url in pair],
+        }
+        assert set(expected) == set(ORDER_POLICIES)
+        for order, wanted in expected.items():
+            done = []
+            for _, out_path in items:
+                if out_path.exists():
+                    out_path.unlink()
+            # a single worker takes the files strictly one after another
+            pool = download(items, sizes, workers=1, order=order,
+                            on_finish=lambda url, out_path, ok, error: done.append(url))
+            assert pool.success == 12, f'{order}: {pool.failed} files failed'
+            assert done == wanted, f'{order}: took items {[urls.index(url) for url in done]}'
+
+
+@check
+def check_queue(tmp: Path) -> None:
+    with serving(collections=2, files=4, size=16 * 1024) as server:
+        path = tmp / 'queue.sqlite'
+        plan = [{'category': 'check', 'name': name, 'url': server.url + f'Collection%20{n:02d}/',
+                 'out_dir': tmp / name} for n, name in ((1, 'One'), (2, 'Two'))]
+        crashed = WorkQueue(path, owner='crashed', lease=0.5)
+        assert enqueue_plan(crashed, plan) == 2 and enqueue_plan(crashed, plan) == 0, 'a collection was queued twice'
+        # this worker claims the first collection and dies: no heartbeat, no finish()
+        taken = crashed.claim(1)
+        assert [job.key for job in taken] == [plan[0]['url']]
+
+        worker = WorkQueue(path, owner='survivor', lease=0.5)
+        worker.start_heartbeat()
+        try:
+            with DownloadPool(workers=2, session=create_session(), progress=Progress(io.StringIO(), live=False),
+                              on_finish=lambda url, out_path, ok, error: worker.finish(str(out_path), ok)) as pool:
+                listed = work_queue(worker, pool, backlog=4, session=create_session())
+            # its own collection first, then the dead worker's once that lease ran out
+            assert listed == 2, f'the survivor listed {listed} collections instead of taking over the other'
+            assert pool.success == 8, f'{pool.success} of 8 files downloaded'
+            assert worker.counts() == {'done': 10}, worker.counts()
+            assert not crashed.finish(taken[0].key, True), 'the dead worker could still finish a job it lost'
+        finally:
+            worker.close()
+            crashed.close()
+
+        # a job whose lease runs out MAX_ATTEMPTS times (its workers keep dying on it) fails
+        flaky = WorkQueue(tmp / 'flaky.sqlite', owner='flaky', lease=0.05)
+        try:
+            flaky.add('file', 'poison', {})
+            for _ in range(MAX_ATTEMPTS):
+                assert flaky.claim(1), 'an expired job was not handed out again'
+                time.sleep(0.1)
+            assert not flaky.claim(1) and flaky.counts() == {'failed': 1}, flaky.counts()
+        finally:
+            flaky.close()
+
+
+def _syncsafe(n: int) -> bytes:
+    return bytes([(n >> 21) & 0x7f, (n >> 14) & 0x7f, (n >> 7) & 0x7f, n & 0x7f])
+
+
+def _mp3(frames: int) -> bytes:
+    """ID3v2.4 tag (with a 100K picture), Xing header, `frames` MPEG frames and an ID3v1 tag."""
+    def text(fid, value):
+        body = b'\x03' + value.encode('utf-8')
+        return fid.encode() + _syncsafe(len(body)) + b'\0\0' + body
+
+    id3 = b''.join([text('TIT2', 'இளையராஜா பாடல்'), text('TPE1', 'Ilaiyaraaja'), text('TALB', 'Hits'),
+                    text('TRCK', '3/8'), text('TDRC', '1985-05-01'),
+                    b'APIC' + _syncsafe(100000) + b'\0\0' + bytes(100000)]) + bytes(200)
+    header = b'\xff\xfb\x90\x00'  # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, stereo: 417-byte frames
+    xing = header + bytes(32) + b'Xing' + struct.pack('>III', 3, frames, frames * 417)
+    v1 = b'TAG' + b'Old title'.ljust(30, b'\0') + bytes(94) + b'\0\x09\x0c'
+    return (b'ID3\x04\x00\x00' + _syncsafe(len(id3)) + id3 + xing.ljust(417, b'\0')
+            + (header + bytes(413)) * frames + v1)
+
+
+def _flac(seconds: int) -> bytes:
+    """FLAC with a 100K picture block ahead of its Vorbis comment."""
+    def block(kind, body, last=False):
+        return bytes([(0x80 if last else 0) | kind]) + len(body).to_bytes(3, 'big') + body
+
+    rate, samples = 44100, 44100 * seconds
+    info = bytearray(34)
+    info[10:14] = bytes([rate >> 12, (rate >> 4) & 0xff, ((rate & 0xf) << 4) | (1 << 1), 15 << 4])
+    info[14:18] = struct.pack('>I', samples)
+    fields = [b'TITLE=Flac Song', b'artist=Flac Artist', b'TRACKNUMBER=7', b'DATE=2020']
+    comment = struct.pack('<I', 3) + b'ref' + struct.pack('<I', len(fields)) + \
+        b''.join(struct.pack('<I', len(f)) + f for f in fields)
+    return b'fLaC' + block(0, bytes(info)) + block(6, bytes(100000)) + block(4, comment, True) + bytes(300000)
+
+
+def _m4a(seconds: int) -> bytes:
+    """M4A whose moov box (with the tags) comes after the audio, as many encoders write it."""
+    def box(kind, body):
+        return struct.pack('>I', 8 + len(body)) + kind + body
+
+    def data(value):
+        return box(b'data', struct.pack('>II', 1, 0) + value)
+
+    ilst = box(b'ilst', box(b'\xa9nam', data(b'M4A Title')) + box(b'\xa9ART', data(b'M4A Artist'))
+               + box(b'trkn', data(struct.pack('>HHHH', 0, 5, 12, 0))))
+    mvhd = box(b'mvhd', bytes(4) + struct.pack('>IIII', 0, 0, 1000, seconds * 1000) + bytes(80))
+    moov = box(b'moov', mvhd + box(b'udta', box(b'meta', bytes(4) + box(b'hdlr', bytes(25)) + ilst)))
+    return box(b'ftyp', b'M4A \0\0\0\0isom') + box(b'mdat', bytes(300000)) + moov
+
+
+def _read_tags(data: bytes, sizes) -> dict:
+    reader = TagReader()
+    pos = 0
+    for size in sizes:
+        reader.feed(data[pos:pos + size])
+        pos += size
+        if pos >= len(data):
+            break
+    reader.feed(data[pos:])
+    return reader.result(len(data))
+
+
+@check
+def check_tags(tmp: Path) -> None:
+    files = {
+        'mp3': (_mp3(3000), {'title': 'இளையராஜா பாடல்', 'artist': 'Ilaiyaraaja', 'album': 'Hits',
+                             'track': '3/8', 'year': '1985', 'bitrate': 128, 'sample_rate': 44100,
+                             'duration': 78.4}),
+        'flac': (_flac(200), {'title': 'Flac Song', 'artist': 'Flac Artist', 'track': '7', 'year': '2020',
+                              'sample_rate': 44100, 'duration': 200.0}),
+        'm4a': (_m4a(245), {'title': 'M4A Title', 'artist': 'M4A Artist', 'track': '5', 'duration': 245.0}),
+    }
+    rnd = random.Random(1)
+    for kind, (data, wanted) in files.items():
+        whole = _read_tags(data, [len(data)])
+        assert {key: whole.get(key) for key in wanted} == wanted, f'{kind}: {whole}'
+        # tags, frame headers and boxes cut anywhere, down to single bytes
+        for sizes in ([64 * 1024] * 100, [4099] * 1000, [1] * 200000, [rnd.randint(1, 9000) for _ in range(2000)]):
+            tags = _read_tags(data, sizes)
+            assert tags == whole, f'{kind} in chunks of {sizes[0]}..: {tags} != {whole}'
+
+    # downloads go through the same reader and reach the library by way of the manifest (the
+    # server's files have no tags, and a lone MPEG header followed by noise is no frame)
+    with serving(files=3, size=64 * 1024) as server:
+        manifests = Manifests(tmp)
+        library = Library(tmp / '.cache' / 'library.sqlite', tmp)
+        try:
+            items = [(server.file_url(track=n), tmp / 'Hits' / f'{n:03d} - Track {n:03d}.mp3') for n in (1, 2, 3)]
+            pool = download(items, manifests=manifests, library=library)
+            assert pool.success == 3, f'{pool.failed} files failed'
+            entry = manifests.get(items[1][1])
+            assert entry['kind'] == 'mp3' and not entry.get('tags'), entry
+            found = library.search('track 002')
+            assert [track['path'] for track in found] == ['Hits/002 - Track 002.mp3'], found
+        finally:
+            library.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Behaviour checks against a local "Index Of" server')
+    parser.add_argument('checks', nargs='*', metavar='check', help=f"any of: {', '.join(CHECKS)} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(unknown)}")
+
+    failed = 0
+    for name in args.checks or CHECKS:
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix=f'check-{name}-') as tmp:
+            try:
+                CHECKS[name](Path(tmp))
+            except Exception:
+                failed += 1
+                print(f"FAIL  {name}")
+                traceback.print_exc()
+                continue
+        print(f"ok    {name} ({time.perf_counter() - start:.1f}s)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Local stand-in for the song site: Apache-style "Index Of" pages over synthetic audio files.
+
+The tree is generated, nothing is stored on disk:
+
+    /                         -> "Collection 01/" ... "Collection NN/"
+    /Collection 01/           -> "001 - Track 001.mp3" ... (plus "Disc N/" with --subdirs)
+    /Collection 01/001 - ...  -> SIZE bytes that start like an MP3 (ID3 header)
+
+Files support HEAD, Range (206/416), If-Range, ETag and Last-Modified like a real Apache;
+raising a config's `revision` changes every file's content, ETag and date, as if the site
+had been re-uploaded. Latency, per-connection throttling, 503 errors and mid-body
+connection resets can be injected to see how the downloader copes. Used by
+tools/bench_offline.py and tools/check_behaviour.py; runs on a machine without network access.
+
+Usage:
+    python tools/index_server.py [--port 8000] [--collections 5] [--files 50] [--size 4M]
+                                 [--latency 0.05] [--throttle 2M] [--error-rate 0.02]
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote, unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ratelimit import parse_rate  # noqa: E402
+
+# every file is cut from this block, shifted by a per-file offset, so bodies are cheap to
+# produce yet differ between files (content dedup must not collapse them)
+_BLOCK = random.Random(1234).randbytes(1024 * 1024)
+# an empty ID3v2.4 tag followed by an MPEG-1 Layer III frame header (128 kbit/s, 44.1 kHz)
+_ID3 = b'ID3\x04\x00\x00\x00\x00\x00\x00\xff\xfb\x90\x64'
+MTIME = 1704103200  # 2024-01-01 10:00 UTC, shown in every listing (plus an hour per revision)
+
+
+class IndexConfig:
+    def __init__(self, collections: int = 5, files: int = 50, size: int = 4 * 1024 * 1024,
+                 size_jitter: float = 0.0, subdirs: int = 0, latency: float = 0.0,
+                 throttle: float = 0, error_rate: float = 0.0, reset_rate: float = 0.0,
+                 seed: int = 1, revision: int = 0):
+        self.collections = collections
+        self.files = files
+        self.size = size
+        self.size_jitter = size_jitter
+        self.subdirs = subdirs
+        self.latency = latency
+        self.throttle = throttle
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.seed = seed
+        self.revision = revision
+
+    def mtime(self) -> int:
+        return MTIME + 3600 * self.revision
+
+    def file_size(self, name: str) -> int:
+        if not self.size_jitter:
+            return self.size
+        rnd = random.Random(f'{self.seed}:{name}')
+        return max(len(_ID3), int(self.size * (1 + rnd.uniform(-self.size_jitter, self.size_jitter))))
+
+    def folder(self, parts):
+        """Return ([subdir names], [file names]) for a folder path, or None if it doesn't exist."""
+        if not parts:
+            return [f'Collection {c:02d}' for c in range(1, self.collections + 1)], []
+        try:
+            coll = int(parts[0].split(' ', 1)[1])
+        except (IndexError, ValueError):
+            return None
+        if not 1 <= coll <= self.collections or len(parts) > 2:
+            return None
+        files = [f'{i:03d} - Track {i:03d}.mp3' for i in range(1, self.files + 1)]
+        if len(parts) == 2:
+            if not self.subdirs or parts[1] not in [f'Disc {d}' for d in range(1, self.subdirs + 1)]:
+                return None
+            return [], files
+        return [f'Disc {d}' for d in range(1, self.subdirs + 1)], files
+
+
+def _digest(path: str, revision: int) -> bytes:
+    """Per-file seed for the body offset and ETag; revision 0 keeps the original files."""
+    return hashlib.md5((f'{path}#{revision}' if revision else path).encode()).digest()
+
+
+def _body(path: str, size: int, start: int, end: int, revision: int = 0) -> bytes:
+    """Bytes [start, end) of the synthetic file at `path`."""
+    offset = int.from_bytes(_digest(path, revision)[:4], 'big') % len(_BLOCK)
+    out = bytearray()
+    pos = start
+    while pos < end:
+        if pos < len(_ID3):
+            piece = _ID3[pos:min(end, len(_ID3))]
+        else:
+            i = (offset + pos) % len(_BLOCK)
+            piece = _BLOCK[i:i + min(end - pos, len(_BLOCK) - i)]
+        out += piece
+        pos += len(piece)
+    return bytes(out)
+
+
+def listing_page(title: str, dirs, files, config: IndexConfig) -> bytes:
+    """An Apache 2.4 style autoindex table (the layout friendstamilmp3.in serves)."""
+    stamp = time.strftime('%Y-%m-%d %H:%M', time.gmtime(config.mtime()))
+    rows = [
+        '<tr><th valign="top"><img src="/icons/blank.gif" alt="[ICO]"></th>'
+        '<th><a href="?C=N;O=D">Name</a></th><th><a href="?C=M;O=A">Last modified</a></th>'
+        '<th><a href="?C=S;O=A">Size</a></th><th><a href="?C=D;O=A">Description</a></th></tr>',
+        '<tr><th colspan="5"><hr></th></tr>',
+        '<tr><td valign="top"><img src="/icons/back.gif" alt="[PARENTDIR]"></td>'
+        '<td><a href="../">Parent Directory</a></td><td>&nbsp;</td><td align="right">  - </td><td>&nbsp;</td></tr>',
+    ]
+    for d in dirs:
+        rows.append(f'<tr><td valign="top"><img src="/icons/folder.gif" alt="[DIR]"></td>'
+                    f'<td><a href="{quote(d)}/">{d}/</a></td><td align="right">{stamp}  </td>'
+                    f'<td align="right">  - </td><td>&nbsp;</td></tr>')
+    for f in files:
+        size = config.file_size(f)
+        rows.append(f'<tr><td valign="top"><img src="/icons/sound2.gif" alt="[SND]"></td>'
+                    f'<td><a href="{quote(f)}">{f}</a></td><td align="right">{stamp}  </td>'
+                    f'<td align="right">{size / 1024 / 1024:.1f}M</td><td>&nbsp;</td></tr>')
+    rows.append('<tr><th colspan="5"><hr></th></tr>')
+    return (f'<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">\n<html>\n <head>\n'
+            f'  <title>Index of {title}</title>\n </head>\n <body>\n<h1>Index of {title}</h1>\n'
+            f'  <table>\n' + '\n'.join(rows) + '\n</table>\n</body></html>\n').encode('utf-8')
+
+
+def make_handler(config: IndexConfig, stats: dict):
+    lock = threading.Lock()
+    rnd = random.Random(config.seed)
+
+    def chance(p):
+        with lock:
+            return p and rnd.random() < p
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        server_version = 'Apache'
+
+        def log_message(self, *args):
+            pass
+
+        def _count(self, key, n=1):
+            with lock:
+                stats[key] = stats.get(key, 0) + n
+
+        def do_HEAD(self):
+            self.do_GET(head=True)
+
+        def do_GET(self, head=False):
+            if config.latency:
+                time.sleep(config.latency)
+            path = unquote(self.path.split('?', 1)[0])
+            parts = [p for p in path.split('/') if p]
+            if path.endswith('/'):
+                self._count('listings')
+                folder = config.folder(parts)
+                if folder is None:
+                    return self._empty(404)
+                body = listing_page(path, folder[0], folder[1], config)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html;charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+                return
+
+            folder = config.folder(parts[:-1]) if parts else None
+            if folder is None or parts[-1] not in folder[1]:
+                return self._empty(404)
+            if chance(config.error_rate):
+                self._count('errors')
+                return self._empty(503, {'Retry-After': '1'})
+            self._count('heads' if head else 'files')
+            size = config.file_size(parts[-1])
+            revision = config.revision
+            modified = formatdate(config.mtime(), usegmt=True)
+            etag = '"%s-%x"' % (_digest(path, revision).hex()[:8], size)
+            start, end, status = 0, size, 200
+            rng = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            if if_range and if_range not in (etag, modified):
+                # the client's copy is of another version: send the whole file
+                self._count('if_range_mismatches')
+                rng = None
+            if rng and rng.startswith('bytes='):
+                first, _, last = rng[6:].partition('-')
+                start = int(first or 0)
+                if start >= size:
+                    return self._empty(416, {'Content-Range': f'bytes */{size}'})
+                end = min(size, int(last) + 1) if last else size
+                status = 206
+            self.send_response(status)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Last-Modified', modified)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(end - start))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+            self.end_headers()
+            if head:
+                return
+            self._send_body(path, size, start, end, revision)
+
+        def _send_body(self, path, size, start, end, revision=0):
+            reset_at = None
+            if chance(config.reset_rate):
+                reset_at = start + (end - start) // 2
+            slice_size = 64 * 1024
+            pos = start
+            began = time.monotonic()
+            while pos < end:
+                if reset_at is not None and pos >= reset_at:
+                    self._count('resets')
+                    self.close_connection = True
+                    return
+                piece = _body(path, size, pos, min(end, pos + slice_size), revision)
+                try:
+                    self.wfile.write(piece)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                pos += len(piece)
+                self._count('bytes', len(piece))
+                if config.throttle:
+                    ahead = (pos - start) / config.throttle - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+        def _empty(self, status, headers=None):
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    return Handler
+
+
+def serve(config: IndexConfig, port: int = 0, port_queue=None) -> None:
+    """Serve forever; the bound port is put on `port_queue` (for child-process use)."""
+    stats = {}
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(config, stats))
+    server.daemon_threads = True
+    if port_queue is not None:
+        port_queue.put(server.server_address[1])
+    else:
+        print(f"Serving on http://127.0.0.1:{server.server_address[1]}/ (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def add_config_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--collections', type=int, default=5)
+    parser.add_argument('--files', type=int, default=50, help='files per collection (and per disc)')
+    parser.add_argument('--size', type=parse_rate, default=4 * 1024 * 1024, help='file size, e.g. 300K or 4M')
+    parser.add_argument('--size-jitter', type=float, default=0.0, help='vary sizes by up to +-this fraction')
+    parser.add_argument('--subdirs', type=int, default=0, help='"Disc N" sub-folders per collection')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added before every response')
+    parser.add_argument('--throttle', type=parse_rate, default=0, help='per-connection bytes/s, e.g. 2M')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of file requests answered 503')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='fraction of bodies cut off halfway')
+
+
+def config_from_args(args) -> IndexConfig:
+    return IndexConfig(args.collections, args.files, int(args.size), args.size_jitter, args.subdirs,
+                       args.latency, args.throttle, args.error_rate, args.reset_rate)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Local "Index Of" test server')
+    parser.add_argument('--port', type=int, default=8000)
+    add_config_args(parser)
+    args = parser.parse_args(argv)
+    serve(config_from_args(args), args.port)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
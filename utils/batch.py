@@ -0,0 +1,206 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+
+from utils.crawler import list_folders, DEFAULT_MAX_DEPTH
+from utils.downloader import audio_items
+from utils.helper import parse_star_selection
+from utils.listing_cache import ListingCache
+from utils.manifest import Manifests
+from utils.planner import estimate_folders, listing_sizes
+from utils.sync import sync_folders
+
+if TYPE_CHECKING:
+    import requests
+    from utils.downloader import DownloadPool
+    from utils.library import Library
+    from utils.store import ContentStore
+    from utils.workqueue import WorkQueue
+
+# Seconds an idle --queue worker waits before asking the queue again
+QUEUE_POLL = 2.0
+
+
+def parse_batch_spec(spec: str) -> Tuple[str, str]:
+    """Split 'data/star-hits.json:1-5,8' into (data_file, selection); selection defaults to 'all'."""
+    data_file, sep, selection = spec.rpartition(':')
+    # no ':' at all, or a Windows drive letter ('C:\\...') rather than a selection
+    if not sep or not data_file or '/' in selection or '\\' in selection or selection.endswith('.json'):
+        return spec, 'all'
+    return data_file, selection.strip() or 'all'
+
+
+def build_plan(specs: List[str], load_data: Callable[[str], list], category_for: Callable[[str], str],
+               output_root: Path) -> Tuple[List[dict], List[str]]:
+    """Expand batch specs into collections to mirror, without asking anything.
+
+    Returns (plan, problems): plan entries are {'category', 'name', 'url', 'out_dir'};
+    problems are human readable messages about files or ids that could not be used.
+    """
+    plan = []
+    problems = []
+    seen_urls = set()
+    for spec in specs:
+        data_file, selection = parse_batch_spec(spec)
+        try:
+            data_list = load_data(data_file)
+        except Exception as e:
+            problems.append(f"Failed to load {data_file}: {e}")
+            continue
+        category = category_for(data_file)
+        selected, missing = parse_star_selection(selection, data_list)
+        for mid in missing:
+            problems.append(f"{data_file}: no item with id {mid}")
+        for item in selected:
+            name = item.get('name')
+            url = item.get('href') or item.get('path')
+            if not url:
+                problems.append(f"{data_file}: no URL for '{name}'")
+                continue
+            # the same collection listed under two specs is only mirrored once
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            plan.append({'category': category, 'name': name, 'url': url,
+                         'out_dir': Path(output_root) / category / name})
+    return plan, problems
+
+
+def resolve_entry(entry: dict, session: Optional['requests.Session'] = None,
+                  cache: Optional[ListingCache] = None, parser: str = 'fast',
+                  recursive: bool = False, max_depth: int = DEFAULT_MAX_DEPTH,
+                  sync: Optional[Manifests] = None, prune: bool = False,
+                  store: Optional['ContentStore'] = None, library: Optional['Library'] = None,
+                  log: Callable[[str], None] = print) -> List[Tuple[str, Path]]:
+    """Fetch the listing(s) of one plan entry and return its (file_url, out_path) items.
+
+    Sub-folders of a recursive listing that fail to load are reported through `log`.
+
+    With `sync` (the run's manifests) only new or changed files are returned and the entry
+    gets a 'sync' key with the counts from utils.sync.sync_folders (`prune` also clears pruned
+    files from the content `store` and the `library`). The entry's 'sizes' key
+    gets the listing's {file_url: bytes} for the pool's size-based orders.
+    """
+    folders = list_folders(entry['url'], session, cache, parser, recursive=recursive, max_depth=max_depth,
+                           log=log)
+    entry['sizes'] = listing_sizes(folders)
+    if sync is not None:
+        items, entry['sync'] = sync_folders(folders, entry['out_dir'], sync, prune, store, library)
+        return items
+    items = []
+    for folder_url, rel_parts, hrefs, _ in folders:
+        items.extend(audio_items(hrefs, folder_url, entry['out_dir'].joinpath(*rel_parts)))
+    return items
+
+
+def resolve_plan(plan: List[dict], workers: int = 4, on_items: Optional[Callable[[list], None]] = None,
+                 **resolve_kwargs) -> Tuple[List[Tuple[str, Path]], List[str]]:
+    """Resolve every plan entry concurrently; returns (all_items, problems).
+
+    `on_items` is called (in the caller's thread) with each collection's items and their
+    listing sizes as soon as its listing is parsed, so a DownloadPool can start on the first
+    collection while the rest are still being listed. Each entry gets an 'audio_count' (or
+    'error') key so callers can print a per-collection summary.
+    """
+    def _resolve(entry):
+        return resolve_entry(entry, **resolve_kwargs)
+
+    items = []
+    problems = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='listing') as pool:
+        futures = {pool.submit(_resolve, entry): entry for entry in plan}
+        for fut in as_completed(futures):
+            entry = futures[fut]
+            try:
+                entry_items = fut.result()
+            except Exception as e:
+                entry['error'] = str(e)
+                problems.append(f"Failed to fetch URL {entry['url']}: {e}")
+                continue
+            entry['audio_count'] = len(entry_items)
+            items.extend(entry_items)
+            if on_items is not None:
+                on_items(entry_items, entry.get('sizes'))
+    return items, problems
+
+
+def estimate_plan(plan: List[dict], workers: int = 4, session: Optional['requests.Session'] = None,
+                  cache: Optional[ListingCache] = None, parser: str = 'fast', recursive: bool = False,
+                  max_depth: int = DEFAULT_MAX_DEPTH) -> List[str]:
+    """List every plan entry without downloading and give each an 'estimate' (see
+    utils.planner.estimate_folders) or an 'error' key; returns the problems."""
+    def _estimate(entry):
+        folders = list_folders(entry['url'], session, cache, parser, recursive=recursive, max_depth=max_depth)
+        return estimate_folders(folders)
+
+    problems = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='listing') as pool:
+        futures = {pool.submit(_estimate, entry): entry for entry in plan}
+        for fut in as_completed(futures):
+            entry = futures[fut]
+            try:
+                entry['estimate'] = fut.result()
+            except Exception as e:
+                entry['error'] = str(e)
+                problems.append(f"Failed to fetch URL {entry['url']}: {e}")
+    return problems
+
+
+def enqueue_plan(queue: 'WorkQueue', plan: List[dict]) -> int:
+    """Put the plan's collections on a shared queue (already queued ones are kept); returns
+    how many were new."""
+    return queue.add_many('collection', [(entry['url'], dict(entry, out_dir=str(entry['out_dir'])))
+                                         for entry in plan])
+
+
+def work_queue(queue: 'WorkQueue', pool: 'DownloadPool', backlog: int, log: Callable[[str], None] = print,
+               **resolve_kwargs) -> int:
+    """Take jobs from a shared queue until it is drained; returns the collections listed here.
+
+    A 'collection' job is listed right away (resolve_entry, so --sync applies) and turns into
+    one 'file' job per file to fetch, which any worker may take. File jobs go to `pool`,
+    keeping at most `backlog` files claimed but unfinished; the pool's on_finish must report
+    them back with queue.finish(str(out_path), ...). Jobs held by other workers are waited
+    for, and taken over if their lease runs out.
+    """
+    manifests = resolve_kwargs.get('sync')
+    listed = 0
+    while not pool.stop.is_set():
+        room = backlog - pool.pending()
+        if room <= 0:
+            # enough claimed work on hand; look again once some of it is done
+            pool.stop.wait(QUEUE_POLL / 10)
+            continue
+        jobs = queue.claim(room)
+        if not jobs:
+            if not pool.pending() and not queue.active():
+                break
+            pool.stop.wait(QUEUE_POLL)
+            continue
+        items = []
+        sizes = {}
+        for job in jobs:
+            if job.kind == 'file':
+                out_path = Path(job.payload['path'])
+                if manifests is not None and job.payload.get('listing'):
+                    manifests.expect(out_path, job.payload['listing'])
+                items.append((job.payload['url'], out_path))
+                if job.payload.get('size') is not None:
+                    sizes[job.payload['url']] = job.payload['size']
+                continue
+            entry = dict(job.payload, out_dir=Path(job.payload['out_dir']))
+            try:
+                entry_items = resolve_entry(entry, log=log, **resolve_kwargs)
+            except Exception as e:
+                queue.finish(job.key, False, str(e))
+                log(f"Failed to fetch URL {entry['url']}: {e}")
+                continue
+            queue.add_many('file', [(str(out_path), {'url': file_url, 'path': str(out_path),
+                                                     'size': entry['sizes'].get(file_url),
+                                                     'listing': manifests.expected(out_path) if manifests else None})
+                                    for file_url, out_path in entry_items])
+            queue.finish(job.key, True)
+            listed += 1
+        if items:
+            pool.add(items, sizes)
+    return listed
@@ -0,0 +1,177 @@
+import json
+import os
+import re
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.helper import index_by_id
+
+# Category (and output folder) used for each data file, matching the interactive menus
+DATA_FILE_CATEGORIES = {
+    'data/star-hits.json': 'Star Hits',
+    'data/music-directors-hits.json': 'Music Director Hits',
+    'data/singer-hits.json': 'Singer Hits',
+    'data/old/collections.json': 'Old Collections',
+    'data/old/singers.json': 'Old Hits (Singers)',
+    'data/ringtones.json': 'Ring Tones',
+    'data/new-movies-ringtone.json': 'New Movies Ring Tone',
+    'data/instrumentals.json': 'Instrumental Collections',
+}
+
+# Compiled form of every catalog above, written by tools/build_catalog.py and bundled in the EXE
+CATALOG_INDEX = 'data/catalog.index.json'
+INDEX_VERSION = 1
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+# Romanised Tamil names are spelt many ways (Ilaiyaraaja / ILaiyaraja / ILayaraja); these
+# rewrites map common variants onto one spelling for a second, looser search pass
+_LOOSE_RULES = (('aiy', 'ay'), ('ee', 'i'), ('oo', 'u'), ('th', 't'), ('dh', 'd'),
+                ('bh', 'b'), ('gh', 'g'), ('kh', 'k'), ('zh', 'l'))
+_REPEAT_RE = re.compile(r'(.)\1+')
+
+
+def loose_form(word: str) -> str:
+    for old, new in _LOOSE_RULES:
+        word = word.replace(old, new)
+    return _REPEAT_RE.sub(r'\1', word)
+
+
+def _source_stamp(path: str) -> Optional[list]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def build_index(resolve: Callable[[str], str], data_files: Dict[str, str] = None) -> dict:
+    """Read every catalog once and compile them into one dict (see CatalogIndex for the layout).
+
+    resolve maps 'data/...' to a real path (main.get_resource_path when running the app).
+    """
+    data_files = DATA_FILE_CATEGORIES if data_files is None else data_files
+    catalogs = []
+    sources = {}
+    tokens = {}
+    for data_file, category in data_files.items():
+        path = resolve(data_file)
+        with open(path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        sources[data_file] = _source_stamp(path)
+        cat_idx = len(catalogs)
+        catalogs.append([data_file, category, items])
+        for item_idx, item in enumerate(items):
+            for tok in set(tokenize(item.get('name'))):
+                tokens.setdefault(tok, []).append([cat_idx, item_idx])
+    return {'version': INDEX_VERSION, 'sources': sources, 'catalogs': catalogs, 'tokens': tokens}
+
+
+def write_index(index: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+class CatalogIndex:
+    """All catalogs loaded from one precompiled file, with O(1) id lookup and name search.
+
+    Layout of the compiled dict: 'catalogs' is a list of [data_file, category, items];
+    'tokens' maps each lowercase word of an item name to [catalog_pos, item_pos] pairs.
+    """
+
+    def __init__(self, index: dict):
+        self._catalogs = {}
+        self._order = []
+        for data_file, category, items in index['catalogs']:
+            self._catalogs[data_file] = (category, items)
+            self._order.append(data_file)
+        self._tokens = index.get('tokens', {})
+        self._loose = {tok: loose_form(tok) for tok in self._tokens}
+        self._by_id = {}
+
+    @classmethod
+    def load(cls, resolve: Callable[[str], str]) -> 'CatalogIndex':
+        """Use the compiled index when it is present and current, else compile in memory.
+
+        When running from source, an edited data/*.json makes the compiled file stale
+        (size/mtime differ) and it is ignored; a frozen build always trusts its bundle.
+        """
+        try:
+            with open(resolve(CATALOG_INDEX), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION:
+                raise ValueError('old catalog index')
+            if not getattr(sys, 'frozen', False):
+                for data_file, stamp in index['sources'].items():
+                    if _source_stamp(resolve(data_file)) not in (None, stamp):
+                        raise ValueError(f'{data_file} changed')
+                if set(index['sources']) != set(DATA_FILE_CATEGORIES):
+                    raise ValueError('catalog list changed')
+        except Exception:
+            index = build_index(resolve)
+        return cls(index)
+
+    def __contains__(self, data_file: str) -> bool:
+        return data_file in self._catalogs
+
+    def category(self, data_file: str) -> str:
+        return self._catalogs[data_file][0]
+
+    def items(self, data_file: str) -> List[dict]:
+        return self._catalogs[data_file][1]
+
+    def by_id(self, data_file: str) -> Dict[int, dict]:
+        """{id: item} for one catalog, built on first use."""
+        table = self._by_id.get(data_file)
+        if table is None:
+            table = index_by_id(self.items(data_file))
+            self._by_id[data_file] = table
+        return table
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[str, str, dict]]:
+        """Items from every catalog whose name contains all words of `query` (as substrings).
+
+        Spelling variants of a word also match (see loose_form), ranked after literal matches.
+        Returns [(data_file, category, item)], whole-word matches first, then in catalog order.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        hits = None
+        for word in words:
+            refs = {}
+            loose = loose_form(word)
+            # the vocabulary is small (a few hundred words), so substring matching scans it
+            # instead of every item name; exact words rank above partial ones
+            for tok, positions in self._tokens.items():
+                if word in tok:
+                    rank = 0 if tok == word else (1 if tok.startswith(word) else 2)
+                elif loose in self._loose[tok]:
+                    rank = 3
+                else:
+                    continue
+                for cat_pos, item_pos in positions:
+                    key = (cat_pos, item_pos)
+                    refs[key] = min(rank, refs.get(key, rank))
+            if hits is None:
+                hits = refs
+            else:
+                hits = {k: max(hits[k], r) for k, r in refs.items() if k in hits}
+            if not hits:
+                return []
+        ordered = sorted(hits, key=lambda k: (hits[k], k))[:limit]
+        results = []
+        for cat_pos, item_pos in ordered:
+            data_file = self._order[cat_pos]
+            category, items = self._catalogs[data_file]
+            results.append((data_file, category, items[item_pos]))
+        return results
+
@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import unquote, urljoin, urlsplit, urlunsplit
+from utils.listing import fetch_index
+from utils.listing_cache import ListingCache
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_MAX_DEPTH = 3
+DEFAULT_CRAWL_WORKERS = 4
+
+
+def _normalize_dir_url(url: str) -> str:
+    """Canonical form used for dedup: no query/fragment, decoded path, trailing slash."""
+    parts = urlsplit(url)
+    path = unquote(parts.path)
+    if not path.endswith('/'):
+        path += '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, '', ''))
+
+
+def _relative_parts(dir_key: str, root_key: str) -> Optional[Tuple[str, ...]]:
+    """Local folder parts mirroring dir_key below root_key, or None if it can't be mirrored safely.
+
+    Both arguments are normalized URLs; the parts come from the resolved URL rather than the
+    href text so links like 'Movie/../Other/' land where the server actually serves them.
+    """
+    if not dir_key.startswith(root_key):
+        return None
+    parts = tuple(p.strip() for p in dir_key[len(root_key):].strip('/').split('/'))
+    if not parts or any(not p or p in ('.', '..') or '\\' in p for p in parts):
+        return None
+    return parts
+
+
+def crawl_index(root_url: str, session: Optional['requests.Session'] = None,
+                cache: Optional[ListingCache] = None, parser: str = 'fast',
+                max_depth: int = DEFAULT_MAX_DEPTH, workers: int = DEFAULT_CRAWL_WORKERS,
+                log: Callable[[str], None] = print) -> List[Tuple[str, Tuple[str, ...], List[str], dict]]:
+    """Breadth-first crawl of an "Index Of" tree.
+
+    All listings of one depth level are fetched concurrently before descending. Only
+    directories below root_url are followed, each at most once, so '../' links, absolute
+    parent links and symlink loops can't send the crawl in circles. Depth 0 is the root.
+
+    Returns [(folder_url, relative_path_parts, file_hrefs, file_meta), ...] in breadth-first
+    order, file_meta being the listing's {href: {'date', 'size'}}. Raises IOError (from the
+    original error) when the root listing can't be fetched; sub-folders that fail to load are
+    reported through `log` (pass a DownloadPool's log while its progress display is up) and
+    skipped.
+    """
+    root_url = root_url if root_url.endswith('/') else root_url + '/'
+    root_key = _normalize_dir_url(root_url)
+    seen = {root_key}
+    results = []
+    level = [(root_url, ())]
+    depth = 0
+
+    def _load(url):
+        try:
+            return fetch_index(url, session, cache, parser), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='crawl') as pool:
+        while level:
+            listings = list(pool.map(lambda entry: _load(entry[0]), level))
+            next_level = []
+            for (url, rel), (listing, error) in zip(level, listings):
+                if listing is None:
+                    if not rel:
+                        # callers name the collection when they report this
+                        raise IOError(f"listing failed: {error}") from error
+                    log(f"Failed to fetch URL {url}: {error}")
+                    continue
+                results.append((url, rel, list(listing['hrefs']), listing.get('meta', {})))
+                if depth >= max_depth:
+                    continue
+                for href in listing.get('dirs', []):
+                    child = urljoin(url, href)
+                    key = _normalize_dir_url(child)
+                    if key in seen:
+                        continue
+                    # stay inside the root tree and visit each folder once
+                    parts = _relative_parts(key, root_key)
+                    if parts is None:
+                        continue
+                    seen.add(key)
+                    next_level.append((child, parts))
+            level = next_level
+            depth += 1
+    return results
+
+
+def list_folders(index_url: str, session: Optional['requests.Session'] = None,
+                 cache: Optional[ListingCache] = None, parser: str = 'fast',
+                 recursive: bool = False, max_depth: int = DEFAULT_MAX_DEPTH,
+                 workers: int = DEFAULT_CRAWL_WORKERS,
+                 log: Callable[[str], None] = print) -> List[Tuple[str, Tuple[str, ...], List[str], dict]]:
+    """List a collection as crawl_index does, or just its own page when not recursive.
+
+    Raises when the collection's listing can't be fetched.
+    """
+    if not recursive:
+        listing = fetch_index(index_url, session, cache, parser)
+        return [(index_url, (), list(listing['hrefs']), listing.get('meta', {}))]
+    return crawl_index(index_url, session, cache, parser, max_depth=max_depth, workers=workers, log=log)
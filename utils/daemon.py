@@ -0,0 +1,360 @@
+"""Service mode: a long-running process that takes download jobs over a local HTTP API.
+
+The session's connection pools, the listing cache, the compiled catalog index and the
+manifests stay in memory between jobs. Jobs are kept in a SQLite file, so a restart picks
+up where the last process stopped (a job that was running starts again, resuming its
+.part files).
+
+    POST /jobs                 {"specs": ["data/star-hits.json:1-5"], "priority": 0,
+                                "sync": false, "prune": false, "order": "page"} -> job
+    GET  /jobs                 recent jobs, newest first
+    GET  /jobs/<id>            one job, with live counts while it runs
+    POST /jobs/<id>/cancel     cancel a queued or running job
+    POST /jobs/<id>/priority   {"priority": 5}; higher runs first (queued jobs only)
+    GET  /limit                the current bandwidth limits
+    POST /limit                {"rate": "2M", "host": "500K"}; either key may be left out, 0 lifts
+                               the cap. Running transfers pick the new limit up on their next read.
+    GET  /status               the daemon and its caches
+
+The server listens on 127.0.0.1 only and has no authentication. So that web pages open in
+a browser can't drive it, POST bodies must be sent as Content-Type: application/json
+(which a page can only do after a CORS preflight this server never answers), and requests
+with a Host or Origin other than localhost are refused. Jobs may only name the bundled
+catalogs (the caller's `validate`).
+"""
+import json
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_PORT = 8765
+# Host names a request may come from (Host and Origin headers)
+LOCAL_HOSTS = ('127.0.0.1', 'localhost')
+# Job states; 'running' jobs found at startup were interrupted and are queued again
+STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+'''
+
+
+class JobStore:
+    """Jobs persisted in SQLite; every method may be called from any thread."""
+
+    def __init__(self, path: Path):
+        # imported on use: main.py reads DEFAULT_PORT from here on every start
+        import sqlite3
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+
+    def requeue_interrupted(self) -> int:
+        with self._lock:
+            return self._db.execute("UPDATE jobs SET state = 'queued', started = NULL WHERE state = 'running'").rowcount
+
+    def add(self, request: dict, priority: int = 0) -> int:
+        with self._lock:
+            return self._db.execute('INSERT INTO jobs (request, priority, created) VALUES (?, ?, ?)',
+                                    (json.dumps(request), int(priority), time.time())).lastrowid
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _job_dict(row) if row is not None else None
+
+    def list(self, limit: int = 50) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [_job_dict(row) for row in rows]
+
+    def next_queued(self) -> Optional[dict]:
+        """Highest priority queued job (oldest first among equals), marked running."""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE state = 'queued' "
+                                   "ORDER BY priority DESC, id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET state = 'running', started = ? WHERE id = ?", (time.time(), row['id']))
+        return self.get(row['id'])
+
+    def update(self, job_id: int, only_if: Optional[str] = None, **fields) -> bool:
+        """Set columns of a job (optionally only while it is in state `only_if`)."""
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'])
+        sql = 'UPDATE jobs SET ' + ', '.join(f"{name} = ?" for name in fields) + ' WHERE id = ?'
+        args = list(fields.values()) + [job_id]
+        if only_if is not None:
+            sql += ' AND state = ?'
+            args.append(only_if)
+        with self._lock:
+            return self._db.execute(sql, args).rowcount == 1
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _job_dict(row) -> dict:
+    job = dict(row)
+    job['request'] = json.loads(job['request'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+class JobDaemon:
+    """Runs stored jobs one at a time on a background thread.
+
+    run_job(request, on_pool) does the work and returns a result dict; it must call
+    on_pool(pool) with its DownloadPool so the daemon can report live counts and cancel it.
+    limits(changes) applies {"rate": ..., "host": ...} (raising ValueError for a bad value) and
+    returns the limits now in force; it is called with {} to only read them.
+    """
+
+    def __init__(self, store: JobStore, run_job: Callable[[dict, Callable], dict],
+                 validate: Callable[[dict], Optional[str]] = None, info: Callable[[], dict] = None,
+                 limits: Callable[[dict], dict] = None):
+        self.store = store
+        self.run_job = run_job
+        self.validate = validate
+        self.info = info
+        self.limits = limits
+        self.started = time.time()
+        self._wake = threading.Condition()
+        self._stopping = False
+        self._current = None
+        self._pool = None
+        self._thread = None
+
+    def start(self) -> None:
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            print(f"Resuming {requeued} interrupted job(s)")
+        self._thread = threading.Thread(target=self._run, name='jobs', daemon=True)
+        self._thread.start()
+
+    def submit(self, request: dict) -> dict:
+        """Store a job request; raises ValueError for a malformed one."""
+        specs = request.get('specs')
+        if not isinstance(specs, list) or not specs or not all(isinstance(s, str) for s in specs):
+            raise ValueError("'specs' must be a non-empty list like [\"data/star-hits.json:1-5\"]")
+        try:
+            priority = int(request.get('priority', 0))
+        except (TypeError, ValueError):
+            raise ValueError("'priority' must be an integer")
+        request = {key: request[key] for key in ('specs', 'sync', 'prune', 'order') if key in request}
+        problem = self.validate(request) if self.validate is not None else None
+        if problem:
+            raise ValueError(problem)
+        job_id = self.store.add(request, priority)
+        with self._wake:
+            self._wake.notify()
+        return self.status(job_id)
+
+    def cancel(self, job_id: int) -> Optional[dict]:
+        if self.store.update(job_id, only_if='queued', state='cancelled', finished=time.time()):
+            return self.status(job_id)
+        with self._wake:
+            if self._current == job_id:
+                self.store.update(job_id, only_if='running', state='cancelled')
+                if self._pool is not None:
+                    # in-flight transfers stop at their next chunk and keep their .part files
+                    self._pool.stop.set()
+        return self.status(job_id)
+
+    def set_priority(self, job_id: int, priority: int) -> Optional[dict]:
+        self.store.update(job_id, only_if='queued', priority=int(priority))
+        return self.status(job_id)
+
+    def status(self, job_id: int) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        with self._wake:
+            pool = self._pool if self._current == job_id else None
+        if pool is not None:
+            job['live'] = {'files': pool.total, 'done': pool.success, 'failed': pool.failed - pool.cancelled,
+                           'cancelled': pool.cancelled, 'bytes': pool.progress.received()}
+        return job
+
+    def daemon_status(self) -> dict:
+        status = {'uptime_s': round(time.time() - self.started, 1), 'running': self._current,
+                  'jobs': self.store.counts()}
+        if self.info is not None:
+            status.update(self.info())
+        return status
+
+    def stop(self) -> None:
+        with self._wake:
+            self._stopping = True
+            if self._pool is not None:
+                self._pool.stop.set()
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _attach(self, pool) -> None:
+        with self._wake:
+            self._pool = pool
+            if self._stopping or self.store.get(self._current)['state'] == 'cancelled':
+                pool.stop.set()
+
+    def _run(self) -> None:
+        while True:
+            with self._wake:
+                while not self._stopping:
+                    job = self.store.next_queued()
+                    if job is not None:
+                        self._current = job['id']
+                        break
+                    self._wake.wait()
+                if self._stopping:
+                    return
+            try:
+                result = self.run_job(job['request'], self._attach)
+                error = None
+            except Exception as e:
+                result, error = None, f"{type(e).__name__}: {e}"
+            with self._wake:
+                self._current = None
+                self._pool = None
+                stopping = self._stopping
+            if stopping and self.store.get(job['id'])['state'] == 'running':
+                # shut down mid-job: leave it 'running' so the next start resumes it
+                return
+            state = 'failed' if error or (result or {}).get('failed') else 'done'
+            self.store.update(job['id'], only_if='running', state=state, finished=time.time(),
+                              result=result, error=error)
+            self.store.update(job['id'], only_if='cancelled', finished=time.time(), result=result)
+
+
+def make_handler(daemon: JobDaemon):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        server_version = 'tamil-mp3-downloader'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body) -> None:
+            data = json.dumps(body, indent=1).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _refused(self) -> bool:
+            """Answer 403 to requests from anywhere but a local client (see the module docstring)."""
+            host = urlsplit('//' + self.headers.get('Host', '')).hostname
+            origin = self.headers.get('Origin')
+            if host in LOCAL_HOSTS and (origin is None or urlsplit(origin).hostname in LOCAL_HOSTS):
+                return False
+            self._send(403, {'error': 'only local clients may use this API'})
+            return True
+
+        def _body(self) -> dict:
+            length = int(self.headers.get('Content-Length') or 0)
+            data = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError('expected a JSON object')
+            return data
+
+        def _job_id(self, parts) -> Optional[int]:
+            try:
+                return int(parts[1])
+            except (IndexError, ValueError):
+                return None
+
+        def do_GET(self):
+            if self._refused():
+                return
+            parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+            if parts == ['status']:
+                return self._send(200, daemon.daemon_status())
+            if parts == ['jobs']:
+                return self._send(200, daemon.store.list())
+            if parts == ['limit'] and daemon.limits is not None:
+                return self._send(200, daemon.limits({}))
+            if len(parts) == 2 and parts[0] == 'jobs':
+                job = daemon.status(self._job_id(parts)) if self._job_id(parts) is not None else None
+                return self._send(200, job) if job is not None else self._send(404, {'error': 'no such job'})
+            self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self._refused():
+                return
+            if self.headers.get('Content-Type', '').split(';', 1)[0].strip().lower() != 'application/json':
+                return self._send(415, {'error': 'send the request body as Content-Type: application/json'})
+            parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+            try:
+                body = self._body()
+                if parts == ['jobs']:
+                    return self._send(201, daemon.submit(body))
+                if parts == ['limit'] and daemon.limits is not None:
+                    return self._send(200, daemon.limits({key: body[key] for key in ('rate', 'host') if key in body}))
+                if len(parts) == 3 and parts[0] == 'jobs' and self._job_id(parts) is not None:
+                    if parts[2] == 'cancel':
+                        job = daemon.cancel(self._job_id(parts))
+                    elif parts[2] == 'priority':
+                        job = daemon.set_priority(self._job_id(parts), int(body['priority']))
+                    else:
+                        return self._send(404, {'error': 'not found'})
+                    return self._send(200, job) if job is not None else self._send(404, {'error': 'no such job'})
+            except (ValueError, KeyError, TypeError) as e:
+                return self._send(400, {'error': str(e)})
+            self._send(404, {'error': 'not found'})
+
+        def do_DELETE(self):
+            if self._refused():
+                return
+            parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+            if len(parts) == 2 and parts[0] == 'jobs' and self._job_id(parts) is not None:
+                job = daemon.cancel(self._job_id(parts))
+                return self._send(200, job) if job is not None else self._send(404, {'error': 'no such job'})
+            self._send(404, {'error': 'not found'})
+
+    return Handler
+
+
+def serve(daemon: JobDaemon, port: int = DEFAULT_PORT) -> None:
+    """Run the API until Ctrl-C or SIGTERM; the running job is left to resume on the next start."""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(daemon))
+    server.daemon_threads = True
+
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _terminate)
+    daemon.start()
+    print(f"Listening on http://127.0.0.1:{server.server_address[1]}/ (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.stop()
+        daemon.store.close()
@@ -1,84 +1,809 @@
 from pathlib import Path
-import requests
-from urllib.parse import unquote
-from clint.textui import progress
+from typing import Callable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import unquote, urlsplit
 from colorama import Fore, Style
+from utils.session import get_session, DEFAULT_TIMEOUT
+from utils.store import ContentStore, materialize
+from utils.ratelimit import RateLimiter
+from utils.telemetry import Telemetry
+from utils.progress import Progress
+from utils.manifest import Manifests
+from utils.verify import CorruptDownload, StreamVerifier, is_fatal
+from utils.schedule import Scheduler
+from utils.segmented import DEFAULT_SEGMENT_THRESHOLD, RangeNotHonoured, SegmentState, fetch_segments
+from utils.retry import (
+    CircuitBreaker,
+    CircuitOpen,
+    IncompleteDownload,
+    DEFAULT_RETRIES,
+    TRANSIENT,
+    backoff_delay,
+    classify_error,
+    retry_after,
+)
+
+if TYPE_CHECKING:
+    import requests
+    from utils.planner import ThroughputLog
+    from utils.library import Library
 
 AUDIO_EXTS = ('.wav', '.mp3', '.mp4', '.m4a', '.aac', '.flac')
 
+# Number of files fetched in parallel and the cap on simultaneous
+# connections to any single host (friendstamilmp3.in throttles bursts).
+DEFAULT_WORKERS = 4
+DEFAULT_PER_HOST = 4
+
 BLUE_COLOR = Fore.BLUE
+SUCCESS_COLOR = Fore.GREEN
+ERROR_COLOR = Fore.RED
 RESET = Style.RESET_ALL
 
 def _is_audio(href: str) -> bool:
     return bool(href) and href.lower().endswith(AUDIO_EXTS)
 
 
-def download_links(links, base_url, out_dir: Path, chunk_size: int = 256):
+def _build_file_url(href: str, base_url: str) -> str:
+    if href.startswith('http://') or href.startswith('https://'):
+        return href
+    return base_url.rstrip('/') + '/' + href.lstrip('/')
+
+
+class HostLimiter:
+    """Hand out one semaphore per host so no host sees more than `per_host` connections."""
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST):
+        self.per_host = max(1, int(per_host))
+        self._lock = threading.Lock()
+        self._sems = {}
+
+    def for_url(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self._sems[host] = sem
+            return sem
+
+    def try_acquire(self, url: str, count: int) -> int:
+        """Take up to `count` more connection slots for url's host without waiting; returns how many."""
+        sem = self.for_url(url)
+        granted = 0
+        while granted < count and sem.acquire(blocking=False):
+            granted += 1
+        return granted
+
+    def release(self, url: str, count: int) -> None:
+        sem = self.for_url(url)
+        for _ in range(count):
+            sem.release()
+
+
+PART_SUFFIX = '.part'
+# Next to a plain `<name>.part`: the ETag (or Last-Modified) its bytes came with, sent as
+# If-Range on resume so a file that changed on the server starts over instead of being spliced
+VALIDATOR_SUFFIX = '.validator'
+
+# Streaming write path: read sizes adapt between these bounds (see _adaptive_chunks) and
+# the whole run never holds more than MEMORY_BUDGET bytes of chunks + write buffers.
+INITIAL_CHUNK_SIZE = 64 * 1024
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+TARGET_READ_SECONDS = 0.1
+MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+class DownloadCancelled(Exception):
+    """Raised inside a transfer when the user interrupted the run (the .part file is kept)."""
+
+
+def part_path_for(out_path: Path) -> Path:
+    return out_path.with_name(out_path.name + PART_SUFFIX)
+
+
+def _validator_path(part_path: Path) -> Path:
+    return part_path.with_name(part_path.name + VALIDATOR_SUFFIX)
+
+
+def _save_validator(part_path: Path, headers) -> None:
+    """Remember the validator of the response a fresh .part file is written from."""
+    etag = headers.get('ETag')
+    # If-Range needs a strong ETag, so a weak one falls back to the date
+    value = etag if etag and not etag.startswith('W/') else headers.get('Last-Modified')
+    try:
+        if value:
+            _validator_path(part_path).write_text(value, encoding='utf-8')
+        else:
+            _drop_validator(part_path)
+    except OSError:
+        pass
+
+
+def _load_validator(part_path: Path) -> Optional[str]:
+    try:
+        return _validator_path(part_path).read_text(encoding='utf-8').strip() or None
+    except OSError:
+        return None
+
+
+def _drop_validator(part_path: Path) -> None:
+    try:
+        _validator_path(part_path).unlink()
+    except OSError:
+        pass
+
+
+def _part_progress(out_path: Path) -> int:
+    """Bytes of out_path received so far: the .part file's size, or for a segmented download
+    (whose .part is preallocated) what its ranges got."""
+    part_path = part_path_for(out_path)
+    received = SegmentState.saved_progress(part_path)
+    if received is not None:
+        return received
+    try:
+        return part_path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _content_range_start(header: str) -> int:
+    """Return the first byte offset from a 'bytes start-end/total' Content-Range header (-1 if absent)."""
+    try:
+        return int(header.split(' ', 1)[1].split('-', 1)[0])
+    except Exception:
+        return -1
+
+
+def _content_range_total(header: str) -> int:
+    """Return the total size from a Content-Range header such as 'bytes */1234' (-1 if unknown)."""
+    try:
+        return int(header.rsplit('/', 1)[1])
+    except Exception:
+        return -1
+
+
+def _adaptive_chunks(req: 'requests.Response', first_size: int, max_size: int,
+                     limiter: RateLimiter = None):
+    """Yield body chunks whose size follows the observed bandwidth.
+
+    Each read is sized to carry roughly TARGET_READ_SECONDS worth of data, clamped to
+    [MIN_CHUNK_SIZE, max_size]. Fast links get few large reads (little Python overhead per
+    MB) while slow links still report progress regularly. Under a bandwidth limit reads are
+    further capped to the transfer's fair share (see RateLimiter.fair_chunk).
+    """
+    raw = req.raw
+    size = max(MIN_CHUNK_SIZE, min(int(first_size or INITIAL_CHUNK_SIZE), max_size))
+    while True:
+        if limiter is not None:
+            size = min(size, limiter.fair_chunk(max_size, MIN_CHUNK_SIZE))
+        t0 = time.perf_counter()
+        chunk = raw.read(size, decode_content=True)
+        if not chunk:
+            return
+        elapsed = time.perf_counter() - t0
+        yield chunk
+        if elapsed > 0:
+            wanted = int(len(chunk) / elapsed * TARGET_READ_SECONDS)
+            # grow/shrink by at most 4x per step so one stall doesn't collapse the size
+            size = max(MIN_CHUNK_SIZE, min(max_size, size * 4, max(size // 4, wanted)))
+        else:
+            size = min(max_size, size * 2)
+
+
+def _finish_with_store(store: ContentStore, out_path: Path, size: int, etag: str, digest: str,
+                       file_url: str) -> str:
+    """Record a finished file; if identical content already exists elsewhere, link to it instead."""
+    status = 'downloaded'
+    existing = store.find_by_hash(digest, size, exclude=out_path)
+    if existing is not None:
+        materialize(existing, out_path)
+        status = 'deduplicated'
+    store.record(out_path, size, etag, digest, file_url)
+    return status
+
+
+def _complete(headers, file_url: str, part_path: Path, out_path: Path,
+              verifier: StreamVerifier, expected: int, store: ContentStore = None,
+              manifests: Manifests = None) -> str:
+    """Check a fully received .part file, move it into place and record it."""
+    result = verifier.result()
+    if expected and result['size'] < expected:
+        raise IncompleteDownload(f"connection closed after {result['size']} of {expected} bytes")
+    if is_fatal(result['problem']):
+        # not worth resuming: the next run should fetch it from scratch
+        part_path.unlink()
+        _drop_validator(part_path)
+        raise CorruptDownload(f"{result['problem']} ({result['size']} bytes)")
+    # atomic on the same filesystem: readers never see a half-written song
+    os.replace(str(part_path), str(out_path))
+    _drop_validator(part_path)
+    etag = headers.get('ETag')
+    status = 'downloaded'
+    if store is not None:
+        status = _finish_with_store(store, out_path, result['size'], etag, result['sha256'], file_url)
+    if manifests is not None:
+        manifests.record(out_path, dict(result, url=file_url, etag=etag,
+                                        last_modified=headers.get('Last-Modified')))
+    return status
+
+
+def _finish_segmented(state: SegmentState, file_url: str, out_path: Path,
+                      store: ContentStore = None, manifests: Manifests = None) -> str:
+    """Check a reassembled segmented file and move it into place.
+
+    Ranges arrive out of order, so unlike a single stream the file is hashed and sniffed by
+    reading it back once (usually straight from the page cache).
+    """
+    verifier = StreamVerifier()
+    verifier.resume(state.part_path)
+    headers = {'ETag': state.etag, 'Last-Modified': state.last_modified}
+    try:
+        status = _complete(headers, file_url, state.part_path, out_path, verifier, state.size, store, manifests)
+    except CorruptDownload:
+        state.discard()
+        raise
+    state.discard(with_part=False)
+    return status
+
+
+def _fetch_segmented(session: 'requests.Session', file_url: str, out_path: Path, state: SegmentState,
+                     first: 'requests.Response', first_index: int, chunk_size: int, label: str,
+                     progress: Progress, stop: threading.Event, max_chunk: int, limiter: RateLimiter,
+                     store: ContentStore, probe: dict, manifests: Manifests, segments: int,
+                     host_slots: HostLimiter) -> str:
+    """Download the pending ranges of `state` over several connections (see utils.segmented)."""
+    host = urlsplit(file_url).netloc.lower()
+    parallel = max(1, min(int(segments), len(state.pending())))
+    # each connection holds its own read buffer; keep the transfer within one worker's share
+    max_chunk = max(MIN_CHUNK_SIZE, max_chunk // parallel)
+    transfer = progress.start(label, state.size, state.received()) if progress is not None else None
+    lock = threading.Lock()
+
+    def on_bytes(count: int) -> None:
+        with lock:
+            if transfer is not None:
+                transfer.done += count
+            if probe is not None:
+                probe['bytes'] += count
+
+    def read_chunks(resp):
+        if limiter is not None:
+            limiter.register()
+        try:
+            for chunk in _adaptive_chunks(resp, chunk_size, max_chunk, limiter):
+                if limiter is not None:
+                    limiter.throttle(host, len(chunk), stop)
+                yield chunk
+        finally:
+            if limiter is not None:
+                limiter.unregister()
+
+    extra = release = None
+    if host_slots is not None:
+        extra = lambda n: host_slots.try_acquire(file_url, n)  # noqa: E731
+        release = lambda n: host_slots.release(file_url, n)  # noqa: E731
+    try:
+        fetch_segments(session, file_url, state, first, first_index, parallel, read_chunks,
+                       DEFAULT_TIMEOUT, stop, extra, release, on_bytes)
+    except RangeNotHonoured:
+        state.discard()
+        raise
+    finally:
+        if transfer is not None:
+            progress.end(transfer)
+    if stop is not None and stop.is_set():
+        raise DownloadCancelled(file_url)
+    return _finish_segmented(state, file_url, out_path, store, manifests)
+
+
+def _link_from_store(session: 'requests.Session', file_url: str, out_path: Path, part_path: Path,
+                     store: ContentStore, manifests: Manifests, probe: dict) -> bool:
+    """Link out_path from a stored copy if a HEAD shows file_url still has the recorded size+ETag."""
+    resp = session.head(file_url, timeout=DEFAULT_TIMEOUT, allow_redirects=True)
+    if probe is not None:
+        probe['http_status'] = resp.status_code
+        probe['_headers_s'] = resp.elapsed.total_seconds()
+    if resp.status_code != 200:
+        # let the GET report (and retry) whatever went wrong
+        return False
+    try:
+        size = int(resp.headers.get('content-length') or 0)
+    except ValueError:
+        size = 0
+    etag = resp.headers.get('ETag')
+    existing = store.find_by_key(size, etag, file_url)
+    if existing is None or os.path.abspath(existing) == os.path.abspath(out_path):
+        return False
+    materialize(existing, out_path)
+    try:
+        part_path.unlink()
+    except OSError:
+        pass
+    _drop_validator(part_path)
+    digest = store.hash_for_key(size, etag, file_url)
+    store.record(out_path, size, etag, digest, file_url)
+    if manifests is not None:
+        # same content as `existing`, so its entry (kind, warnings) applies here too
+        manifests.record(out_path, dict(manifests.get(existing) or {}, size=size, sha256=digest,
+                                        url=file_url, etag=etag, last_modified=resp.headers.get('Last-Modified')))
+    return True
+
+
+def _fetch_to_file(session: 'requests.Session', file_url: str, out_path: Path, chunk_size: int,
+                   label: str = '', progress: Progress = None, stop: threading.Event = None,
+                   max_chunk: int = MAX_CHUNK_SIZE, limiter: RateLimiter = None,
+                   store: ContentStore = None, probe: dict = None, manifests: Manifests = None,
+                   segments: int = 1, segment_threshold: int = DEFAULT_SEGMENT_THRESHOLD,
+                   host_slots: HostLimiter = None) -> str:
+    """Stream one URL into out_path, resuming from an existing .part file when possible.
+
+    Bytes are written to `<name>.part` and renamed into place only once the body is complete,
+    so an interrupted or failed transfer leaves a .part file that the next run picks up with a
+    Range request, sent with If-Range and the ETag/Last-Modified kept in `<name>.part.validator`
+    so a file changed on the server meanwhile is fetched whole again. Servers that ignore Range
+    (plain 200) simply restart the file from zero.
+
+    With a content store, a URL the store has seen before is first asked for its headers with
+    HEAD; if its size+ETag are still the same, the file is linked from the existing copy
+    without a GET ('linked'). Copies at other URLs can only be recognised by their hash once
+    downloaded: such a file is replaced by a link to the existing one ('deduplicated').
+    Otherwise returns 'downloaded'.
+
+    The body is checked as it streams (see utils.verify): its length against Content-Length,
+    its SHA-256, and its first bytes against the MP3/FLAC/M4A/... signatures. An HTML or text
+    body raises CorruptDownload. With `manifests` each file's result goes into the folder's
+    `.manifest.json`.
+
+    With segments > 1, a fresh file of at least segment_threshold bytes from a server that
+    sends Accept-Ranges is split into ranges fetched over several connections (as many as
+    `host_slots` can spare) and written into a preallocated .part file at their offsets;
+    `<name>.part.segments` lets the next run resume each range.
+    `progress` is told when the body starts and how far it got (shown under `label`).
+    `probe` (a Telemetry transfer record) receives the HTTP status, header time and bytes read.
+    Raises on any failure.
+    """
+    part_path = part_path_for(out_path)
+    # an interrupted segmented download resumes range by range, whatever the current settings
+    state = SegmentState.load(part_path)
+    offset = 0
+    if store is not None and state is None and store.knows_url(file_url) \
+            and _link_from_store(session, file_url, out_path, part_path, store, manifests, probe):
+        return 'linked'
+    if state is not None:
+        pending = state.pending()
+        if not pending:
+            # every range arrived before the last run stopped; only the check and rename are left
+            return _finish_segmented(state, file_url, out_path, store, manifests)
+        headers = {'Range': state.range_header(pending[0])}
+        if state.validator():
+            headers['If-Range'] = state.validator()
+    else:
+        try:
+            offset = part_path.stat().st_size
+        except OSError:
+            offset = 0
+        headers = None
+        if offset:
+            headers = {'Range': f'bytes={offset}-'}
+            validator = _load_validator(part_path)
+            if validator:
+                # a changed file is answered with its whole new body (200) instead of the range
+                headers['If-Range'] = validator
+
+    req = session.get(file_url, stream=True, timeout=DEFAULT_TIMEOUT, headers=headers)
+    try:
+        if probe is not None:
+            probe['http_status'] = req.status_code
+            probe['_headers_s'] = req.elapsed.total_seconds()
+        if state is not None:
+            start = state.ranges[pending[0]][0] + state.ranges[pending[0]][2]
+            if req.status_code == 206 and _content_range_start(req.headers.get('content-range', '')) == start:
+                return _fetch_segmented(session, file_url, out_path, state, req, pending[0], chunk_size,
+                                        label, progress, stop, max_chunk, limiter, store, probe,
+                                        manifests, segments, host_slots)
+            if req.status_code not in (200, 416):
+                # e.g. a 503: keep the segments for the retry
+                req.raise_for_status()
+            # the file changed on the server (If-Range answered with the whole body) or the
+            # range is gone: drop the segments and download it again
+            state.discard()
+            if req.status_code != 200:
+                req.close()
+                req = session.get(file_url, stream=True, timeout=DEFAULT_TIMEOUT)
+                if probe is not None:
+                    probe['http_status'] = req.status_code
+        if offset and req.status_code == 416:
+            # nothing left to fetch: the .part already holds the whole file if its size matches
+            total = _content_range_total(req.headers.get('content-range', ''))
+            if total == offset:
+                verifier = StreamVerifier()
+                verifier.resume(part_path)
+                return _complete(req.headers, file_url, part_path, out_path, verifier, total, store, manifests)
+            # stale or oversized .part: drop it and fetch from scratch
+            req.close()
+            part_path.unlink()
+            _drop_validator(part_path)
+            offset = 0
+            req = session.get(file_url, stream=True, timeout=DEFAULT_TIMEOUT)
+            if probe is not None:
+                probe['http_status'] = req.status_code
+        req.raise_for_status()
+        if 'text/html' in req.headers.get('content-type', '').lower():
+            # typically a login or error page served with 200; don't save it as a song
+            raise CorruptDownload(f"server sent an HTML page instead of audio ({req.url})")
+
+        if offset and req.status_code == 206 \
+                and _content_range_start(req.headers.get('content-range', '')) == offset:
+            mode = 'ab'
+        else:
+            # server ignored (or mangled) the Range request: start over
+            mode = 'wb'
+            offset = 0
+
+        length_header = req.headers.get('content-length')
+        try:
+            length = int(length_header) if length_header else 0
+        except Exception:
+            length = 0
+
+        etag = req.headers.get('ETag')
+        total_size = offset + length if length else 0
+
+        if segments > 1 and mode == 'wb' and req.status_code == 200 and total_size >= segment_threshold \
+                and req.headers.get('accept-ranges', '').lower() == 'bytes':
+            # this response becomes the first range; the others get their own connections
+            state = SegmentState.create(part_path, total_size, segments, etag, req.headers.get('Last-Modified'))
+            return _fetch_segmented(session, file_url, out_path, state, req, 0, chunk_size, label, progress,
+                                    stop, max_chunk, limiter, store, probe, manifests, segments, host_slots)
+
+        # hash and sniff while streaming; a resumed file first feeds the bytes it already has
+        verifier = StreamVerifier()
+        if mode == 'ab':
+            verifier.resume(part_path)
+        else:
+            _save_validator(part_path, req.headers)
+
+        # the download loop only bumps a counter; the progress thread draws at its own pace
+        transfer = progress.start(label, total_size, offset) if progress is not None else None
+        host = urlsplit(file_url).netloc.lower()
+        if limiter is not None:
+            limiter.register()
+        # a large userspace buffer turns many socket reads into few write() syscalls
+        try:
+            with open(str(part_path), mode, buffering=WRITE_BUFFER_SIZE) as fh:
+                done = 0
+                for chunk in _adaptive_chunks(req, chunk_size, max_chunk, limiter):
+                    if stop is not None and stop.is_set():
+                        raise DownloadCancelled(file_url)
+                    if limiter is not None:
+                        limiter.throttle(host, len(chunk), stop)
+                    fh.write(chunk)
+                    verifier.feed(chunk)
+                    done += len(chunk)
+                    if probe is not None:
+                        probe['bytes'] += len(chunk)
+                    if transfer is not None:
+                        transfer.done += len(chunk)
+        finally:
+            if limiter is not None:
+                limiter.unregister()
+            if transfer is not None:
+                progress.end(transfer)
+        return _complete(req.headers, file_url, part_path, out_path, verifier, total_size, store, manifests)
+    finally:
+        req.close()
+
+
+def max_chunk_for(workers: int) -> int:
+    """Largest read size allowed so `workers` parallel transfers stay within MEMORY_BUDGET."""
+    per_transfer = MEMORY_BUDGET // max(1, int(workers)) - WRITE_BUFFER_SIZE
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, per_transfer))
+
+
+def audio_paths(links, base_url, out_dir: Path) -> Iterator[Tuple[str, str, Path]]:
+    """Yield (href, file_url, out_path) for the audio files among listing hrefs."""
+    for href in links:
+        if not _is_audio(href):
+            continue
+        filename = unquote(href).split('/')[-1]
+        yield href, _build_file_url(href, base_url), Path(out_dir) / filename
+
+
+def audio_items(links, base_url, out_dir: Path) -> List[Tuple[str, Path]]:
+    """Turn listing hrefs into (file_url, out_path) pairs, keeping only audio files."""
+    return [(file_url, out_path) for _, file_url, out_path in audio_paths(links, base_url, out_dir)]
+
+
+def download_links(links, base_url, out_dir: Path, chunk_size: int = INITIAL_CHUNK_SIZE,
+                   workers: int = DEFAULT_WORKERS, per_host: int = DEFAULT_PER_HOST,
+                   session: 'requests.Session' = None, limiter: RateLimiter = None,
+                   telemetry: Telemetry = None, manifests: Manifests = None, library: 'Library' = None):
     """Download audio links from a list of hrefs.
 
     links: iterable of href strings (maybe absolute or relative)
     base_url: used to build absolute URL for relative hrefs
     out_dir: Path object for destination directory
-    chunk_size: chunk size for streaming
+    chunk_size: initial read size; later reads adapt to the measured bandwidth
+    workers: number of files downloaded in parallel
+    per_host: maximum simultaneous connections to any one host
+    session: pooled session to reuse (defaults to the shared one from utils.session)
+    limiter: optional utils.ratelimit.RateLimiter shared by all transfers
+    telemetry: optional utils.telemetry.Telemetry that records per-file timings and outcomes
+    manifests: optional utils.manifest.Manifests receiving each file's hash, format check and tags
+    library: optional utils.library.Library indexing each finished file (needs manifests)
+
+    Files are streamed into `<name>.part` and resumed with HTTP Range on the next run if a
+    transfer fails or is interrupted.
 
     Returns: (total_audio, success_count, failed_count)
     """
-    # Normalize links to a list so we can count and enumerate audio files
-    link_list = list(links)
-    audio_links = [h for h in link_list if _is_audio(h)]
-    total_audio = len(audio_links)
-    success = 0
-    failed = 0
-
-    # enumerate audio links so we can show the index number (1-based)
-    for idx, href in enumerate(audio_links, start=1):
-        if href.startswith('http://') or href.startswith('https://'):
-            file_url = href
+    items = audio_items(links, base_url, out_dir)
+    return download_items(items, chunk_size, workers, per_host, session, limiter, telemetry=telemetry,
+                          manifests=manifests, library=library)
+
+
+class DownloadPool:
+    """Worker pool that files can be added to while it is already downloading.
+
+    Used as a context manager: leaving the block normally waits for every queued file,
+    while an exception (e.g. Ctrl-C) stops in-flight transfers at their next chunk, keeps
+    their .part files and drops whatever is still queued. Messages printed while the pool
+    runs should go through log() so they don't tear the live progress display.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, per_host: int = DEFAULT_PER_HOST,
+                 session: 'requests.Session' = None, chunk_size: int = INITIAL_CHUNK_SIZE,
+                 progress: Progress = None, limiter: RateLimiter = None,
+                 retries: int = DEFAULT_RETRIES, breaker: CircuitBreaker = None,
+                 store: ContentStore = None, telemetry: Telemetry = None,
+                 manifests: Manifests = None, segments: int = 1,
+                 segment_threshold: int = DEFAULT_SEGMENT_THRESHOLD,
+                 throughput: 'ThroughputLog' = None, order: str = 'page',
+                 on_finish: Callable[[str, Path, bool, Optional[BaseException]], None] = None,
+                 library: 'Library' = None):
+        self.workers = max(1, int(workers or 1))
+        # transient failures (resets, timeouts, 5xx) are retried with jittered backoff, and a
+        # host that keeps failing has its circuit opened so queued files don't each time out
+        self.retries = max(0, int(retries))
+        self.breaker = breaker or CircuitBreaker()
+        # shared bandwidth limit; kept even at rate 0 so it can be tightened while running
+        self.limiter = limiter
+        # optional content index: songs shared between collections are stored once
+        self.store = store
+        # optional per-folder .manifest.json recording each file's hash, format and warnings
+        self.manifests = manifests
+        # optional searchable index of finished songs, filled from their manifest entries
+        # (tags included), so it needs the manifests too
+        self.library = library if manifests is not None else None
+        # optional per-file metrics (timings, throughput, retries) for --report
+        self.telemetry = telemetry
+        # optional log of each run's overall rate, which the planner's ETA is based on
+        self.throughput = throughput
+        self._started = None
+        # called as on_finish(file_url, out_path, ok, error) from the worker when a file is done
+        # (not for files dropped by cancel())
+        self.on_finish = on_finish
+        self.session = session or get_session()
+        self.chunk_size = chunk_size
+        self.host_limiter = HostLimiter(per_host)
+        # large files may be split over up to `segments` connections, taken from the per-host
+        # slots other workers leave free
+        self.segments = max(1, int(segments or 1))
+        self.segment_threshold = segment_threshold
+        self.max_chunk = max_chunk_for(self.workers)
+        # one live line per active transfer plus an overall bar (log lines when not a terminal);
+        # finished files are printed above it
+        self.progress = progress or Progress()
+        # set on Ctrl-C so in-flight transfers stop at the next chunk and keep their .part files
+        self.stop = threading.Event()
+        self.total = 0
+        self.success = 0
+        self.failed = 0
+        # of the failed files, those stopped by cancel() rather than by an error
+        self.cancelled = 0
+        # files satisfied from (or collapsed into) a copy already on disk
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        # queued files wait here; each worker task takes whichever file the policy says is next
+        self.order = order
+        self._queue = Scheduler(order)
+        self._futures = []
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='download')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.cancel()
         else:
-            file_url = base_url.rstrip('/') + '/' + href.lstrip('/')
+            self.wait()
+        return False
 
-        filename = unquote(href).split('/')[-1]
-        out_path = out_dir / filename
+    def add(self, items, sizes: dict = None) -> None:
+        """Queue (file_url, out_path) pairs; they start as soon as a worker is free.
 
-        try:
-            req = requests.get(file_url, stream=True, timeout=30)
-            req.raise_for_status()
-        except Exception:
-            failed += 1
-            continue
+        `sizes` maps file_url -> bytes the listing shows, used by the size-based orders.
+        """
+        items = list(items)
+        # queue the whole batch before any worker picks from it, and count it first so labels
+        # and the overall bar show the real total
+        with self._lock:
+            if self._started is None and items:
+                self._started = time.monotonic()
+            first = self.total + 1
+            self.total += len(items)
+            for idx, (file_url, out_path) in enumerate(items, first):
+                out_path = Path(out_path)
+                self._queue.push((idx, file_url, out_path), (sizes or {}).get(file_url),
+                                 (urlsplit(file_url).netloc.lower(), str(out_path.parent)))
+        self.progress.queued(len(items))
+        for _ in items:
+            self._futures.append(self._pool.submit(self._next))
 
-        try:
-            with open(str(out_path), 'wb') as fh:
-                length_header = req.headers.get('content-length')
-                try:
-                    length = int(length_header) if length_header else 0
-                except Exception:
-                    length = 0
-
-                # expected_size for the progress bar should be number of chunks
-                # but for user-friendly display show the size in MB
-                if length:
-                    # compute number of chunks (at least 1) for progress bar
-                    expected_chunks = max(1, int(length // chunk_size))
-                    size_mb = length / (1024 * 1024)
-                    size_display = f"{size_mb:.2f} MB"
-                else:
-                    expected_chunks = None
-                    size_display = 'Unknown size'
-
-                # label includes download icon, index, total and size in MB
-                label = f"⬇️  [{idx}/{total_audio}] {filename} ({size_display})"
-                for chunk in progress.bar(req.iter_content(chunk_size), expected_size=expected_chunks, label=label):
-                    if chunk:
-                        fh.write(chunk)
-            success += 1
-        except Exception:
-            failed += 1
+    def _next(self) -> bool:
+        with self._lock:
+            job = self._queue.pop()
+        return self._job(*job) if job is not None else False
+
+    def _job(self, idx: int, file_url: str, out_path: Path) -> bool:
+        filename = out_path.name
+        host = urlsplit(file_url).netloc.lower()
+        # live line label: index and files queued so far (size and speed are drawn next to it)
+        label = f"[{idx}/{self.total}] {filename}"
+        record = self.telemetry.transfer(file_url, out_path) if self.telemetry is not None else None
+        error = None
+        for attempt in range(self.retries + 1):
+            if self.stop.is_set():
+                break
+            probe = False
+            received_before = None
             try:
-                if out_path.exists():
-                    out_path.unlink()
-            except Exception:
-                pass
-            continue
+                probe = self.breaker.before_request(host, self.stop)
+                out_path.parent.mkdir(parents=True, exist_ok=True)
+                received_before = _part_progress(out_path)
+                with self.host_limiter.for_url(file_url), \
+                        (self.telemetry.attempt(record) if record is not None else nullcontext()):
+                    status = _fetch_to_file(self.session, file_url, out_path, self.chunk_size, label,
+                                            self.progress, self.stop, self.max_chunk, self.limiter,
+                                            self.store, record, self.manifests, self.segments,
+                                            self.segment_threshold, self.host_limiter)
+                self.breaker.record_success(host)
+            except (DownloadCancelled, CircuitOpen) as e:
+                error = e
+                break
+            except Exception as e:
+                error = e
+                if classify_error(e) != TRANSIENT:
+                    if getattr(e, 'response', None) is not None or isinstance(e, CorruptDownload):
+                        # the host answered (a 404, an error page sent as 200), so it is alive
+                        self.breaker.record_success(host)
+                    break
+                if received_before is not None and _part_progress(out_path) > received_before:
+                    # cut off mid-body, but the .part grew: the host works and the next
+                    # attempt resumes further on
+                    self.breaker.record_success(host)
+                else:
+                    self.breaker.record_failure(host)
+                if attempt < self.retries:
+                    # the .part file is kept, so the next attempt resumes where this one stopped
+                    delay = retry_after(e)
+                    self.stop.wait(delay if delay is not None else backoff_delay(attempt))
+                continue
+            finally:
+                if probe:
+                    # whatever the outcome, the next caller may probe once the circuit allows it
+                    self.breaker.end_probe(host)
+            if record is not None:
+                self.telemetry.finish(record, status)
+            if status != 'downloaded':
+                with self._lock:
+                    self.deduplicated += 1
+            if self.library is not None:
+                entry = self.manifests.get(out_path)
+                if entry is not None:
+                    self.library.add(out_path, entry)
+            note = f" ({status})" if status != 'downloaded' else ''
+            self.log(SUCCESS_COLOR + f"✅  [{idx}/{self.total}] {filename}{note}" + RESET)
+            if self.on_finish is not None:
+                self.on_finish(file_url, out_path, True, None)
+            return self._count(True)
+
+        cancelled = isinstance(error, DownloadCancelled) or (error is None and self.stop.is_set())
+        if record is not None:
+            self.telemetry.finish(record, 'cancelled' if cancelled else 'failed', error)
+        if not cancelled:
+            self.log(ERROR_COLOR + f"❌  [{idx}/{self.total}] {filename}: {error}" + RESET)
+            if self.on_finish is not None:
+                self.on_finish(file_url, out_path, False, error)
+        else:
+            with self._lock:
+                self.cancelled += 1
+        return self._count(False)
+
+    def log(self, text: str) -> None:
+        """Print a line above the live progress display."""
+        self.progress.message(text)
 
-    return total_audio, success, failed
+    def pending(self) -> int:
+        """Files added but not finished yet (queued or in flight)."""
+        with self._lock:
+            return self.total - self.success - self.failed
+
+    def _count(self, ok: bool) -> bool:
+        self.progress.file_done()
+        with self._lock:
+            if ok:
+                self.success += 1
+            else:
+                self.failed += 1
+        return ok
+
+    def wait(self):
+        """Block until every queued file finished; returns (total, success_count, failed_count)."""
+        try:
+            for fut in list(self._futures):
+                fut.result()
+        except BaseException:
+            # KeyboardInterrupt (or anything else): stop promptly instead of draining the queue
+            self.cancel()
+            raise
+        self._pool.shutdown(wait=True)
+        self.progress.close()
+        if self.store is not None:
+            self.store.flush()
+        if self.manifests is not None:
+            self.manifests.flush()
+        if self.library is not None:
+            self.library.flush()
+        if self.throughput is not None and self._started is not None:
+            self.throughput.record(self.progress.received(), time.monotonic() - self._started)
+            # wait() may run again on leaving the with-block; count this run once
+            self._started = None
+        return self.total, self.success, self.failed
+
+    def cancel(self) -> None:
+        self.stop.set()
+        for fut in self._futures:
+            fut.cancel()
+        self._pool.shutdown(wait=True)
+        self.progress.close()
+        if self.store is not None:
+            self.store.flush()
+        if self.manifests is not None:
+            self.manifests.flush()
+        if self.library is not None:
+            self.library.flush()
+
+
+def download_items(items: List[Tuple[str, Path]], chunk_size: int = INITIAL_CHUNK_SIZE,
+                   workers: int = DEFAULT_WORKERS, per_host: int = DEFAULT_PER_HOST,
+                   session: 'requests.Session' = None, limiter: RateLimiter = None,
+                   retries: int = DEFAULT_RETRIES, breaker: CircuitBreaker = None,
+                   store: ContentStore = None, telemetry: Telemetry = None,
+                   manifests: Manifests = None, segments: int = 1,
+                   segment_threshold: int = DEFAULT_SEGMENT_THRESHOLD, throughput: 'ThroughputLog' = None,
+                   order: str = 'page', sizes: dict = None, library: 'Library' = None):
+    """Download (file_url, out_path) pairs through one worker pool; see download_links.
+
+    Output directories are created as needed, so items may span several folders. `order`
+    is a utils.schedule policy and `sizes` the listing's {file_url: bytes} it may use.
+
+    Returns: (total, success_count, failed_count)
+    """
+    if not items:
+        return 0, 0, 0
+    workers = max(1, min(int(workers or 1), len(items)))
+    with DownloadPool(workers, per_host, session, chunk_size, limiter=limiter, retries=retries,
+                      breaker=breaker, store=store, telemetry=telemetry, manifests=manifests,
+                      segments=segments, segment_threshold=segment_threshold,
+                      throughput=throughput, order=order, library=library) as pool:
+        pool.add(items, sizes)
+        return pool.wait()
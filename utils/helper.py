@@ -1,8 +1,15 @@
-from bs4 import BeautifulSoup
 import re
-from typing import List, Tuple
+import codecs
+from html.parser import HTMLParser
+from typing import Iterable, List, Tuple, Union
 import os
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# Listing parser backends accepted by parse_listing_hrefs / fetch_listing
+PARSER_BACKENDS = ('fast', 'bs4')
 
 
 def ensure_emoji_spacing(s: str) -> str:
@@ -34,7 +41,24 @@ def is_navigation_or_sort_link(href: str) -> bool:
     return False
 
 
-def collect_filtered_hrefs(soup: BeautifulSoup) -> List[str]:
+def is_subdirectory_link(href: str) -> bool:
+    """True for hrefs that point at a directory (trailing '/'), excluding parent/self links.
+
+    Whether the directory really lies below the listing is checked by the crawler after
+    resolving the URL, since some servers render absolute links.
+    """
+    if not href:
+        return False
+    h = href.strip()
+    low = h.lower()
+    if not h.endswith('/') or h in ('/', './', '../'):
+        return False
+    if low.startswith(('?', '#', 'javascript:', 'mailto:')):
+        return False
+    return True
+
+
+def collect_filtered_hrefs(soup: 'BeautifulSoup') -> List[str]:
     hrefs: List[str] = []
     for a in soup.find_all('a', href=True):
         href = a['href']
@@ -44,18 +68,218 @@ def collect_filtered_hrefs(soup: BeautifulSoup) -> List[str]:
     return hrefs
 
 
+def collect_subdirectory_hrefs(soup: 'BeautifulSoup') -> List[str]:
+    return [a['href'] for a in soup.find_all('a', href=True) if is_subdirectory_link(a['href'])]
+
+
+# "Last modified" column of Apache (2024-01-31 10:00, 31-Jan-2024 10:00) and nginx autoindex pages
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}(?::\d{2})?|\d{2}-[A-Za-z]{3}-\d{4} \d{2}:\d{2}(?::\d{2})?')
+# "Size" column: 4.0M / 512K / 123 (Apache) or an exact byte count (nginx)
+_SIZE_RE = re.compile(r'\d+(?:\.\d+)?[KMGT]?')
+
+
+def parse_listing_columns(text: str) -> Optional[dict]:
+    """{'date': ..., 'size': ...} from the text following a file link, or None if it has no date.
+
+    Both values are kept as shown; they are compared between runs, not interpreted.
+    """
+    m = _DATE_RE.search(text)
+    if m is None:
+        return None
+    size = None
+    for token in text[m.end():].split():
+        if _SIZE_RE.fullmatch(token):
+            size = token
+            break
+    return {'date': m.group(0), 'size': size}
+
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size_column(shown: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Bytes a listing's size column stands for: (approximate size, rounding step), or None.
+
+    '4.0M' -> (4194304, 104858): autoindex pages round to the last digit shown, so the real
+    size is only known to within `step`. A plain byte count (nginx) is exact (step 0).
+    """
+    if not shown or not _SIZE_RE.fullmatch(shown):
+        return None
+    unit = shown[-1] if shown[-1].isalpha() else ''
+    number = shown[:-1] if unit else shown
+    scale = _SIZE_UNITS[unit.upper()]
+    if scale == 1:
+        return int(float(number)), 0
+    decimals = len(number.partition('.')[2])
+    return int(float(number) * scale), int(scale / 10 ** decimals)
+
+
+class HrefExtractor(HTMLParser):
+    """Streaming `<a href>` collector for "Index Of" pages.
+
+    Uses the same tokenizer BeautifulSoup's html.parser builder sits on, but keeps only the
+    filtered hrefs instead of a full tree, and can be fed the page chunk by chunk. The text
+    after each file link (the "Last modified" and "Size" columns, in a table row or <pre>
+    line) is collected too: `meta` maps href -> {'date', 'size'} for the files that have them.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs: List[str] = []
+        self.dirs: List[str] = []
+        self.meta = {}
+        # file href whose columns are being collected, and whether we are still in its <a>
+        self._columns_for = None
+        self._in_link = False
+        self._text = []
+
+    def _end_columns(self):
+        if self._columns_for is not None:
+            columns = parse_listing_columns(''.join(self._text))
+            if columns is not None:
+                self.meta[self._columns_for] = columns
+            self._columns_for = None
+            self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._end_columns()
+            return
+        if tag != 'a':
+            return
+        self._end_columns()
+        href = None
+        # like BeautifulSoup, a repeated attribute keeps its last value
+        for name, value in attrs:
+            if name == 'href':
+                href = value
+        if href is None:
+            return
+        if not is_navigation_or_sort_link(href):
+            self.hrefs.append(href)
+            self._columns_for = href
+            self._in_link = True
+        elif is_subdirectory_link(href):
+            self.dirs.append(href)
+
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._in_link = False
+        elif tag == 'tr' or tag == 'pre':
+            self._end_columns()
+
+    def handle_data(self, data):
+        if self._columns_for is not None and not self._in_link:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._end_columns()
+
+
+def extract_listing(chunks: Iterable[Union[bytes, str]], encoding: str = 'utf-8',
+                    meta: Optional[dict] = None) -> Tuple[List[str], List[str]]:
+    """Feed page content (bytes or str, whole or in chunks) through HrefExtractor.
+
+    Returns (file_hrefs, subdirectory_hrefs); pass a dict as `meta` to also receive the
+    listing's date/size columns per file href.
+    """
+    parser = HrefExtractor()
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            parser.feed(chunk)
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    if meta is not None:
+        meta.update(parser.meta)
+    return parser.hrefs, parser.dirs
+
+
+def extract_hrefs(chunks: Iterable[Union[bytes, str]], encoding: str = 'utf-8') -> List[str]:
+    return extract_listing(chunks, encoding)[0]
+
+
+def collect_listing_columns(soup: 'BeautifulSoup') -> dict:
+    """{href: {'date', 'size'}} for the file links of a parsed page, read like HrefExtractor
+    does: the text after each link up to the next link or the end of its row / <pre> block."""
+    meta = {}
+    for a in soup.find_all('a', href=True):
+        href = a['href']
+        if is_navigation_or_sort_link(href):
+            continue
+        block = a.find_parent(['tr', 'pre'])
+        text = []
+        for node in a.next_elements:
+            if node.name is not None:
+                if node.name in ('a', 'tr'):
+                    break
+                continue
+            if block is not None and block not in node.parents:
+                break
+            if a not in node.parents:
+                text.append(str(node))
+        columns = parse_listing_columns(''.join(text))
+        if columns is not None:
+            meta[href] = columns
+    return meta
+
+
+def parse_listing(content: Union[bytes, str], backend: str = 'fast',
+                  meta: Optional[dict] = None) -> Tuple[List[str], List[str]]:
+    """Return (file_hrefs, subdirectory_hrefs) of a listing page using 'fast' or 'bs4'.
+
+    Pass a dict as `meta` to also receive the date/size columns per file href.
+    """
+    if backend == 'bs4':
+        # imported on demand: bs4 (and soupsieve) cost more to import than the fast path parses
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(content, 'html.parser')
+        if meta is not None:
+            meta.update(collect_listing_columns(soup))
+        return collect_filtered_hrefs(soup), collect_subdirectory_hrefs(soup)
+    return extract_listing([content], meta=meta)
+
+
+def parse_listing_hrefs(content: Union[bytes, str], backend: str = 'fast') -> List[str]:
+    """Return the filtered hrefs of a listing page using the chosen backend ('fast' or 'bs4')."""
+    return parse_listing(content, backend)[0]
+
+
 def count_audio_hrefs(hrefs: List[str]) -> int:
     audio_exts = ('.wav', '.mp3', '.mp4', '.m4a', '.aac', '.flac')
     return sum(1 for h in hrefs if h.lower().endswith(audio_exts))
 
 
-def parse_star_selection(sel: str, star_data: List[dict]) -> Tuple[List[dict], List[int]]:
-    """Parse selection string (e.g. 'all', '1', '1,3,5', '2-4') and return (selected_items, missing_ids)."""
+def index_by_id(items: List[dict]) -> dict:
+    """Map each item's integer id to the item; the first of duplicate ids wins."""
+    table = {}
+    for item in items:
+        try:
+            table.setdefault(int(item.get('id')), item)
+        except Exception:
+            continue
+    return table
+
+
+def parse_star_selection(sel: str, star_data: List[dict],
+                         by_id: Optional[dict] = None) -> Tuple[List[dict], List[int]]:
+    """Parse selection string (e.g. 'all', '1', '1,3,5', '2-4') and return (selected_items, missing_ids).
+
+    by_id: optional prebuilt index_by_id(star_data) (e.g. from the catalog index) so repeated
+    selections don't rebuild it; each id is then a dict lookup instead of a scan of the list.
+    """
     sel = (sel or '').strip().lower()
     if not sel:
         return [], []
     if sel in ('all', 'a'):
         return list(star_data), []
+    if by_id is None:
+        by_id = index_by_id(star_data)
 
     parts = [p.strip() for p in sel.split(',') if p.strip()]
     ids = []
@@ -67,7 +291,11 @@ def parse_star_selection(sel: str, star_data: List[dict]) -> Tuple[List[dict], L
                 end = int(end_s)
                 if start > end:
                     start, end = end, start
-                ids.extend(range(start, end + 1))
+                if end - start > len(by_id):
+                    # a huge range ('1-99999') only picks the ids that exist
+                    ids.extend(i for i in sorted(by_id) if start <= i <= end)
+                else:
+                    ids.extend(range(start, end + 1))
             except Exception:
                 continue
         else:
@@ -77,23 +305,13 @@ def parse_star_selection(sel: str, star_data: List[dict]) -> Tuple[List[dict], L
                 continue
 
     seen = set()
-    uniq_ids = []
-    for i in ids:
-        if i not in seen:
-            seen.add(i)
-            uniq_ids.append(i)
-
     selected_items = []
     missing = []
-    for sid in uniq_ids:
-        found = None
-        for item in star_data:
-            try:
-                if int(item.get('id')) == sid:
-                    found = item
-                    break
-            except Exception:
-                continue
+    for sid in ids:
+        if sid in seen:
+            continue
+        seen.add(sid)
+        found = by_id.get(sid)
         if found:
             selected_items.append(found)
         else:
@@ -0,0 +1,226 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from utils.manifest import MANIFEST_NAME, load_manifest
+
+# Rows buffered before they are written in one transaction
+COMMIT_EVERY = 50
+# Fields a query can be narrowed to, as in "artist:ilaiyaraaja title:raja"
+SEARCH_FIELDS = ('title', 'artist', 'album', 'album_artist', 'genre', 'year', 'name')
+
+_COLUMNS = ('path', 'folder', 'name', 'title', 'artist', 'album', 'album_artist', 'track', 'year',
+            'genre', 'duration', 'bitrate', 'sample_rate', 'kind', 'size', 'sha256', 'url', 'updated')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    album_artist TEXT,
+    track TEXT,
+    year TEXT,
+    genre TEXT,
+    duration REAL,
+    bitrate INTEGER,
+    sample_rate INTEGER,
+    kind TEXT,
+    size INTEGER,
+    sha256 TEXT,
+    url TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist COLLATE NOCASE, album COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_title ON tracks (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_folder ON tracks (folder);
+'''
+
+# Full-text index kept in step with `tracks` by triggers (where SQLite has FTS5)
+_FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, artist, album, album_artist, genre, year, name,
+    content='tracks', tokenize='unicode61 remove_diacritics 2');
+CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts (rowid, title, artist, album, album_artist, genre, year, name)
+    VALUES (new.rowid, new.title, new.artist, new.album, new.album_artist, new.genre, new.year, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, album_artist, genre, year, name)
+    VALUES ('delete', old.rowid, old.title, old.artist, old.album, old.album_artist, old.genre, old.year, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE ON tracks BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, album_artist, genre, year, name)
+    VALUES ('delete', old.rowid, old.title, old.artist, old.album, old.album_artist, old.genre, old.year, old.name);
+    INSERT INTO tracks_fts (rowid, title, artist, album, album_artist, genre, year, name)
+    VALUES (new.rowid, new.title, new.artist, new.album, new.album_artist, new.genre, new.year, new.name);
+END;
+'''
+
+
+def _terms(query: str) -> List[tuple]:
+    """(field or None, word) pairs of a query like 'artist:ilaiyaraaja raja'."""
+    terms = []
+    for word in query.split():
+        field, sep, value = word.partition(':')
+        if sep and field.lower() in SEARCH_FIELDS and value:
+            terms.append((field.lower(), value))
+        else:
+            terms.append((None, word))
+    return terms
+
+
+class Library:
+    """Searchable index of downloaded songs in output/.cache/library.sqlite.
+
+    Rows are made from manifest entries (utils.manifest), whose tags were read from the
+    download stream by utils.tags, so indexing never opens the audio files. Paths are stored
+    relative to the output root. add() buffers rows and writes COMMIT_EVERY of them per
+    transaction (and on flush()); several --queue workers may share the file. Searches use a
+    prefix-matching FTS5 index where SQLite has it, LIKE otherwise.
+    """
+
+    def __init__(self, path: Path, root: Path):
+        self.path = Path(path)
+        self.root = os.path.abspath(root)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._db = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+        try:
+            self._db.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # built without FTS5
+            self.fts = False
+
+    def _row(self, path: Path, entry: dict) -> tuple:
+        rel = Path(os.path.relpath(os.path.abspath(path), self.root))
+        tags = entry.get('tags') or {}
+        row = dict(tags, path=rel.as_posix(), folder=rel.parent.as_posix(), name=rel.name,
+                   kind=entry.get('kind'), size=entry.get('size'), sha256=entry.get('sha256'),
+                   url=entry.get('url'), updated=time.time())
+        return tuple(row.get(column) for column in _COLUMNS)
+
+    def add(self, path: Path, entry: dict) -> None:
+        """Index (or re-index) a downloaded file from its manifest entry."""
+        row = self._row(path, entry)
+        with self._lock:
+            self._pending[row[0]] = row
+            if len(self._pending) >= COMMIT_EVERY:
+                self._write()
+
+    def _write(self) -> None:
+        rows = list(self._pending.values())
+        self._pending.clear()
+        if not rows:
+            return
+        updates = ', '.join(f"{column} = excluded.{column}" for column in _COLUMNS[1:])
+        try:
+            self._db.execute('BEGIN IMMEDIATE')
+            self._db.executemany(f"INSERT INTO tracks ({', '.join(_COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * len(_COLUMNS))}) "
+                                 f"ON CONFLICT (path) DO UPDATE SET {updates}", rows)
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            # a locked or read-only database must not fail the download; the next
+            # --library-import picks these files up from their manifests
+            if self._db.in_transaction:
+                self._db.execute('ROLLBACK')
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write()
+
+    def remove(self, path: Path) -> None:
+        """Drop a deleted file from the index."""
+        rel = Path(os.path.relpath(os.path.abspath(path), self.root)).as_posix()
+        with self._lock:
+            self._pending.pop(rel, None)
+            try:
+                self._db.execute('DELETE FROM tracks WHERE path = ?', (rel,))
+            except sqlite3.Error:
+                # as in _write: the next --library-import drops the row
+                pass
+
+    def import_manifests(self, root: Optional[Path] = None) -> int:
+        """Index every file recorded in the manifests under `root` (the output root by default)
+        and drop rows whose file is gone. Returns how many files were indexed."""
+        root = os.path.abspath(root or self.root)
+        seen = set()
+        count = 0
+        for folder, dirs, files in os.walk(root):
+            # .cache holds the tool's own state, never songs
+            dirs[:] = [d for d in dirs if d != '.cache']
+            if MANIFEST_NAME not in files:
+                continue
+            for name, entry in load_manifest(Path(folder)).items():
+                path = os.path.join(folder, name)
+                if not os.path.exists(path):
+                    continue
+                self.add(Path(path), entry)
+                seen.add(Path(os.path.relpath(path, self.root)).as_posix())
+                count += 1
+        self.flush()
+        with self._lock:
+            prefix = Path(os.path.relpath(root, self.root)).as_posix()
+            rows = self._db.execute('SELECT path FROM tracks').fetchall()
+            gone = [(row['path'],) for row in rows if row['path'] not in seen
+                    and (prefix == '.' or row['path'].startswith(prefix + '/'))]
+            self._db.executemany('DELETE FROM tracks WHERE path = ?', gone)
+        return count
+
+    def search(self, query: str, limit: int = 50) -> List[dict]:
+        """Tracks matching every word of `query` (word prefixes, any case and accent), best first.
+
+        A word may be narrowed to one field, e.g. 'artist:ilaiyaraaja'.
+        """
+        terms = _terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            if self.fts:
+                match = ' AND '.join((f"{field} : " if field else '') + '"' + word.replace('"', '""') + '"*'
+                                     for field, word in terms)
+                rows = self._db.execute('SELECT tracks.* FROM tracks_fts '
+                                        'JOIN tracks ON tracks.rowid = tracks_fts.rowid '
+                                        'WHERE tracks_fts MATCH ? ORDER BY rank LIMIT ?', (match, limit)).fetchall()
+            else:
+                clauses, args = [], []
+                for field, word in terms:
+                    columns = (field,) if field else SEARCH_FIELDS
+                    clauses.append('(' + ' OR '.join(f"{column} LIKE ?" for column in columns) + ')')
+                    args.extend([f"%{word}%"] * len(columns))
+                rows = self._db.execute(f"SELECT * FROM tracks WHERE {' AND '.join(clauses)} "
+                                        "ORDER BY artist, album, track LIMIT ?", args + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM tracks').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._write()
+            self._db.close()
+
+
+def format_track(track: dict) -> str:
+    """One search result: 'Artist - Title (Album, 4:12, 320 kbps)  path'."""
+    title = track['title'] or os.path.splitext(track['name'])[0]
+    head = f"{track['artist']} - {title}" if track['artist'] else title
+    details = [track['album']] if track['album'] else []
+    if track['duration']:
+        minutes, seconds = divmod(int(round(track['duration'])), 60)
+        details.append(f"{minutes}:{seconds:02d}")
+    if track['bitrate']:
+        details.append(f"{track['bitrate']} kbps")
+    return head + (f" ({', '.join(details)})" if details else '') + f"  {track['path']}"
@@ -0,0 +1,68 @@
+import codecs
+from typing import List, Optional, TYPE_CHECKING
+
+from utils.helper import extract_listing, parse_listing
+from utils.listing_cache import ListingCache
+from utils.session import get_session, DEFAULT_TIMEOUT
+
+if TYPE_CHECKING:
+    import requests
+
+
+def _declared_charset(page: 'requests.Response') -> str:
+    """Charset from Content-Type, defaulting to UTF-8 (requests would assume ISO-8859-1)."""
+    content_type = page.headers.get('content-type', '')
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'charset' and value:
+            charset = value.strip('"\' ')
+            try:
+                codecs.lookup(charset)
+                return charset
+            except LookupError:
+                break
+    return 'utf-8'
+
+
+def fetch_index(index_url: str, session: Optional['requests.Session'] = None,
+                cache: Optional[ListingCache] = None, parser: str = 'fast') -> dict:
+    """Fetch an "Index Of" page and return {'hrefs': [...files], 'dirs': [...subdirectories],
+    'meta': {href: {'date', 'size'}}}.
+
+    The 'fast' parser streams the body through HrefExtractor as it arrives; 'bs4' builds a
+    BeautifulSoup tree as before and is kept as a fallback for odd markup. Both read the
+    date/size columns, which --sync, the planner and the size-based --order policies use.
+
+    With a cache, a fresh entry is returned without touching the network and a stale one is
+    revalidated with If-None-Match / If-Modified-Since. Raises on network or HTTP errors.
+    """
+    session = session or get_session()
+    entry = cache.get(index_url) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        return entry['listing']
+
+    headers = cache.conditional_headers(entry) if cache is not None else {}
+    page = session.get(index_url, timeout=DEFAULT_TIMEOUT, headers=headers or None, stream=True)
+    try:
+        if entry is not None and page.status_code == 304:
+            cache.touch(index_url)
+            return entry['listing']
+        page.raise_for_status()
+
+        meta = {}
+        if parser == 'bs4':
+            hrefs, dirs = parse_listing(page.content, 'bs4', meta)
+        else:
+            hrefs, dirs = extract_listing(page.iter_content(64 * 1024), _declared_charset(page), meta)
+    finally:
+        page.close()
+    listing = {'hrefs': hrefs, 'dirs': dirs, 'meta': meta}
+    if cache is not None:
+        cache.put(index_url, listing, page.headers.get('ETag'), page.headers.get('Last-Modified'))
+    return listing
+
+
+def fetch_listing(index_url: str, session: Optional['requests.Session'] = None,
+                  cache: Optional[ListingCache] = None, parser: str = 'fast') -> List[str]:
+    """Fetch an "Index Of" page and return its filtered file hrefs (see fetch_index)."""
+    return list(fetch_index(index_url, session, cache, parser)['hrefs'])
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_PATH = Path('output/.cache/listings.json')
+DEFAULT_TTL = 60 * 60  # seconds a listing is trusted without asking the server
+DEFAULT_MAX_ENTRIES = 500
+# Changes kept in memory before the file (all of it, up to max_entries listings) is rewritten
+SAVE_EVERY = 20
+
+
+class ListingCache:
+    """Persistent cache of parsed "Index Of" pages, keyed by URL.
+
+    Each entry stores the parsed listing (see utils.listing.fetch_index) together with the
+    ETag / Last-Modified validators the server sent. Entries younger than `ttl` are served
+    without any request; older ones are revalidated with a conditional GET so an unchanged
+    listing costs a 304 and no parse. The file holds at most `max_entries` listings; the
+    least recently used are evicted. Saving rewrites the whole file, so it happens every
+    SAVE_EVERY changes and on flush(), which the owner calls before exiting.
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = 0
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._entries = data if isinstance(data, dict) else {}
+            except Exception:
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, separators=(',', ':'))
+            os.replace(tmp, self.path)
+            self._dirty = 0
+        except Exception:
+            # a cache that can't be written is just a slower run
+            pass
+
+    def get(self, url: str) -> Optional[dict]:
+        """Return the cached entry for url (or None) and mark it as recently used."""
+        with self._lock:
+            entry = self._load().get(url)
+            if entry is None or 'meta' not in entry.get('listing', {}):
+                # missing, or written by an older version without the date/size columns
+                return None
+            entry['accessed_at'] = time.time()
+            return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry.get('fetched_at', 0) < self.ttl
+
+    def conditional_headers(self, entry: Optional[dict]) -> dict:
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url: str, listing: dict, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            entries = self._load()
+            entries[url] = {
+                'listing': listing,
+                'etag': etag,
+                'last_modified': last_modified,
+                'fetched_at': now,
+                'accessed_at': now,
+            }
+            self._evict(entries)
+            self._changed()
+
+    def touch(self, url: str) -> None:
+        """Record a successful revalidation (304) so the TTL starts again."""
+        with self._lock:
+            entry = self._load().get(url)
+            if entry is not None:
+                entry['fetched_at'] = entry['accessed_at'] = time.time()
+                self._changed()
+
+    def _changed(self) -> None:
+        self._dirty += 1
+        if self._dirty >= SAVE_EVERY:
+            self._save()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._entries is not None and self._dirty:
+                self._save()
+
+    def _evict(self, entries: dict) -> None:
+        overflow = len(entries) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(entries, key=lambda k: entries[k].get('accessed_at', 0))[:overflow]
+            for key in oldest:
+                del entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._save()
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+# Sidecar written next to the songs of every download folder
+MANIFEST_NAME = '.manifest.json'
+MANIFEST_VERSION = 1
+SAVE_EVERY = 20
+
+
+def manifest_path(folder: Path) -> Path:
+    return Path(folder) / MANIFEST_NAME
+
+
+def load_manifest(folder: Path) -> Dict[str, dict]:
+    """{file name: entry} recorded for one folder ({} when there is no readable manifest)."""
+    try:
+        with open(manifest_path(folder), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception:
+        return {}
+    if data.get('version') != MANIFEST_VERSION:
+        return {}
+    return data.get('files', {})
+
+
+@contextmanager
+def _locked(lock_path: Path):
+    """Hold an exclusive lock on lock_path (fcntl.lockf, which NFS honours) if available."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a') as fh:
+        fcntl.lockf(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(fh, fcntl.LOCK_UN)
+
+
+class Manifests:
+    """Per-folder `.manifest.json` files describing what was downloaded and how it checked out.
+
+    Each entry is keyed by file name and holds at least size, sha256, kind ('mp3', 'flac', ...),
+    problem (None, or a warning from utils.verify), url, etag, last_modified (the server's
+    header), verified (epoch seconds) and, for files that have any, tags (title, artist,
+    duration, ... see utils.tags). Later runs read it instead of re-scanning the files.
+    With --sync an entry also keeps `listing`, the date/size columns the remote listing showed
+    for the file (see utils.sync). Folders are loaded on first use and written every
+    SAVE_EVERY changes and on flush(). Saving merges in entries other processes wrote to the
+    same folder meanwhile (--queue workers may share one), under a lock file where the
+    platform has POSIX locks. The lock files live in `<root>/.cache/locks`, named after each
+    folder's path below `root`, so every worker sharing the output root uses the same ones
+    and the song folders only hold songs. Without a root they go next to each manifest.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = os.path.abspath(root) if root is not None else None
+        self._lock = threading.Lock()
+        self._folders = {}
+        self._dirty = {}
+        # listing columns of files being downloaded by --sync, stored once they are recorded
+        self._expected = {}
+        # names removed per folder, so a save doesn't merge them back in from disk
+        self._removed = {}
+
+    def _files(self, folder: Path) -> Dict[str, dict]:
+        key = os.path.abspath(folder)
+        files = self._folders.get(key)
+        if files is None:
+            files = load_manifest(folder)
+            self._folders[key] = files
+        return files
+
+    def get(self, path: Path) -> Optional[dict]:
+        path = Path(path)
+        with self._lock:
+            return self._files(path.parent).get(path.name)
+
+    def entries(self, folder: Path) -> Dict[str, dict]:
+        with self._lock:
+            return dict(self._files(folder))
+
+    def record(self, path: Path, entry: dict) -> None:
+        path = Path(path)
+        entry = dict(entry, verified=int(time.time()))
+        with self._lock:
+            listing = self._expected.pop(os.path.abspath(path), None)
+            if listing is not None:
+                entry['listing'] = listing
+            self._files(path.parent)[path.name] = entry
+            self._touch(path.parent)
+
+    def expect(self, path: Path, listing: str) -> None:
+        """Store `listing` with the entry the next record() of path writes (a failed download
+        leaves the old entry alone, so the next sync tries again)."""
+        with self._lock:
+            self._expected[os.path.abspath(path)] = listing
+
+    def expected(self, path: Path) -> Optional[str]:
+        with self._lock:
+            return self._expected.get(os.path.abspath(path))
+
+    def adopt(self, path: Path, listing: str, size: Optional[int] = None, url: Optional[str] = None) -> None:
+        """Mark a file already on disk as matching `listing`; files without an entry get a
+        minimal one (size and url, no hash)."""
+        path = Path(path)
+        with self._lock:
+            files = self._files(path.parent)
+            entry = files.get(path.name)
+            if entry is None:
+                entry = files[path.name] = {'size': size, 'url': url}
+            entry['listing'] = listing
+            self._touch(path.parent)
+
+    def remove(self, path: Path) -> None:
+        path = Path(path)
+        with self._lock:
+            if self._files(path.parent).pop(path.name, None) is not None:
+                self._removed.setdefault(os.path.abspath(path.parent), set()).add(path.name)
+                self._touch(path.parent)
+
+    def _touch(self, folder: Path) -> None:
+        key = os.path.abspath(folder)
+        self._dirty[key] = self._dirty.get(key, 0) + 1
+        if self._dirty[key] >= SAVE_EVERY:
+            self._save(key)
+
+    def _lock_path(self, key: str) -> Path:
+        if self.root is None:
+            return Path(str(manifest_path(key)) + '.lock')
+        # relative, so workers mounting the output root at different places agree
+        rel = Path(os.path.relpath(key, self.root)).as_posix()
+        return Path(self.root) / '.cache' / 'locks' / (hashlib.sha1(rel.encode('utf-8')).hexdigest()[:20] + '.lock')
+
+    def _save(self, key: str) -> None:
+        try:
+            path = manifest_path(key)
+            with _locked(self._lock_path(key)):
+                files = self._folders[key]
+                removed = self._removed.get(key, ())
+                for name, entry in load_manifest(key).items():
+                    # written by another process since we loaded the folder
+                    if name not in files and name not in removed:
+                        files[name] = entry
+                tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'version': MANIFEST_VERSION, 'files': files}, f,
+                              ensure_ascii=False, indent=1, sort_keys=True)
+                os.replace(tmp, path)
+            self._dirty[key] = 0
+        except Exception:
+            pass
+
+    def flush(self) -> None:
+        with self._lock:
+            for key, count in list(self._dirty.items()):
+                if count:
+                    self._save(key)
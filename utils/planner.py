@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from utils.downloader import audio_paths
+from utils.helper import parse_size_column
+from utils.progress import format_bytes, format_eta
+
+# Runs kept in the throughput log, and how many of the latest ones the ETA is based on
+HISTORY_SIZE = 20
+RECENT_RUNS = 5
+# Runs that moved less than this are too short to say anything about the link
+MIN_RECORDED_BYTES = 1024 * 1024
+# Warn when the estimate leaves less than this much free space (the sizes are rounded)
+DISK_MARGIN = 0.05
+
+
+def estimate_folders(folders) -> dict:
+    """Files and bytes of crawler output [(folder_url, rel_parts, hrefs, meta), ...].
+
+    Sizes come from the listing's size column only, so nothing is requested per file.
+    Returns {'files', 'sized' (files with a size shown), 'bytes' (sum of those sizes)}.
+    """
+    files = sized = total = 0
+    for folder_url, _, hrefs, meta in folders:
+        for href, _, _ in audio_paths(hrefs, folder_url, Path('.')):
+            files += 1
+            parsed = parse_size_column((meta.get(href) or {}).get('size'))
+            if parsed is not None:
+                sized += 1
+                total += parsed[0]
+    return {'files': files, 'sized': sized, 'bytes': total}
+
+
+def listing_sizes(folders) -> dict:
+    """{file_url: bytes} for the audio files whose size the listing shows (for ordering)."""
+    sizes = {}
+    for folder_url, _, hrefs, meta in folders:
+        for href, file_url, _ in audio_paths(hrefs, folder_url, Path('.')):
+            parsed = parse_size_column((meta.get(href) or {}).get('size'))
+            if parsed is not None:
+                sizes[file_url] = parsed[0]
+    return sizes
+
+
+def estimated_bytes(estimate: dict) -> int:
+    """Total bytes with files the listing shows no size for counted at the average size."""
+    if not estimate['sized']:
+        return 0
+    average = estimate['bytes'] / estimate['sized']
+    return int(estimate['bytes'] + (estimate['files'] - estimate['sized']) * average)
+
+
+def free_space(path: Path) -> Optional[int]:
+    """Free bytes on the filesystem that holds `path` (or its nearest existing parent)."""
+    path = Path(os.path.abspath(path))
+    while not path.exists() and path.parent != path:
+        path = path.parent
+    try:
+        return shutil.disk_usage(str(path)).free
+    except OSError:
+        return None
+
+
+class ThroughputLog:
+    """Overall download rate of recent runs, kept in output/.cache/throughput.json.
+
+    DownloadPool records (bytes, seconds) when it finishes; rate() is what the last
+    RECENT_RUNS runs achieved together, the basis for the planner's ETA.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def _load(self) -> List[list]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                runs = json.load(f)
+            return [run for run in runs if isinstance(run, list) and len(run) == 3]
+        except Exception:
+            return []
+
+    def record(self, received: int, seconds: float) -> None:
+        if received < MIN_RECORDED_BYTES or seconds <= 0:
+            return
+        with self._lock:
+            runs = self._load()
+            runs.append([int(time.time()), int(received), round(seconds, 2)])
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_name(self.path.name + '.tmp')
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(runs[-HISTORY_SIZE:], f)
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+    def rate(self) -> Optional[float]:
+        """Bytes per second over the recent runs, or None before the first recorded run."""
+        with self._lock:
+            recent = self._load()[-RECENT_RUNS:]
+        seconds = sum(run[2] for run in recent)
+        if not seconds:
+            return None
+        return sum(run[1] for run in recent) / seconds
+
+
+def resolve_all(resolve: Callable, keys: List, workers: int = 4) -> List[Optional[Future]]:
+    """Start resolving every key at once; returns one Future per key (None for None keys).
+
+    The futures can be handed to the download stage afterwards, so planning doesn't list
+    anything twice.
+    """
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='plan')
+    futures = [pool.submit(resolve, key) if key is not None else None for key in keys]
+    pool.shutdown(wait=False)
+    return futures
+
+
+def format_plan(rows: List[tuple], rate: Optional[float], free: Optional[int]) -> List[str]:
+    """Lines describing a download plan.
+
+    rows are (name, estimate or None, error or None) per collection; rate is the recent
+    throughput in bytes/s and free the space left under the output folder.
+    """
+    lines = []
+    files = sized = 0
+    total = 0
+    for name, estimate, error in rows:
+        if estimate is None:
+            lines.append(f"      -  {name}: {error}")
+            continue
+        files += estimate['files']
+        sized += estimate['sized']
+        size = estimated_bytes(estimate)
+        total += size
+        shown = format_bytes(size) if estimate['sized'] else 'size unknown'
+        approx = '~' if estimate['sized'] < estimate['files'] else ''
+        lines.append(f" {estimate['files']:>5}  {name} ({approx}{shown})")
+    lines.append(f"Total: {files} files, {'~' if sized < files else ''}{format_bytes(total)}"
+                 + (f" ({files - sized} without a size in the listing)" if sized < files else ''))
+    if rate:
+        lines.append(f"Estimated time: {format_eta(total / rate)} at {format_bytes(rate)}/s (recent runs)")
+    else:
+        lines.append("Estimated time: unknown until a first download has been measured")
+    if free is not None:
+        lines.append(f"Free space: {format_bytes(free)}")
+    return lines
+
+
+def enough_space(total: int, free: Optional[int]) -> bool:
+    return free is None or total * (1 + DISK_MARGIN) <= free
@@ -0,0 +1,226 @@
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+# Live redraws per second on a terminal; each frame costs one write() whatever the traffic
+DEFAULT_FPS = 8
+# Seconds between status lines when output is redirected to a file or pipe
+DEFAULT_LOG_INTERVAL = 10.0
+# Throughput shown (and used for the ETA) is averaged over this many seconds
+RATE_WINDOW = 5.0
+BAR_WIDTH = 20
+
+_UP = '\x1b[%dA'
+_CLEAR_LINE = '\x1b[K'
+_CLEAR_BELOW = '\x1b[J'
+
+
+def format_bytes(size: float) -> str:
+    if size >= 1024 ** 3:
+        return f"{size / 1024 ** 3:.2f} GB"
+    if size >= 1024 ** 2:
+        return f"{size / 1024 ** 2:.1f} MB"
+    return f"{size / 1024:.0f} KB"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '--:--'
+    seconds = int(seconds + 0.5)
+    hours, rest = divmod(seconds, 3600)
+    if hours:
+        return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+    return f"{rest // 60}:{rest % 60:02d}"
+
+
+def _bar(fraction: float, width: int = BAR_WIDTH) -> str:
+    filled = int(max(0.0, min(1.0, fraction)) * width)
+    return '[' + '#' * filled + '-' * (width - filled) + ']'
+
+
+class Transfer:
+    """Progress of one file. The downloading thread only bumps `done`; nothing is drawn here."""
+
+    __slots__ = ('label', 'total', 'offset', 'done', 'started')
+
+    def __init__(self, label: str, total: int, offset: int = 0):
+        self.label = label
+        # full size of the file (0 when the server sent no Content-Length)
+        self.total = total
+        # bytes already on disk from an earlier run (resumed .part file)
+        self.offset = offset
+        self.done = offset
+        self.started = time.monotonic()
+
+    def received(self) -> int:
+        return self.done - self.offset
+
+
+class Progress:
+    """Aggregated progress of a download pool, drawn by its own thread at a fixed rate.
+
+    Workers call start() when a body begins, bump Transfer.done per chunk and call end()
+    when it stops; file_done() counts a finished file whatever its outcome. On a terminal
+    the renderer redraws one line per active transfer plus an overall bar with rate and ETA
+    DEFAULT_FPS times a second. Otherwise it prints a status line every DEFAULT_LOG_INTERVAL
+    seconds. Lines that must stay on screen go through message(), which prints them above
+    the live block.
+    """
+
+    def __init__(self, stream=None, fps: float = DEFAULT_FPS, live: bool = None,
+                 log_interval: float = DEFAULT_LOG_INTERVAL):
+        self.stream = stream or sys.stdout
+        if live is None:
+            try:
+                live = self.stream.isatty()
+            except Exception:
+                live = False
+        self.live = live
+        self.interval = 1.0 / max(0.5, fps) if live else max(0.5, log_interval)
+        self._lock = threading.Lock()
+        self._active = []
+        self._files_total = 0
+        self._files_done = 0
+        # bytes received by transfers that have ended (active ones are summed per frame)
+        self._ended_bytes = 0
+        # sizes of files seen so far, to estimate the files still queued
+        self._sized_files = 0
+        self._sized_bytes = 0
+        self._samples = deque()
+        self._drawn = 0
+        self._last_logged = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def queued(self, count: int = 1) -> None:
+        with self._lock:
+            self._files_total += count
+        self._ensure_thread()
+
+    def start(self, label: str, total: int, offset: int = 0) -> Transfer:
+        transfer = Transfer(label, total, offset)
+        with self._lock:
+            self._active.append(transfer)
+            if total:
+                self._sized_files += 1
+                self._sized_bytes += total
+        return transfer
+
+    def end(self, transfer: Transfer) -> None:
+        with self._lock:
+            try:
+                self._active.remove(transfer)
+            except ValueError:
+                return
+            self._ended_bytes += transfer.received()
+
+    def file_done(self) -> None:
+        with self._lock:
+            self._files_done += 1
+
+    def received(self) -> int:
+        """Bytes received so far by every transfer (resumed bytes not included)."""
+        with self._lock:
+            return self._ended_bytes + sum(t.received() for t in self._active)
+
+    def message(self, text: str) -> None:
+        """Print a line above the live block (or just print it when not on a terminal)."""
+        with self._lock:
+            self._erase()
+            self.stream.write(text + '\n')
+            self.stream.flush()
+
+    def close(self) -> None:
+        """Stop the renderer and remove the live block; the pool prints its own summary."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._lock:
+            self._erase()
+            self.stream.flush()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None and not self._stop.is_set():
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='progress', daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._tick()
+            except Exception:
+                # a broken terminal must never take a download down with it
+                pass
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            active = list(self._active)
+            received = self._ended_bytes + sum(t.received() for t in active)
+            files_done, files_total = self._files_done, self._files_total
+            average = self._sized_bytes / self._sized_files if self._sized_files else 0
+        rate = self._rate(now, received)
+        # what is left: the rest of each active file plus an average-sized file per queued one
+        remaining = sum(max(0, t.total - t.done) for t in active if t.total)
+        remaining += max(0, files_total - files_done - len(active)) * average
+        eta = remaining / rate if rate > 0 and (remaining or active) else None
+
+        overall = (f"{files_done}/{files_total} files, {format_bytes(received)}, "
+                   f"{format_bytes(rate)}/s, ETA {format_eta(eta)}")
+        if not self.live:
+            if files_done < files_total and (self._last_logged is None or self._last_logged != received):
+                self._last_logged = received
+                with self._lock:
+                    self.stream.write(f"Progress: {overall}\n")
+                    self.stream.flush()
+            return
+
+        width = max(20, shutil.get_terminal_size((80, 24)).columns - 1)
+        rows = shutil.get_terminal_size((80, 24)).lines
+        shown = active[:max(1, rows - 3)]
+        lines = [self._transfer_line(t, now, width) for t in shown]
+        if len(active) > len(shown):
+            lines.append(f"  ... and {len(active) - len(shown)} more")
+        fraction = files_done / files_total if files_total else 0.0
+        lines.append(f"Total {_bar(fraction)} {overall}")
+        frame = ''.join(line[:width] + _CLEAR_LINE + '\n' for line in lines)
+        with self._lock:
+            up = _UP % self._drawn if self._drawn else ''
+            self.stream.write(up + '\r' + frame + _CLEAR_BELOW)
+            self.stream.flush()
+            self._drawn = len(lines)
+
+    def _transfer_line(self, transfer: Transfer, now: float, width: int) -> str:
+        elapsed = now - transfer.started
+        speed = transfer.received() / elapsed if elapsed > 0 else 0
+        if transfer.total:
+            stats = (f" {_bar(transfer.done / transfer.total, 10)} {transfer.done * 100 // transfer.total:3d}% "
+                     f"{format_bytes(transfer.done)}/{format_bytes(transfer.total)} {format_bytes(speed)}/s")
+        else:
+            stats = f" {format_bytes(transfer.done)} {format_bytes(speed)}/s"
+        # keep the numbers visible on narrow terminals by shortening the name instead
+        room = max(8, width - len(stats) - 2)
+        label = transfer.label if len(transfer.label) <= room else transfer.label[:room - 1] + '~'
+        return '  ' + label + stats
+
+    def _rate(self, now: float, received: int) -> float:
+        samples = self._samples
+        samples.append((now, received))
+        while len(samples) > 2 and now - samples[0][0] > RATE_WINDOW:
+            samples.popleft()
+        first_time, first_bytes = samples[0]
+        if now - first_time <= 0:
+            return 0.0
+        return (received - first_bytes) / (now - first_time)
+
+    def _erase(self) -> None:
+        # caller holds the lock
+        if self.live and self._drawn:
+            self.stream.write(_UP % self._drawn + '\r' + _CLEAR_BELOW)
+            self._drawn = 0
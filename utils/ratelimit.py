@@ -0,0 +1,183 @@
+import re
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+# Smallest burst a bucket allows, so a single read never has to be split up
+MIN_BURST = 64 * 1024
+# How many seconds of traffic one transfer may take at once while throttled
+FAIR_SLICE_SECONDS = 0.1
+
+_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+
+def parse_rate(text: str) -> float:
+    """Parse '512K', '2M', '1.5MB' or '0' (unlimited) into bytes per second."""
+    m = re.fullmatch(r'\s*([0-9]*\.?[0-9]+)\s*([KMG]?B?)(?:/S)?\s*', (text or '').upper())
+    if not m:
+        raise ValueError(f"invalid rate '{text}' (use e.g. 500K, 2M or 0 for unlimited)")
+    return float(m.group(1)) * _UNITS[m.group(2)]
+
+
+def format_rate(rate: float) -> str:
+    if not rate:
+        return 'unlimited'
+    if rate >= 1024 ** 2:
+        return f"{rate / 1024 ** 2:.1f} MB/s"
+    return f"{rate / 1024:.0f} KB/s"
+
+
+def parse_schedule(text: str) -> List[Tuple[int, int, float]]:
+    """Parse '08:00-20:00=1M,20:00-23:00=4M' into [(start_minute, end_minute, rate), ...].
+
+    Windows may wrap past midnight ('22:00-06:00=0').
+    """
+    windows = []
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        m = re.fullmatch(r'(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(.+)', part)
+        if not m:
+            raise ValueError(f"invalid schedule window '{part}' (use HH:MM-HH:MM=RATE)")
+        h1, m1, h2, m2 = (int(g) for g in m.groups()[:4])
+        windows.append((h1 * 60 + m1, h2 * 60 + m2, parse_rate(m.group(5))))
+    return windows
+
+
+class TokenBucket:
+    """Reservation-style token bucket.
+
+    A caller takes its tokens up front (the balance may go negative) and is told how long to
+    sleep until the debt is repaid. Later callers queue behind the existing debt, which makes
+    the order first-come first-served, and every read costs exactly one sleep instead of a
+    polling loop. A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate: float = 0, burst: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self.rate = 0.0
+        self.burst = float(MIN_BURST)
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate: float, burst: Optional[float] = None) -> None:
+        """Change the rate at any time; running transfers pick it up on their next read."""
+        with self._lock:
+            self._refill()
+            self.rate = max(0.0, float(rate or 0))
+            self.burst = float(burst) if burst else max(self.rate * 0.25, MIN_BURST)
+            self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, amount: int) -> float:
+        """Take `amount` tokens and return the seconds the caller has to wait for them."""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RateLimiter:
+    """Global plus per-host bandwidth limits shared by every transfer of a run.
+
+    Transfers call `throttle()` after each read. `fair_chunk()` caps read sizes so each of the
+    active transfers takes a similar slice per round, which (with the FIFO buckets) splits the
+    bandwidth evenly instead of favouring whichever transfer reads the biggest chunks.
+    An optional schedule switches the global rate by time of day.
+    """
+
+    def __init__(self, rate: float = 0, per_host_rate: float = 0,
+                 schedule: Optional[List[Tuple[int, int, float]]] = None):
+        self._lock = threading.Lock()
+        self.base_rate = float(rate or 0)
+        self.per_host_rate = float(per_host_rate or 0)
+        self.schedule = schedule or []
+        self._global = TokenBucket(self.base_rate)
+        self._hosts = {}
+        self._active = 0
+        self._schedule_checked = 0.0
+        self._apply_schedule(force=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._global.rate or self.per_host_rate or self.schedule)
+
+    @property
+    def rate(self) -> float:
+        return self._global.rate
+
+    def set_rate(self, rate: float) -> None:
+        """Change the global limit at runtime (0 = unlimited); a schedule window still wins."""
+        self.base_rate = float(rate or 0)
+        self._apply_schedule(force=True)
+
+    def set_host_rate(self, rate: float) -> None:
+        with self._lock:
+            self.per_host_rate = float(rate or 0)
+            for bucket in self._hosts.values():
+                bucket.set_rate(self.per_host_rate)
+
+    def _scheduled_rate(self) -> float:
+        now = datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.schedule:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return rate
+        return self.base_rate
+
+    def _apply_schedule(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._schedule_checked < 1.0:
+            return
+        self._schedule_checked = now
+        rate = self._scheduled_rate() if self.schedule else self.base_rate
+        if rate != self._global.rate:
+            self._global.set_rate(rate)
+
+    def _host_bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._hosts.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.per_host_rate)
+                self._hosts[host] = bucket
+            return bucket
+
+    def register(self) -> None:
+        with self._lock:
+            self._active += 1
+
+    def unregister(self) -> None:
+        with self._lock:
+            self._active = max(0, self._active - 1)
+
+    def fair_chunk(self, max_chunk: int, min_chunk: int) -> int:
+        """Largest read a transfer should make so all active transfers get an equal turn."""
+        rate = self._global.rate or self.per_host_rate
+        if not rate:
+            return max_chunk
+        share = int(rate * FAIR_SLICE_SECONDS / max(1, self._active))
+        return max(min_chunk, min(max_chunk, share))
+
+    def throttle(self, host: str, amount: int, stop: Optional[threading.Event] = None) -> None:
+        """Account for `amount` bytes just read from `host`, sleeping once if over the limit."""
+        if self.schedule:
+            self._apply_schedule()
+        delay = self._global.reserve(amount)
+        if self.per_host_rate:
+            delay = max(delay, self._host_bucket(host).reserve(amount))
+        if delay > 0:
+            if stop is not None:
+                stop.wait(delay)
+            else:
+                time.sleep(delay)
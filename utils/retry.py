@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+from typing import Optional
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 1.0  # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_CAP = 30.0
+# consecutive transient failures that open a host's circuit, and how long it stays open
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+BREAKER_MAX_COOLDOWN = 300.0
+# how long queued work waits for an open circuit before failing fast
+BREAKER_MAX_DEFER = 120.0
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class IncompleteDownload(IOError):
+    """The server closed the connection before sending the whole body."""
+
+
+class CircuitOpen(Exception):
+    """The host has been failing and its circuit is open; the request was not attempted."""
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def classify_error(exc: BaseException) -> str:
+    """Return TRANSIENT for errors worth retrying (resets, timeouts, 5xx, 429) else PERMANENT."""
+    status = _status_of(exc)
+    if status is not None:
+        return TRANSIENT if status in RETRYABLE_STATUS else PERMANENT
+    import requests  # already loaded by whoever raised exc
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                        ConnectionError, TimeoutError)):
+        return TRANSIENT
+    # urllib3 errors come straight from raw reads (reset mid-body, protocol errors)
+    if isinstance(exc, IncompleteDownload) or type(exc).__module__.startswith('urllib3'):
+        return TRANSIENT
+    # anything else (404s, disk full, bad URLs) won't improve by asking again
+    return PERMANENT
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header (429/503), if any."""
+    response = getattr(exc, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime  # rare (HTTP-date form); ~10 ms to import
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Per-host circuit breaker.
+
+    After `threshold` consecutive transient failures a host's circuit opens for `cooldown`
+    seconds (doubling, up to `max_cooldown`, each time a probe fails again). While open,
+    `before_request` makes callers wait for the cooldown to end (up to `max_defer`) or raises
+    CircuitOpen right away, so a dead host costs one timeout per probe instead of one per file.
+    After the cooldown a single probe request is let through; its outcome closes or re-opens
+    the circuit. The probe's caller must call end_probe() once it is done whatever happened,
+    so a probe that ends in an error saying nothing about the host (a full disk, a cancel)
+    doesn't leave the host half-open for good.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN, max_defer: float = BREAKER_MAX_DEFER):
+        self.threshold = max(1, int(threshold))
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_defer = max_defer
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _state(self, host: str) -> dict:
+        state = self._hosts.get(host)
+        if state is None:
+            state = {'failures': 0, 'open_until': 0.0, 'cooldown': self.cooldown, 'probing': False}
+            self._hosts[host] = state
+        return state
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            return self._state(host)['open_until'] > time.monotonic()
+
+    def before_request(self, host: str, stop: Optional[threading.Event] = None) -> bool:
+        """Wait while the host's circuit is open; raises CircuitOpen if that would take too long.
+
+        Returns True when the caller goes ahead as the half-open probe.
+        """
+        deadline = time.monotonic() + self.max_defer
+        while True:
+            with self._lock:
+                state = self._state(host)
+                now = time.monotonic()
+                if state['failures'] < self.threshold:
+                    return False
+                if state['open_until'] <= now and not state['probing']:
+                    # half-open: this caller is the probe
+                    state['probing'] = True
+                    return True
+                wake = state['open_until'] if state['open_until'] > now else now + 1.0
+            if wake > deadline:
+                raise CircuitOpen(f"{host} is unavailable (circuit open)")
+            if stop is not None:
+                if stop.wait(wake - time.monotonic()):
+                    raise CircuitOpen(f"{host}: cancelled while waiting")
+            else:
+                time.sleep(max(0.0, wake - time.monotonic()))
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            state = self._state(host)
+            state.update(failures=0, open_until=0.0, cooldown=self.cooldown, probing=False)
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            state = self._state(host)
+            state['failures'] += 1
+            if state['failures'] >= self.threshold:
+                if state['probing']:
+                    # the probe failed too: back off harder
+                    state['cooldown'] = min(self.max_cooldown, state['cooldown'] * 2)
+                state['open_until'] = time.monotonic() + state['cooldown']
+                state['probing'] = False
+
+    def end_probe(self, host: str) -> None:
+        """Let the next caller probe if this probe's outcome recorded neither success nor failure."""
+        with self._lock:
+            self._state(host)['probing'] = False
@@ -0,0 +1,70 @@
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from typing import Hashable, Optional
+
+# Orders DownloadPool can hand queued files to its workers in
+ORDER_POLICIES = ('page', 'smallest', 'largest', 'interleave')
+ORDER_DESCRIPTIONS = {
+    'page': 'listing order',
+    'smallest': 'smallest first',
+    'largest': 'largest first',
+    'interleave': 'interleaved across hosts/folders',
+}
+
+
+class Scheduler:
+    """Queue of pending files that gives workers the next one according to a policy.
+
+    page        files in the order they were added (listing order)
+    smallest    known sizes ascending, so many small files finish early; files without a
+                size go last
+    largest     known sizes descending (longest job first), so one huge file doesn't start
+                last and leave the other workers idle at the end; unknown sizes go last
+    interleave  round-robin over groups (host and folder), so one slow host or one
+                collection of large files doesn't hold up the others
+
+    Sizes are hints from the listing's size column; the caller serialises access.
+    """
+
+    def __init__(self, policy: str = 'page'):
+        if policy not in ORDER_POLICIES:
+            raise ValueError(f"unknown order {policy!r} (choose from {', '.join(ORDER_POLICIES)})")
+        self.policy = policy
+        self._seq = itertools.count()
+        self._fifo = deque()
+        self._heap = []
+        self._groups = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, job, size: Optional[int] = None, group: Hashable = None) -> None:
+        self._size += 1
+        if self.policy == 'page':
+            self._fifo.append(job)
+        elif self.policy == 'interleave':
+            self._groups.setdefault(group, deque()).append(job)
+        else:
+            known = size is not None
+            key = (size if self.policy == 'smallest' else -size) if known else 0
+            # (unknown last, size key, arrival) keeps equal sizes in listing order
+            heapq.heappush(self._heap, (not known, key, next(self._seq), job))
+
+    def pop(self):
+        """The next job, or None when the queue is empty."""
+        if not self._size:
+            return None
+        self._size -= 1
+        if self.policy == 'page':
+            return self._fifo.popleft()
+        if self.policy == 'interleave':
+            group, jobs = next(iter(self._groups.items()))
+            job = jobs.popleft()
+            # the group goes to the back of the rotation (or away once it is empty)
+            del self._groups[group]
+            if jobs:
+                self._groups[group] = jobs
+            return job
+        return heapq.heappop(self._heap)[-1]
@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, TYPE_CHECKING
+
+from utils.retry import IncompleteDownload, TRANSIENT, classify_error
+
+if TYPE_CHECKING:
+    import requests
+
+# Files at least this large are split when segmented downloads are on (--segments)
+DEFAULT_SEGMENT_THRESHOLD = 32 * 1024 * 1024
+# Never cut a file into pieces smaller than this; short ranges cost more in requests than they gain
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+# Sidecar next to `<name>.part` holding the byte ranges and how far each one got
+STATE_SUFFIX = '.segments'
+# How often (seconds) running segments write their progress to the sidecar
+SAVE_INTERVAL = 2.0
+
+
+class RangeNotHonoured(IncompleteDownload):
+    """A segment request was answered with something other than the requested byte range
+    (typically the file changed on the server); the segments are dropped and the retry starts over."""
+
+
+def plan_segments(size: int, count: int) -> List[List[int]]:
+    """Split [0, size) into at most `count` ranges of at least MIN_SEGMENT_SIZE: [[start, end, done], ...]."""
+    count = max(1, min(int(count), size // MIN_SEGMENT_SIZE or 1))
+    step = -(-size // count)
+    return [[start, min(size, start + step), 0] for start in range(0, size, step)]
+
+
+def _preallocate(path: Path, size: int) -> None:
+    """Create `path` at its final size so segments can be written at their offsets."""
+    with open(str(path), 'wb') as fh:
+        try:
+            # reserves the blocks up front (no fragmentation, disk-full fails now, not at 90%)
+            os.posix_fallocate(fh.fileno(), 0, size)
+        except (AttributeError, OSError):
+            fh.truncate(size)
+
+
+class SegmentState:
+    """Byte ranges of a segmented download, persisted next to its .part file.
+
+    A run interrupted half-way leaves `<name>.part` (full size, partly filled) and
+    `<name>.part.segments`; the next run fetches only what each range is missing. The ETag /
+    Last-Modified seen first are sent as If-Range, so a file changed on the server starts over.
+    """
+
+    def __init__(self, part_path: Path, size: int, ranges: List[List[int]],
+                 etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.part_path = Path(part_path)
+        self.path = self.part_path.with_name(self.part_path.name + STATE_SUFFIX)
+        self.size = size
+        self.ranges = ranges
+        self.etag = etag
+        self.last_modified = last_modified
+        self._lock = threading.Lock()
+        self._saved = 0.0
+
+    @classmethod
+    def create(cls, part_path: Path, size: int, count: int, etag: Optional[str] = None,
+               last_modified: Optional[str] = None) -> 'SegmentState':
+        state = cls(part_path, size, plan_segments(size, count), etag, last_modified)
+        _preallocate(state.part_path, size)
+        state.save()
+        return state
+
+    @classmethod
+    def load(cls, part_path: Path) -> Optional['SegmentState']:
+        """The saved state for part_path, or None if there is none (or it doesn't match the .part)."""
+        part_path = Path(part_path)
+        path = part_path.with_name(part_path.name + STATE_SUFFIX)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            state = cls(part_path, int(data['size']), [[int(a), int(b), int(d)] for a, b, d in data['ranges']],
+                        data.get('etag'), data.get('last_modified'))
+            if part_path.stat().st_size != state.size:
+                raise ValueError('part file does not match')
+            return state
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # unreadable or inconsistent: forget it, the download starts over
+            cls(part_path, 0, []).discard()
+            return None
+
+    @staticmethod
+    def saved_progress(part_path: Path) -> Optional[int]:
+        """Bytes the sidecar of part_path records as received (None without a readable one);
+        unlike load() it never discards anything."""
+        part_path = Path(part_path)
+        try:
+            with open(part_path.with_name(part_path.name + STATE_SUFFIX), 'r', encoding='utf-8') as f:
+                return sum(int(done) for _, _, done in json.load(f)['ranges'])
+        except Exception:
+            return None
+
+    def validator(self) -> Optional[str]:
+        """If-Range value: If-Range needs a strong ETag, so a weak one falls back to the date."""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def pending(self) -> List[int]:
+        return [i for i, (start, end, done) in enumerate(self.ranges) if start + done < end]
+
+    def received(self) -> int:
+        return sum(done for _, _, done in self.ranges)
+
+    def range_header(self, index: int) -> str:
+        start, end, done = self.ranges[index]
+        return f"bytes={start + done}-{end - 1}"
+
+    def advance(self, index: int, count: int) -> None:
+        """Record `count` more bytes written for range `index`; saves now and then."""
+        self.ranges[index][2] += count
+        now = time.monotonic()
+        if now - self._saved >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._saved = time.monotonic()
+            data = {'size': self.size, 'etag': self.etag, 'last_modified': self.last_modified,
+                    'ranges': [list(r) for r in self.ranges]}
+            try:
+                tmp = self.path.with_name(self.path.name + '.tmp')
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+    def discard(self, with_part: bool = True) -> None:
+        """Delete the sidecar (and the .part file, unless it was just renamed into place)."""
+        paths = [self.path] + ([self.part_path] if with_part else [])
+        for p in paths:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+
+def fetch_segments(session: 'requests.Session', file_url: str, state: SegmentState,
+                   first: 'requests.Response', first_index: int, parallel: int,
+                   read_chunks: Callable, timeout, stop: threading.Event = None,
+                   extra_slots: Callable[[int], int] = None, release_slots: Callable[[int], None] = None,
+                   on_bytes: Callable[[int], None] = None) -> None:
+    """Fill every pending range of state.part_path, up to `parallel` ranges at a time.
+
+    `first` is an open response already positioned at the start of range `first_index` (the
+    initial GET, or a resumed 206); it is read up to the end of that range and dropped.
+    Each further range gets its own Range request. Extra connections are taken with
+    extra_slots(n) -> granted (the pool's per-host limit), so segmenting never exceeds it.
+    read_chunks(response) yields body chunks (the pool's adaptive, rate-limited reader);
+    on_bytes(n) reports progress.
+
+    A connection that hits a transient error (reset, timeout, 503) hands its range back and
+    stops; the remaining connections carry on. If ranges are still missing once every
+    connection has stopped, the last such error is raised so the pool's retry resumes them.
+    Other errors stop all connections and are raised at once. The state is saved either way;
+    when `stop` is set this returns early.
+    """
+    queue = [i for i in state.pending() if i != first_index]
+    queue_lock = threading.Lock()
+    abort = threading.Event()
+    errors = []
+    fatal = []
+
+    def next_index() -> Optional[int]:
+        with queue_lock:
+            return queue.pop(0) if queue else None
+
+    def fill(index: int, resp) -> None:
+        start, end, done = state.ranges[index]
+        try:
+            if resp is None:
+                resp = session.get(file_url, stream=True, timeout=timeout,
+                                   headers={'Range': state.range_header(index),
+                                            **({'If-Range': state.validator()} if state.validator() else {})})
+                resp.raise_for_status()
+                got = resp.headers.get('content-range', '')
+                if resp.status_code != 206 or not got.startswith(f"bytes {start + done}-"):
+                    raise RangeNotHonoured(f"asked for {state.range_header(index)}, got {resp.status_code} {got}")
+            with open(str(state.part_path), 'r+b') as fh:
+                fh.seek(start + done)
+                left = end - start - done
+                for chunk in read_chunks(resp):
+                    if abort.is_set() or (stop is not None and stop.is_set()):
+                        return
+                    if len(chunk) > left:
+                        # the initial response carries the whole file; stop at this range's end
+                        chunk = chunk[:left]
+                    fh.write(chunk)
+                    left -= len(chunk)
+                    state.advance(index, len(chunk))
+                    if on_bytes is not None:
+                        on_bytes(len(chunk))
+                    if not left:
+                        break
+            if left and not abort.is_set() and not (stop is not None and stop.is_set()):
+                raise IncompleteDownload(f"segment {index} closed {left} bytes short")
+        finally:
+            if resp is not None:
+                resp.close()
+
+    def worker(index: Optional[int], resp=None) -> None:
+        try:
+            while index is not None and not abort.is_set():
+                try:
+                    fill(index, resp)
+                except Exception as e:
+                    if isinstance(e, RangeNotHonoured) or classify_error(e) != TRANSIENT:
+                        raise
+                    # give the range back to whoever is still running; this connection stops
+                    with queue_lock:
+                        queue.insert(0, index)
+                        errors.append(e)
+                    return
+                resp = None
+                index = next_index()
+        except BaseException as e:
+            fatal.append(e)
+            abort.set()
+
+    granted = 0
+    if queue and parallel > 1 and extra_slots is not None:
+        granted = extra_slots(min(parallel - 1, len(queue)))
+    threads = [threading.Thread(target=worker, args=(next_index(),), name=f'segment-{n}', daemon=True)
+               for n in range(granted)]
+    for t in threads:
+        t.start()
+    try:
+        worker(first_index, first)
+        for t in threads:
+            t.join()
+    finally:
+        if granted and release_slots is not None:
+            release_slots(granted)
+        state.save()
+    if fatal:
+        raise fatal[0]
+    if state.pending() and not (stop is not None and stop.is_set()):
+        raise errors[-1] if errors else IncompleteDownload('segments left unfinished')
@@ -0,0 +1,92 @@
+import threading
+from typing import Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+# Pool sized for the default worker count plus the index fetcher
+DEFAULT_POOL_SIZE = 8
+USER_AGENT = 'tamil-mp3-downloader'
+# (connect, read) seconds: a dead host is noticed quickly, a slow body still gets time
+DEFAULT_TIMEOUT = (10, 30)
+
+_session: Optional['requests.Session'] = None
+_pool_size = DEFAULT_POOL_SIZE
+# called with each new shared session (e.g. telemetry.instrument_session for --report)
+_on_create: Optional[Callable] = None
+_session_lock = threading.Lock()
+_preload_started = False
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE) -> 'requests.Session':
+    """Build a keep-alive session whose connection pool can serve `pool_size` parallel requests.
+
+    Connections (and their TLS handshakes) are reused for every request to the same host,
+    which matters most for collections of small files such as ringtones.
+    """
+    # requests (and urllib3/certifi behind it) is imported here rather than at startup,
+    # so the menu comes up before any networking code is loaded
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    pool_size = max(1, int(pool_size))
+    session = requests.Session()
+    # pool_connections is the number of hosts kept, pool_maxsize the sockets per host
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT, 'Connection': 'keep-alive'})
+    return session
+
+
+def _import_network_modules() -> None:
+    try:
+        import requests  # noqa: F401
+    except Exception:
+        pass
+
+
+def preload_in_background() -> None:
+    """Import requests on a daemon thread while the user is still reading the menu.
+
+    The first listing then doesn't pay for the import, and startup doesn't either.
+    """
+    global _preload_started
+    if _preload_started:
+        return
+    _preload_started = True
+    threading.Thread(target=_import_network_modules, name='preload', daemon=True).start()
+
+
+def configure_session(pool_size: int = DEFAULT_POOL_SIZE, on_create: Optional[Callable] = None) -> None:
+    """Size the shared session for `pool_size` parallel requests.
+
+    The session itself is created on the first get_session(), i.e. when a listing or
+    download actually starts; `on_create(session)` is then called to customise it.
+    """
+    global _session, _pool_size, _on_create
+    with _session_lock:
+        _pool_size = pool_size
+        _on_create = on_create
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session() -> 'requests.Session':
+    """Return the process-wide shared session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session(_pool_size)
+            if _on_create is not None:
+                _on_create(_session)
+        return _session
+
+
+def close_session() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
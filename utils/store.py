@@ -0,0 +1,192 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+# Linux FICLONE ioctl: share extents copy-on-write (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+SAVE_EVERY = 50
+
+
+def content_key(size: int, etag: Optional[str], url: str) -> Optional[str]:
+    """Key used to recognise a file before downloading it; None when the server gave no ETag.
+
+    An ETag only identifies a version of one URL: Apache's default (mtime+size) is the same
+    for two different songs of the same size uploaded in the same second, so the URL is part
+    of the key. The key therefore only saves the transfer when the same URL is wanted again
+    (e.g. a song listed in two collections); copies at other URLs are downloaded and then
+    deduplicated by hash.
+    """
+    if not size or not etag:
+        return None
+    # weak and strong validators of the same entity are treated alike
+    return f"{size}:{etag[2:] if etag.startswith('W/') else etag} {url}"
+
+
+def _reflink(src: Path, dest: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as s, open(dest, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        return True
+    except OSError:
+        try:
+            dest.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def materialize(src: Path, dest: Path) -> str:
+    """Make dest a copy of src as cheaply as possible; returns 'hardlink', 'reflink' or 'copy'."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + '.link')
+    try:
+        tmp.unlink()
+    except OSError:
+        pass
+    try:
+        os.link(src, tmp)
+        how = 'hardlink'
+    except OSError:
+        if _reflink(src, tmp):
+            how = 'reflink'
+        else:
+            shutil.copyfile(src, tmp)
+            how = 'copy'
+    os.replace(tmp, dest)
+    return how
+
+
+class ContentStore:
+    """Index of downloaded songs by content, so a track shared by several collections is
+    fetched and stored once.
+
+    Two lookups are kept: size+ETag+URL -> sha256 (known from a HEAD request, before any body
+    byte is sent) and sha256 -> files on disk (known after streaming). A hit on the first
+    lets the downloader skip the transfer of a URL it already has; a hit on the second turns
+    a freshly downloaded duplicate from any URL into a hardlink (or reflink/copy) of the
+    existing file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data = None
+        self._urls = set()
+        self._dirty = 0
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception:
+                data = {}
+            # keys written before they included the URL could match the wrong song
+            data['keys'] = {key: digest for key, digest in data.get('keys', {}).items() if ' ' in key}
+            data.setdefault('hashes', {})
+            self._urls = {key.split(' ', 1)[1] for key in data['keys']}
+            self._data = data
+        return self._data
+
+    def _existing(self, digest: str, size: int) -> Optional[Path]:
+        """First recorded file with this hash that is still on disk with the right size."""
+        for p in self._load()['hashes'].get(digest, []):
+            try:
+                if os.path.getsize(p) == size:
+                    return Path(p)
+            except OSError:
+                continue
+        return None
+
+    def knows_url(self, url: str) -> bool:
+        """Whether a key was recorded for this URL, i.e. whether asking for its headers can pay off."""
+        with self._lock:
+            self._load()
+            return url in self._urls
+
+    def find_by_key(self, size: int, etag: Optional[str], url: str) -> Optional[Path]:
+        key = content_key(size, etag, url)
+        if key is None:
+            return None
+        with self._lock:
+            digest = self._load()['keys'].get(key)
+            return self._existing(digest, size) if digest else None
+
+    def hash_for_key(self, size: int, etag: Optional[str], url: str) -> Optional[str]:
+        key = content_key(size, etag, url)
+        with self._lock:
+            return self._load()['keys'].get(key) if key else None
+
+    def find_by_hash(self, digest: str, size: int, exclude: Optional[Path] = None) -> Optional[Path]:
+        with self._lock:
+            found = self._existing(digest, size)
+            if found is not None and exclude is not None and os.path.abspath(found) == os.path.abspath(exclude):
+                # the only copy is the file itself; look for another
+                for p in self._load()['hashes'].get(digest, []):
+                    if os.path.abspath(p) != os.path.abspath(exclude) and os.path.exists(p):
+                        return Path(p)
+                return None
+            return found
+
+    def record(self, path: Path, size: int, etag: Optional[str], digest: str, url: str) -> None:
+        with self._lock:
+            data = self._load()
+            key = content_key(size, etag, url)
+            if key is not None:
+                data['keys'][key] = digest
+                self._urls.add(url)
+            p = os.path.abspath(path)
+            paths = data['hashes'].setdefault(digest, [])
+            if p not in paths:
+                # a file downloaded again with new content no longer has its old hash
+                self._drop_path(p, keep=digest)
+                paths.append(p)
+            self._dirty += 1
+            if self._dirty >= SAVE_EVERY:
+                self._save()
+
+    def forget(self, path: Path) -> None:
+        """Drop a deleted file; keys whose content has no file left go with it."""
+        with self._lock:
+            self._load()
+            if self._drop_path(os.path.abspath(path)):
+                self._dirty += 1
+                if self._dirty >= SAVE_EVERY:
+                    self._save()
+
+    def _drop_path(self, p: str, keep: Optional[str] = None) -> bool:
+        data = self._data
+        dropped = False
+        for digest, paths in list(data['hashes'].items()):
+            if digest == keep or p not in paths:
+                continue
+            paths.remove(p)
+            dropped = True
+            if not paths:
+                del data['hashes'][digest]
+                data['keys'] = {key: d for key, d in data['keys'].items() if d != digest}
+                self._urls = {key.split(' ', 1)[1] for key in data['keys']}
+        return dropped
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, separators=(',', ':'))
+            os.replace(tmp, self.path)
+            self._dirty = 0
+        except Exception:
+            pass
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._data is not None and self._dirty:
+                self._save()
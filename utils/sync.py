@@ -0,0 +1,126 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from utils.downloader import audio_paths, part_path_for
+from utils.helper import parse_size_column
+from utils.manifest import Manifests
+from utils.store import ContentStore
+
+if TYPE_CHECKING:
+    from utils.library import Library
+
+
+def listing_fingerprint(columns: Optional[dict]) -> Optional[str]:
+    """What the listing says about a file ('2024-01-31 10:00|4.0M'), or None if it shows nothing."""
+    if not columns or not columns.get('date'):
+        return None
+    return f"{columns['date']}|{columns.get('size') or '-'}"
+
+
+def size_matches(shown: Optional[str], size: int) -> bool:
+    """Whether a listing's size column ('4.0M', '512K', '41943040') fits `size` bytes.
+
+    Autoindex pages round to one or two digits, so the shown value is only checked up to its
+    last digit; a missing column matches anything.
+    """
+    parsed = parse_size_column(shown)
+    if parsed is None:
+        return True
+    approx, step = parsed
+    return abs(approx - size) <= step
+
+
+def sync_folder(folder_url: str, hrefs: List[str], meta: Dict[str, dict], out_dir: Path,
+                manifests: Manifests, prune: bool = False, store: Optional[ContentStore] = None,
+                library: Optional['Library'] = None) -> Tuple[List[Tuple[str, Path]], dict]:
+    """Compare one remote folder with its local copy and return what needs downloading.
+
+    A file is current when its manifest entry has the local file's size and was recorded from
+    the same listing date/size columns as the page shows now. Files recorded before --sync
+    existed (no columns in their entry) are taken over when their size fits the listing, so
+    the first sync of an existing download doesn't fetch it all again. Everything else (new,
+    changed on the server, missing locally, or with a .part from an interrupted run) is
+    returned as (file_url, out_path) items; the columns are stored with each file once its
+    download succeeds. With `prune`, files the manifest records but the listing no longer
+    has are deleted, along with their entries in the content `store` and the `library`.
+    Returns (items, counts) where counts has new, changed, unchanged, pruned.
+    """
+    counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'pruned': 0}
+    items = []
+    wanted = set()
+    for href, file_url, out_path in audio_paths(hrefs, folder_url, out_dir):
+        wanted.add(out_path.name)
+        fingerprint = listing_fingerprint(meta.get(href))
+        try:
+            local_size = out_path.stat().st_size
+        except OSError:
+            local_size = None
+        if local_size is None or part_path_for(out_path).exists():
+            counts['new' if local_size is None else 'changed'] += 1
+        else:
+            entry = manifests.get(out_path)
+            if entry is None:
+                # on disk but never recorded (older version, copied in by hand): trust the size
+                current = size_matches((meta.get(href) or {}).get('size'), local_size)
+                if current and fingerprint is not None:
+                    manifests.adopt(out_path, fingerprint, local_size, file_url)
+            elif entry.get('size') != local_size:
+                current = False
+            elif fingerprint is None or entry.get('listing') == fingerprint:
+                # a page without columns can only tell us about new files
+                current = True
+            elif 'listing' not in entry and size_matches((meta.get(href) or {}).get('size'), local_size):
+                current = True
+                manifests.adopt(out_path, fingerprint)
+            else:
+                current = False
+            if current:
+                counts['unchanged'] += 1
+                continue
+            counts['changed'] += 1
+        if fingerprint is not None:
+            manifests.expect(out_path, fingerprint)
+        items.append((file_url, out_path))
+
+    if prune and wanted:
+        # an empty listing is more likely a server hiccup than a deleted collection
+        for name in manifests.entries(out_dir):
+            if name in wanted:
+                continue
+            path = Path(out_dir) / name
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            manifests.remove(path)
+            if store is not None:
+                store.forget(path)
+            if library is not None:
+                library.remove(path)
+            counts['pruned'] += 1
+    return items, counts
+
+
+def sync_folders(folders, out_dir: Path, manifests: Manifests, prune: bool = False,
+                 store: Optional[ContentStore] = None,
+                 library: Optional['Library'] = None) -> Tuple[List[Tuple[str, Path]], dict]:
+    """sync_folder over crawler output [(folder_url, rel_parts, hrefs, meta), ...]; counts are summed."""
+    items = []
+    totals = {'new': 0, 'changed': 0, 'unchanged': 0, 'pruned': 0}
+    for folder_url, rel_parts, hrefs, meta in folders:
+        folder_items, counts = sync_folder(folder_url, hrefs, meta, Path(out_dir).joinpath(*rel_parts),
+                                           manifests, prune, store, library)
+        items.extend(folder_items)
+        for key, value in counts.items():
+            totals[key] += value
+    return items, totals
+
+
+def format_sync_counts(counts: dict) -> str:
+    text = f"{counts['new']} new, {counts['changed']} changed, {counts['unchanged']} up to date"
+    if counts.get('pruned'):
+        text += f", {counts['pruned']} removed"
+    return text
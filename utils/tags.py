@@ -0,0 +1,464 @@
+"""Song metadata (ID3v2/ID3v1, FLAC, M4A) read from the download stream as it goes by.
+
+TagReader is fed the same chunks as utils.verify.StreamVerifier and only keeps the byte
+ranges it needs: the ID3v2 tag or FLAC metadata blocks at the start, the first MP3 frame
+(bitrate, and the Xing/VBRI header of VBR files), the `moov` atom of an M4A wherever it
+sits, and the last 128 bytes for an ID3v1 tag. Everything else just passes through, so
+tagging costs no disk reads and little memory.
+"""
+import struct
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from utils.verify import FRAME_WINDOW, _id3_end, _mpeg_frame
+
+# Most of an ID3v2 tag or FLAC metadata block that is kept; text frames come before cover
+# art in practice, so a huge embedded picture only loses its own bytes
+MAX_TAG_BYTES = 512 * 1024
+# An M4A `moov` atom larger than this (hours of audio with sample tables) is not parsed
+MAX_MOOV_BYTES = 8 * 1024 * 1024
+ID3V1_SIZE = 128
+
+# ID3v2.3/2.4 frame ids (and their 3-letter v2.2 forms) -> tag fields
+ID3_FRAMES = {
+    'TIT2': 'title', 'TT2': 'title',
+    'TPE1': 'artist', 'TP1': 'artist',
+    'TALB': 'album', 'TAL': 'album',
+    'TPE2': 'album_artist', 'TP2': 'album_artist',
+    'TRCK': 'track', 'TRK': 'track',
+    'TYER': 'year', 'TYE': 'year', 'TDRC': 'year', 'TDRL': 'year',
+    'TCON': 'genre', 'TCO': 'genre',
+}
+VORBIS_FIELDS = {
+    'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album', 'ALBUMARTIST': 'album_artist',
+    'ALBUM ARTIST': 'album_artist', 'TRACKNUMBER': 'track', 'DATE': 'year', 'YEAR': 'year',
+    'GENRE': 'genre',
+}
+MP4_FIELDS = {
+    b'\xa9nam': 'title', b'\xa9ART': 'artist', b'\xa9alb': 'album', b'aART': 'album_artist',
+    b'\xa9day': 'year', b'\xa9gen': 'genre',
+}
+_TEXT_ENCODINGS = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')
+
+# MPEG audio bitrates in kbit/s by (version is MPEG-1, layer) and bitrate index
+_BITRATES = {
+    (True, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# sample rates by version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _clean(text: str) -> Optional[str]:
+    text = text.replace('\x00', ' ').strip()
+    return text or None
+
+
+def _decode_text(data: bytes) -> Optional[str]:
+    """An ID3v2 text frame body: encoding byte, then one or more NUL-separated values."""
+    if not data or data[0] > 3:
+        return None
+    encoding = _TEXT_ENCODINGS[data[0]]
+    text = data[1:].decode(encoding, errors='replace')
+    # several values (v2.4) are joined the way players show them
+    return _clean(' / '.join(value for value in text.split('\x00') if value.strip()))
+
+
+def _unsynchronise(data: bytes) -> bytes:
+    return data.replace(b'\xff\x00', b'\xff')
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def parse_id3v2(tag: bytes) -> Dict[str, str]:
+    """Text fields of an ID3v2.2/2.3/2.4 tag (header included); a truncated tag gives what it has."""
+    fields = {}
+    if len(tag) < 10 or not tag.startswith(b'ID3'):
+        return fields
+    version, flags = tag[3], tag[5]
+    body = tag[10:]
+    if flags & 0x80 and version < 4:
+        body = _unsynchronise(body)
+    pos = 0
+    if flags & 0x40 and version >= 3:
+        # extended header: v2.3 gives its size without the size field, v2.4 with it (syncsafe)
+        if len(body) < 4:
+            return fields
+        pos = _syncsafe(body[:4]) if version == 4 else struct.unpack('>I', body[:4])[0] + 4
+    id_len, header_len = (3, 6) if version == 2 else (4, 10)
+    while pos + header_len <= len(body):
+        frame_id = body[pos:pos + id_len]
+        if not frame_id[:1].isalnum():
+            # padding
+            break
+        if version == 2:
+            size = int.from_bytes(body[pos + 3:pos + 6], 'big')
+        elif version == 4:
+            size = _syncsafe(body[pos + 4:pos + 8])
+        else:
+            size = struct.unpack('>I', body[pos + 4:pos + 8])[0]
+        data = body[pos + header_len:pos + header_len + size]
+        pos += header_len + size
+        name = ID3_FRAMES.get(frame_id.decode('latin-1'))
+        if name is None or name in fields:
+            continue
+        if version == 4:
+            format_flags = body[pos - size - 1]
+            if format_flags & 0x02:
+                data = _unsynchronise(data)
+            if format_flags & 0x01:
+                # data length indicator
+                data = data[4:]
+        value = _decode_text(data)
+        if value is not None:
+            fields[name] = value
+    genre = fields.get('genre')
+    if genre is not None and genre.startswith('('):
+        # "(17)Rock" / "(17)": the numeric ID3v1 reference adds nothing readable
+        rest = genre.split(')', 1)[-1].strip()
+        if rest:
+            fields['genre'] = rest
+        else:
+            del fields['genre']
+    return fields
+
+
+def parse_id3v1(tail: bytes) -> Dict[str, str]:
+    """Fields of an ID3v1(.1) tag in the last 128 bytes of a file."""
+    if len(tail) != ID3V1_SIZE or not tail.startswith(b'TAG'):
+        return {}
+    fields = {}
+    for name, lo, hi in (('title', 3, 33), ('artist', 33, 63), ('album', 63, 93), ('year', 93, 97)):
+        value = _clean(tail[lo:hi].split(b'\x00', 1)[0].decode('latin-1'))
+        if value is not None:
+            fields[name] = value
+    if tail[125] == 0 and tail[126]:
+        # ID3v1.1 keeps the track number in the last byte of the comment
+        fields['track'] = str(tail[126])
+    return fields
+
+
+def mpeg_header(buf: bytes, i: int) -> Optional[dict]:
+    """Bitrate, sample rate and frame geometry of the MPEG audio frame at buf[i]."""
+    if not _mpeg_frame(buf, i):
+        return None
+    version = (buf[i + 1] >> 3) & 3
+    layer = (buf[i + 1] >> 1) & 3
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1, layer][buf[i + 2] >> 4]
+    rate = _SAMPLE_RATES[version][(buf[i + 2] >> 2) & 3]
+    if not bitrate:
+        # "free format": no way to tell the frame size from the header
+        return None
+    padding = (buf[i + 2] >> 1) & 1
+    mono = buf[i + 3] >> 6 == 3
+    if layer == 3:
+        samples = 384
+        length = (12 * bitrate * 1000 // rate + padding) * 4
+    else:
+        samples = 1152 if mpeg1 or layer == 2 else 576
+        length = samples // 8 * bitrate * 1000 // rate + padding
+    # Layer III side information sits between the header and a Xing/Info header
+    side = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return {'bitrate': bitrate, 'sample_rate': rate, 'channels': 1 if mono else 2,
+            'samples': samples, 'length': length, 'side': side if layer == 1 else None}
+
+
+def _first_mpeg_frame(window: bytes) -> Optional[Tuple[int, dict]]:
+    """(offset, header) of the first frame in window that the next frame header confirms."""
+    i = window.find(b'\xff')
+    while i != -1:
+        header = mpeg_header(window, i)
+        if header is not None:
+            following = i + header['length']
+            # at the end of the window there is nothing left to confirm it with
+            if following + 4 > len(window) or mpeg_header(window, following) is not None:
+                return i, header
+        i = window.find(b'\xff', i + 1)
+    return None
+
+
+def _vbr_info(window: bytes, i: int, header: dict) -> Optional[Tuple[int, Optional[int]]]:
+    """(frames, bytes) from a Xing/Info or VBRI header in the first frame, if there is one."""
+    if header['side'] is not None:
+        at = i + 4 + header['side']
+        if window[at:at + 4] in (b'Xing', b'Info') and len(window) >= at + 8:
+            flags = struct.unpack('>I', window[at + 4:at + 8])[0]
+            pos = at + 8
+            frames = size = None
+            if flags & 1 and len(window) >= pos + 4:
+                frames = struct.unpack('>I', window[pos:pos + 4])[0]
+                pos += 4
+            if flags & 2 and len(window) >= pos + 4:
+                size = struct.unpack('>I', window[pos:pos + 4])[0]
+            return (frames, size) if frames else None
+    at = i + 36
+    if window[at:at + 4] == b'VBRI' and len(window) >= at + 18:
+        size, frames = struct.unpack('>II', window[at + 10:at + 18])
+        return (frames, size or None) if frames else None
+    return None
+
+
+def parse_vorbis_comment(block: bytes) -> Dict[str, str]:
+    """Fields of a FLAC VORBIS_COMMENT block (little-endian lengths, KEY=value UTF-8 pairs)."""
+    fields = {}
+    try:
+        vendor = struct.unpack('<I', block[:4])[0]
+        pos = 4 + vendor
+        count = struct.unpack('<I', block[pos:pos + 4])[0]
+        pos += 4
+        for _ in range(count):
+            length = struct.unpack('<I', block[pos:pos + 4])[0]
+            comment = block[pos + 4:pos + 4 + length].decode('utf-8', errors='replace')
+            pos += 4 + length
+            key, _, value = comment.partition('=')
+            name = VORBIS_FIELDS.get(key.upper())
+            if name is not None and name not in fields and _clean(value):
+                fields[name] = _clean(value)
+    except struct.error:
+        # a truncated block: keep what came before the cut
+        pass
+    return fields
+
+
+def _boxes(data: bytes, pos: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, body offset, end offset) of the MP4 boxes in data[pos:end]."""
+    while pos + 8 <= end:
+        size, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack('>Q', data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _child(data: bytes, pos: int, end: int, kind: bytes) -> Optional[Tuple[int, int]]:
+    for box, body, box_end in _boxes(data, pos, end):
+        if box == kind:
+            return body, box_end
+    return None
+
+
+def parse_moov(moov: bytes) -> dict:
+    """Fields, duration and sample rate from an M4A `moov` atom (header included)."""
+    info = {}
+    end = len(moov)
+    mvhd = _child(moov, 8, end, b'mvhd')
+    if mvhd is not None:
+        body = moov[mvhd[0]:mvhd[1]]
+        if body[:1] == b'\x01' and len(body) >= 32:
+            timescale, duration = struct.unpack('>IQ', body[20:32])
+        elif len(body) >= 20:
+            timescale, duration = struct.unpack('>II', body[12:20])
+        else:
+            timescale = duration = 0
+        if timescale:
+            info['duration'] = duration / timescale
+    udta = _child(moov, 8, end, b'udta')
+    meta = _child(moov, udta[0], udta[1], b'meta') if udta else None
+    if meta is not None:
+        # `meta` is a full box (4 bytes version/flags) in iTunes files, a plain one in QuickTime's
+        start = meta[0] if moov[meta[0] + 4:meta[0] + 8] == b'hdlr' else meta[0] + 4
+        ilst = _child(moov, start, meta[1], b'ilst')
+        for kind, body, box_end in (_boxes(moov, ilst[0], ilst[1]) if ilst else ()):
+            data = _child(moov, body, box_end, b'data')
+            if data is None:
+                continue
+            # type indicator (4) and locale (4) come before the value
+            value = moov[data[0] + 8:data[1]]
+            if kind == b'trkn' and len(value) >= 4:
+                track = struct.unpack('>H', value[2:4])[0]
+                if track:
+                    info['track'] = str(track)
+            elif kind in MP4_FIELDS and MP4_FIELDS[kind] not in info:
+                text = _clean(value.decode('utf-8', errors='replace'))
+                if text is not None:
+                    info[MP4_FIELDS[kind]] = text
+    return info
+
+
+class TagReader:
+    """Collects song metadata from a body fed chunk by chunk, in order.
+
+    Parsing is driven by byte ranges: each step says which range of the file it needs next
+    (_expect) and is called with those bytes once they have streamed past. result(size) gives
+    the fields found, e.g. {'title', 'artist', 'album', 'album_artist', 'track', 'year',
+    'genre', 'duration' (seconds), 'bitrate' (kbit/s), 'sample_rate'}; missing ones are left out.
+    """
+
+    def __init__(self):
+        self.pos = 0
+        self.kind = None
+        self.fields = {}
+        self._tail = b''
+        self._want = None
+        self._buf = bytearray()
+        # the last range handed to a step; the next range may start inside it
+        self._last = (0, b'')
+        self._audio_start = 0
+        self._mpeg = None
+        self._vbr = None
+        self._flac = None
+        self._expect(0, 16, self._on_head)
+
+    def _expect(self, lo: int, hi: int, step: Callable[[int, bytes], None]) -> None:
+        last_lo, last = self._last
+        self._want = (lo, hi, step)
+        self._buf = bytearray(last[lo - last_lo:hi - last_lo]) if last_lo <= lo < last_lo + len(last) else bytearray()
+
+    def feed(self, chunk: bytes) -> None:
+        start = self.pos
+        self.pos += len(chunk)
+        if len(chunk) >= ID3V1_SIZE:
+            self._tail = chunk[-ID3V1_SIZE:]
+        else:
+            self._tail = (self._tail + chunk)[-ID3V1_SIZE:]
+        while self._want is not None:
+            lo, hi, step = self._want
+            at = lo + len(self._buf)
+            if at < hi:
+                if at >= self.pos:
+                    break
+                if at < start:
+                    # the range started in bytes that are gone already
+                    self._want = None
+                    break
+                self._buf += chunk[at - start:hi - start]
+                if lo + len(self._buf) < hi:
+                    break
+            self._run(lo, step)
+
+    def _run(self, lo: int, step: Callable[[int, bytes], None]) -> None:
+        data = bytes(self._buf)
+        self._want = None
+        last_lo, last = self._last
+        if not last_lo <= lo <= lo + len(data) <= last_lo + len(last):
+            # a range inside the last one (a FLAC block header within the first 16 bytes)
+            # keeps the wider one, whose later bytes the next range may still need
+            self._last = (lo, data)
+        step(lo, data)
+
+    def _on_head(self, lo: int, head: bytes) -> None:
+        if head.startswith(b'ID3'):
+            self.kind = 'mp3'
+            end = _id3_end(head)
+            if end is None:
+                self._expect(10, 10 + FRAME_WINDOW, self._on_mpeg)
+                return
+            self._audio_start = end
+            self._expect(0, min(end, MAX_TAG_BYTES), self._on_id3)
+        elif head.startswith(b'fLaC'):
+            self.kind = 'flac'
+            self._expect(4, 8, self._on_flac_block)
+        elif head[4:8] == b'ftyp':
+            self.kind = 'm4a'
+            self._on_atom(0, head)
+        elif _mpeg_frame(head, 0):
+            self.kind = 'mp3'
+            self._expect(0, FRAME_WINDOW, self._on_mpeg)
+
+    def _on_id3(self, lo: int, tag: bytes) -> None:
+        self.fields.update(parse_id3v2(tag))
+        self._expect(self._audio_start, self._audio_start + FRAME_WINDOW, self._on_mpeg)
+
+    def _on_mpeg(self, lo: int, window: bytes) -> None:
+        found = _first_mpeg_frame(window)
+        if found is not None:
+            i, header = found
+            self._audio_start = lo + i
+            self._mpeg = header
+            self._vbr = _vbr_info(window, i, header)
+
+    def _on_flac_block(self, lo: int, header: bytes) -> None:
+        if len(header) < 4:
+            return
+        last = header[0] & 0x80
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:4], 'big')
+        body = lo + 4
+        following = body + length
+        self._audio_start = following
+
+        def _next(lo: int, block: bytes) -> None:
+            if block_type == 0 and len(block) >= 18:
+                self._flac = block
+            elif block_type == 4:
+                self.fields.update({k: v for k, v in parse_vorbis_comment(block).items() if k not in self.fields})
+            if not last:
+                self._expect(following, following + 4, self._on_flac_block)
+
+        if block_type in (0, 4) and length <= MAX_TAG_BYTES:
+            self._expect(body, following, _next)
+        elif not last:
+            # pictures, seek tables, padding: skipped without keeping their bytes
+            self._expect(following, following + 4, self._on_flac_block)
+
+    def _on_atom(self, lo: int, header: bytes) -> None:
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack('>I4s', header[:8])
+        if size == 1 and len(header) >= 16:
+            size = struct.unpack('>Q', header[8:16])[0]
+        if kind == b'moov' and 8 <= size <= MAX_MOOV_BYTES:
+            self._expect(lo, lo + size, self._on_moov)
+        elif size >= 8:
+            # top-level atoms (`mdat` above all) are stepped over; only the next header is read
+            self._expect(lo + size, lo + size + 16, self._on_atom)
+
+    def _on_moov(self, lo: int, moov: bytes) -> None:
+        self.fields.update(parse_moov(moov))
+
+    def result(self, size: int) -> dict:
+        """The fields found in a body of `size` bytes (the total fed, unless told otherwise)."""
+        while self._want is not None and self._buf:
+            # the body ended inside a range: use what there is (a short file, a cut-off tag)
+            lo, _, step = self._want
+            self._run(lo, step)
+        fields = dict(self.fields)
+        audio = size - self._audio_start
+        if self.kind == 'mp3':
+            v1 = parse_id3v1(bytes(self._tail)) if size >= ID3V1_SIZE else {}
+            if v1:
+                audio -= ID3V1_SIZE
+            for name, value in v1.items():
+                fields.setdefault(name, value)
+            if self._mpeg is not None:
+                fields['sample_rate'] = self._mpeg['sample_rate']
+                if self._vbr is not None:
+                    frames, vbr_bytes = self._vbr
+                    fields['duration'] = frames * self._mpeg['samples'] / self._mpeg['sample_rate']
+                    audio = vbr_bytes or audio
+                    if fields['duration']:
+                        fields['bitrate'] = round(audio * 8 / fields['duration'] / 1000)
+                else:
+                    fields['bitrate'] = self._mpeg['bitrate']
+                    fields['duration'] = audio * 8 / (self._mpeg['bitrate'] * 1000)
+        elif self.kind == 'flac' and self._flac is not None:
+            block = self._flac
+            rate = (block[10] << 12) | (block[11] << 4) | (block[12] >> 4)
+            samples = ((block[13] & 0x0F) << 32) | struct.unpack('>I', block[14:18])[0]
+            if rate:
+                fields['sample_rate'] = rate
+                if samples:
+                    fields['duration'] = samples / rate
+                    fields['bitrate'] = round(audio * 8 / fields['duration'] / 1000)
+        elif self.kind == 'm4a' and fields.get('duration'):
+            # average over the whole file; the audio track's own rate is in esds, rarely needed
+            fields['bitrate'] = round(size * 8 / fields['duration'] / 1000)
+        if 'year' in fields:
+            fields['year'] = fields['year'][:4]
+        if fields.get('duration') is not None:
+            fields['duration'] = round(fields['duration'], 1)
+        return fields
@@ -0,0 +1,287 @@
+import json
+import math
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+# Per-thread DNS/connect/TLS timings of the attempt the thread is currently making
+_local = threading.local()
+
+
+def _timing() -> Optional[dict]:
+    return getattr(_local, 'timing', None)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of `values` (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _timed_connection_classes():
+    """urllib3 connection/pool classes that report DNS, TCP connect and TLS time.
+
+    Built on first use so urllib3 is only imported when a report was requested.
+    """
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.util.connection import allowed_gai_family
+
+    class _Timed:
+        def _new_conn(self):
+            timing = _timing()
+            if timing is None:
+                return super()._new_conn()
+            name = self._dns_host
+            start = time.perf_counter()
+            try:
+                infos = socket.getaddrinfo(name, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+            except OSError:
+                infos = None
+            resolved = time.perf_counter()
+            timing['dns'] += resolved - start
+            try:
+                # connect to the address just resolved so the lookup isn't done (and paid) twice;
+                # the certificate is still checked against self.host
+                if infos:
+                    self._dns_host = infos[0][4][0]
+                try:
+                    sock = super()._new_conn()
+                except Exception:
+                    if self._dns_host == name:
+                        raise
+                    # first address unreachable (e.g. broken IPv6): let urllib3 try them all
+                    self._dns_host = name
+                    sock = super()._new_conn()
+            finally:
+                self._dns_host = name
+            timing['connect'] += time.perf_counter() - resolved
+            timing['new_connections'] += 1
+            return sock
+
+        def connect(self):
+            timing = _timing()
+            if timing is None:
+                return super().connect()
+            start = time.perf_counter()
+            before = timing['dns'] + timing['connect']
+            super().connect()
+            # whatever connect() spent beyond DNS + TCP is the TLS handshake
+            timing['tls'] += max(0.0, time.perf_counter() - start - (timing['dns'] + timing['connect'] - before))
+
+    class TimedHTTPConnection(_Timed, HTTPConnection):
+        pass
+
+    class TimedHTTPSConnection(_Timed, HTTPSConnection):
+        pass
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    return {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+def instrument_session(session) -> None:
+    """Make every new connection of `session` report its DNS/connect/TLS time."""
+    pools = _timed_connection_classes()
+    for adapter in session.adapters.values():
+        manager = getattr(adapter, 'poolmanager', None)
+        if manager is not None:
+            manager.pool_classes_by_scheme = dict(pools)
+
+
+class Telemetry:
+    """Per-file transfer metrics for one run, optionally streamed to a JSON-lines report.
+
+    The download pool calls transfer() when a file starts, wraps each try in attempt(), and
+    calls finish() with the outcome. Each finished file becomes one {"type": "transfer"} line;
+    write_summary() appends a {"type": "summary"} line with the aggregates (see summary()).
+    """
+
+    def __init__(self, report_path: Optional[Path] = None, order: Optional[str] = None):
+        self.report_path = Path(report_path) if report_path else None
+        # scheduling policy of the run, kept in the summary so runs can be compared by it
+        self.order = order
+        self._lock = threading.Lock()
+        self._records = []
+        self._fh = None
+        self._first_start = None
+        self._last_end = None
+        if self.report_path is not None:
+            self.report_path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = open(self.report_path, 'a', encoding='utf-8', buffering=1)
+
+    def transfer(self, url: str, path) -> dict:
+        now = time.time()
+        with self._lock:
+            if self._first_start is None:
+                self._first_start = now
+        return {'url': url, 'path': str(path), 'started': now, 'attempts': 0, 'bytes': 0,
+                'dns_ms': 0.0, 'connect_ms': 0.0, 'tls_ms': 0.0, 'ttfb_ms': None,
+                'new_connections': 0, 'http_status': None}
+
+    def attempt(self, record: dict) -> '_Attempt':
+        return _Attempt(record)
+
+    def finish(self, record: dict, status: str, error: Optional[BaseException] = None) -> None:
+        end = time.time()
+        seconds = max(1e-6, end - record['started'])
+        record['status'] = status
+        record['retries'] = max(0, record['attempts'] - 1)
+        record['seconds'] = round(seconds, 3)
+        record['ended'] = end
+        record['mb_per_s'] = round(record['bytes'] / seconds / (1024 * 1024), 3)
+        for key in ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms'):
+            if record[key] is not None:
+                record[key] = round(record[key], 1)
+        if error is not None:
+            record['error'] = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self._records.append(record)
+            self._last_end = end if self._last_end is None else max(self._last_end, end)
+            if self._fh is not None:
+                self._fh.write(json.dumps(dict(record, type='transfer')) + '\n')
+
+    def summary(self) -> dict:
+        """Totals plus p50/p95 of time-to-first-byte, connect time and per-file duration."""
+        with self._lock:
+            records = list(self._records)
+            first_start = self._first_start
+            wall = (self._last_end - first_start) if records else 0.0
+        total_bytes = sum(r['bytes'] for r in records)
+        statuses = {}
+        for r in records:
+            statuses[r['status']] = statuses.get(r['status'], 0) + 1
+        ttfb = [r['ttfb_ms'] for r in records if r['ttfb_ms'] is not None]
+        connect = [r['dns_ms'] + r['connect_ms'] + r['tls_ms'] for r in records if r['new_connections']]
+        seconds = [r['seconds'] for r in records if r['status'] == 'downloaded']
+        # how soon files were done, counted from the first start: what the order changes most
+        done = [round(r['ended'] - first_start, 3) for r in records]
+        return {
+            'order': self.order,
+            'files': len(records),
+            'statuses': statuses,
+            'retries': sum(r['retries'] for r in records),
+            'bytes': total_bytes,
+            'wall_s': round(wall, 3),
+            'mb_per_s': round(total_bytes / wall / (1024 * 1024), 3) if wall > 0 else 0.0,
+            'ttfb_ms_p50': percentile(ttfb, 50),
+            'ttfb_ms_p95': percentile(ttfb, 95),
+            'setup_ms_p50': percentile(connect, 50),
+            'setup_ms_p95': percentile(connect, 95),
+            'file_s_p50': percentile(seconds, 50),
+            'file_s_p95': percentile(seconds, 95),
+            'done_s_p50': percentile(done, 50),
+            'done_s_p95': percentile(done, 95),
+        }
+
+    def write_summary(self) -> dict:
+        summary = self.summary()
+        with self._lock:
+            if self._fh is not None:
+                self._fh.write(json.dumps(dict(summary, type='summary', time=time.time())) + '\n')
+        return summary
+
+    def reset(self) -> None:
+        """Forget finished transfers so the next summary covers only what follows."""
+        with self._lock:
+            self._records = []
+            self._first_start = self._last_end = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class _Attempt:
+    """Context for one try of a transfer: collects connection timings made by this thread."""
+
+    def __init__(self, record: dict):
+        self.record = record
+
+    def __enter__(self):
+        self.record['attempts'] += 1
+        _local.timing = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0, 'new_connections': 0}
+        return self.record
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        timing = _local.timing
+        _local.timing = None
+        record = self.record
+        setup = timing['dns'] + timing['connect'] + timing['tls']
+        record['dns_ms'] += timing['dns'] * 1000
+        record['connect_ms'] += timing['connect'] * 1000
+        record['tls_ms'] += timing['tls'] * 1000
+        record['new_connections'] += timing['new_connections']
+        headers_s = record.pop('_headers_s', None)
+        if headers_s is not None:
+            # requests' elapsed runs from sending to parsed headers and includes connection setup
+            record['ttfb_ms'] = max(0.0, headers_s - setup) * 1000
+        return False
+
+
+def format_summary(summary: dict) -> List[str]:
+    def ms(value):
+        return '-' if value is None else f"{value:.0f} ms"
+
+    statuses = ', '.join(f"{k} {v}" for k, v in sorted(summary['statuses'].items())) or 'none'
+    return [
+        f"Files: {summary['files']} ({statuses}), retries: {summary['retries']}",
+        f"Transferred {summary['bytes'] / (1024 * 1024):.1f} MB in {summary['wall_s']:.1f} s "
+        f"({summary['mb_per_s']:.2f} MB/s overall)",
+        f"Time to first byte p50/p95: {ms(summary['ttfb_ms_p50'])} / {ms(summary['ttfb_ms_p95'])}; "
+        f"connection setup p50/p95: {ms(summary['setup_ms_p50'])} / {ms(summary['setup_ms_p95'])}",
+        f"Half of the files were done after {summary['done_s_p50'] or 0:.1f} s, 95% after "
+        f"{summary['done_s_p95'] or 0:.1f} s" + (f" (order: {summary['order']})" if summary.get('order') else ''),
+    ]
+
+
+def profile_call(fn: Callable, out_path: Path, top: int = 25):
+    """Run fn() under cProfile, save the stats to out_path and print the top functions.
+
+    Downloads happen on worker threads, so those are profiled too: on Python < 3.12 each new
+    thread gets its own profiler (merged at the end); from 3.12 one profiler sees all threads.
+    """
+    import cProfile
+    import pstats
+
+    thread_profilers = []
+    per_thread = sys.version_info < (3, 12)
+
+    def _start_thread_profiler(frame, event, arg):
+        profiler = cProfile.Profile()
+        thread_profilers.append(profiler)
+        profiler.enable()  # replaces this hook for the rest of the thread
+
+    profiler = cProfile.Profile()
+    if per_thread:
+        threading.setprofile(_start_thread_profiler)
+    profiler.enable()
+    try:
+        return fn()
+    finally:
+        profiler.disable()
+        if per_thread:
+            threading.setprofile(None)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        for extra in thread_profilers:
+            try:
+                stats.add(extra)
+            except TypeError:
+                pass  # a thread that never made a call has no stats
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(str(out_path))
+        print(f"\nProfile saved to {out_path} (open with: python -m pstats {out_path})", file=sys.stderr)
+        stats.sort_stats('cumulative').print_stats(top)
@@ -0,0 +1,169 @@
+import hashlib
+from typing import Optional
+
+# Bytes from the start of a body kept for format sniffing
+HEAD_BYTES = 4096
+# After an ID3v2 tag, how far to look for the first audio frame
+FRAME_WINDOW = 4096
+
+# Problems that make a file useless; anything else is recorded as a warning only
+FATAL_PROBLEMS = ('empty body', 'HTML page instead of audio', 'text instead of audio')
+
+
+class CorruptDownload(IOError):
+    """The body arrived complete but is not the audio file it claims to be (e.g. an HTML error page)."""
+
+
+def _mpeg_frame(buf: bytes, i: int) -> bool:
+    """True if buf[i:i+4] is a plausible MPEG audio (MP1/2/3) frame header."""
+    if i + 4 > len(buf) or buf[i] != 0xFF or buf[i + 1] & 0xE0 != 0xE0:
+        return False
+    version = (buf[i + 1] >> 3) & 3
+    layer = (buf[i + 1] >> 1) & 3
+    bitrate = buf[i + 2] >> 4
+    rate = (buf[i + 2] >> 2) & 3
+    return version != 1 and layer != 0 and bitrate != 0xF and rate != 3
+
+
+def _adts_frame(buf: bytes, i: int) -> bool:
+    """True if buf[i:i+2] starts an AAC ADTS frame (12-bit sync, layer 0)."""
+    return i + 2 <= len(buf) and buf[i] == 0xFF and buf[i + 1] & 0xF6 == 0xF0
+
+
+def _find_frame(buf: bytes) -> bool:
+    i = buf.find(b'\xff')
+    while i != -1:
+        if _mpeg_frame(buf, i) or _adts_frame(buf, i):
+            return True
+        i = buf.find(b'\xff', i + 1)
+    return False
+
+
+def _id3_end(head: bytes) -> Optional[int]:
+    """Offset just past an ID3v2 tag at the start of head (None if the header is malformed)."""
+    if len(head) < 10 or head[3] not in (2, 3, 4) or any(b & 0x80 for b in head[6:10]):
+        return None
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    # a footer (v2.4 flag 0x10) repeats the 10-byte header after the tag
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+
+def _looks_like_text(head: bytes) -> Optional[str]:
+    sample = head[:512].lstrip()
+    if not sample:
+        return None
+    lowered = sample[:16].lower()
+    if lowered.startswith((b'<!doctype', b'<html', b'<head', b'<body', b'<?xml', b'<title')):
+        return 'HTML page instead of audio'
+    printable = sum(1 for b in sample if 32 <= b < 127 or b in (9, 10, 13))
+    if printable == len(sample):
+        return 'HTML page instead of audio' if sample.startswith(b'<') else 'text instead of audio'
+    return None
+
+
+def sniff(head: bytes):
+    """Identify a body from its first bytes.
+
+    Returns (kind, problem, frame_at): kind is 'mp3', 'flac', 'm4a', 'wav', 'ogg', 'aac' or
+    'unknown'; problem is None or a short description; frame_at is the offset where the first
+    MP3 frame should follow an ID3v2 tag (checked later by StreamVerifier), else None.
+    """
+    if not head:
+        return 'unknown', 'empty body', None
+    if head.startswith(b'ID3'):
+        end = _id3_end(head)
+        if end is None:
+            return 'mp3', 'malformed ID3 tag', None
+        return 'mp3', None, end
+    if head.startswith(b'fLaC'):
+        return 'flac', None, None
+    if head[4:8] == b'ftyp':
+        return 'm4a', None, None
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return 'wav', None, None
+    if head.startswith(b'OggS'):
+        return 'ogg', None, None
+    if _mpeg_frame(head, 0):
+        return 'mp3', None, None
+    if _adts_frame(head, 0):
+        return 'aac', None, None
+    problem = _looks_like_text(head)
+    if problem:
+        return 'unknown', problem, None
+    # some other binary format: keep it, but say we could not recognise it
+    return 'unknown', 'unrecognised audio format', None
+
+
+class StreamVerifier:
+    """Hash and sanity-check a body chunk by chunk as it is written, so no second read is needed.
+
+    feed() every chunk in order (including bytes of a resumed .part file, which resume()
+    reads once for the hash). result() then gives the SHA-256, the detected kind, a
+    problem, if any (only FATAL_PROBLEMS should fail a download) and, when the file has
+    any, its tags (title, artist, duration, ... read by utils.tags on the way).
+    """
+
+    def __init__(self):
+        # imported here: utils.tags builds on this module's frame checks
+        from utils.tags import TagReader
+        self.tags = TagReader()
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self._head = bytearray()
+        self._sniffed = None
+        self._frame_at = None
+        self._window = bytearray()
+
+    def feed(self, chunk: bytes) -> None:
+        self.hasher.update(chunk)
+        self.tags.feed(chunk)
+        start = self.size
+        self.size += len(chunk)
+        if self._sniffed is None:
+            self._head += chunk[:HEAD_BYTES - len(self._head)]
+            if len(self._head) >= HEAD_BYTES:
+                self._sniff()
+        if self._frame_at is not None and len(self._window) < FRAME_WINDOW \
+                and self.size > self._frame_at + len(self._window):
+            # collect FRAME_WINDOW bytes starting at the end of the ID3 tag
+            lo = max(0, self._frame_at + len(self._window) - start)
+            self._window += chunk[lo:lo + FRAME_WINDOW - len(self._window)]
+
+    def resume(self, path, block_size: int = 1024 * 1024) -> None:
+        """Feed the bytes already in a .part file before the resumed body."""
+        with open(str(path), 'rb') as fh:
+            for block in iter(lambda: fh.read(block_size), b''):
+                self.feed(block)
+
+    def _sniff(self) -> None:
+        kind, problem, frame_at = sniff(bytes(self._head))
+        self._sniffed = (kind, problem)
+        if frame_at is not None:
+            self._frame_at = frame_at
+            if frame_at < len(self._head):
+                self._window += self._head[frame_at:frame_at + FRAME_WINDOW]
+
+    def hexdigest(self) -> str:
+        return self.hasher.hexdigest()
+
+    def result(self) -> dict:
+        if self._sniffed is None:
+            self._sniff()
+        kind, problem = self._sniffed
+        if problem is None and self._frame_at is not None:
+            window = bytes(self._window)
+            if not window:
+                problem = 'ID3 tag but no audio after it'
+            elif not _find_frame(window) and not window.startswith(b'fLaC'):
+                # padding or junk after the tag hides the first frame; playable files exist like
+                # this, so it is a warning rather than a failure
+                problem = 'no MP3 frame after ID3 tag'
+        result = {'sha256': self.hexdigest(), 'size': self.size, 'kind': kind, 'problem': problem}
+        tags = self.tags.result(self.size)
+        if tags:
+            result['tags'] = tags
+        return result
+
+
+def is_fatal(problem: Optional[str]) -> bool:
+    return problem in FATAL_PROBLEMS
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import sqlite3
+
+# Seconds a claimed job stays reserved without a heartbeat; a worker that dies loses it then
+DEFAULT_LEASE = 120.0
+# A job whose lease ran out this many times (its worker kept dying on it) is given up
+MAX_ATTEMPTS = 3
+# Collections are listed before files are fetched, so every worker has files to take soon
+PRIORITY = {'collection': 1, 'file': 0}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, priority, lease_until);
+'''
+
+
+class Job:
+    __slots__ = ('key', 'kind', 'payload', 'attempts')
+
+    def __init__(self, key: str, kind: str, payload: dict, attempts: int):
+        self.key = key
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+
+class WorkQueue:
+    """Jobs shared by several mirroring processes, possibly on several machines, through one
+    SQLite file (e.g. under an NFS-mounted output/ root).
+
+    A job ('collection' or 'file', keyed by URL or output path so nothing is queued twice) is
+    claimed with a lease: it belongs to one worker until the lease runs out. Workers renew
+    their leases while they run (start_heartbeat), so only a crashed or unplugged worker's
+    jobs expire and get claimed by someone else. Claims run in BEGIN IMMEDIATE transactions,
+    which take SQLite's write lock, so two workers never get the same job. The file uses
+    SQLite's default rollback journal rather than WAL, which doesn't work over network
+    filesystems; it needs working POSIX locks there (NFSv4, or NFSv3 with lockd).
+    """
+
+    def __init__(self, path: Path, owner: Optional[str] = None, lease: float = DEFAULT_LEASE):
+        # sqlite3 and socket are loaded here, not with the menu (only --queue needs them)
+        import socket
+        import sqlite3
+        self.path = Path(path)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease = lease
+        self._heartbeat = None
+        self._stop = threading.Event()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # one connection for every thread (download workers report through on_finish, the
+        # heartbeat renews leases); the lock keeps their transactions apart
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _db(self) -> Iterator['sqlite3.Connection']:
+        with self._lock:
+            yield self._conn
+
+    def add(self, kind: str, key: str, payload: dict) -> None:
+        self.add_many(kind, [(key, payload)])
+
+    def add_many(self, kind: str, jobs: List[tuple]) -> int:
+        """Queue (key, payload) jobs; keys already in the queue (in any state) are left alone.
+        Returns how many were new."""
+        now = time.time()
+        with self._db() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                before = db.total_changes
+                db.executemany('INSERT OR IGNORE INTO jobs (key, kind, payload, priority, updated) '
+                               'VALUES (?, ?, ?, ?, ?)',
+                               [(key, kind, json.dumps(payload), PRIORITY.get(kind, 0), now) for key, payload in jobs])
+                added = db.total_changes - before
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return added
+
+    def claim(self, limit: int = 1) -> List[Job]:
+        """Lease up to `limit` jobs that are pending or whose lease expired, collections first."""
+        now = time.time()
+        with self._db() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                # a lease that ran out MAX_ATTEMPTS times: the job keeps killing its workers
+                db.execute("UPDATE jobs SET state = 'failed', error = 'lease expired too often', updated = ? "
+                           "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, MAX_ATTEMPTS))
+                rows = db.execute("SELECT key, kind, payload, attempts FROM jobs "
+                                  "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) "
+                                  "ORDER BY priority DESC, rowid LIMIT ?", (now, limit)).fetchall()
+                db.executemany("UPDATE jobs SET state = 'leased', owner = ?, lease_until = ?, "
+                               "attempts = attempts + 1, updated = ? WHERE key = ?",
+                               [(self.owner, now + self.lease, now, key) for key, _, _, _ in rows])
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return [Job(key, kind, json.loads(payload), attempts + 1) for key, kind, payload, attempts in rows]
+
+    def finish(self, key: str, ok: bool, error: Optional[str] = None) -> bool:
+        """Mark a job done or failed; False if its lease had been taken over by another worker."""
+        with self._db() as db:
+            cur = db.execute("UPDATE jobs SET state = ?, error = ?, lease_until = NULL, updated = ? "
+                             "WHERE key = ? AND owner = ? AND state = 'leased'",
+                             ('done' if ok else 'failed', error, time.time(), key, self.owner))
+            return cur.rowcount == 1
+
+    def release(self) -> None:
+        """Hand every job this worker still holds back to the queue (on Ctrl-C)."""
+        with self._db() as db:
+            db.execute("UPDATE jobs SET state = 'pending', owner = NULL, lease_until = NULL, "
+                       "attempts = MAX(0, attempts - 1), updated = ? WHERE owner = ? AND state = 'leased'",
+                       (time.time(), self.owner))
+
+    def renew(self) -> None:
+        with self._db() as db:
+            db.execute("UPDATE jobs SET lease_until = ? WHERE owner = ? AND state = 'leased'",
+                       (time.time() + self.lease, self.owner))
+
+    def start_heartbeat(self) -> None:
+        """Renew this worker's leases every third of the lease time until close()."""
+        import sqlite3
+
+        def _beat():
+            while not self._stop.wait(self.lease / 3):
+                try:
+                    self.renew()
+                except sqlite3.Error:
+                    # a busy or briefly unreachable database: try again at the next beat
+                    pass
+
+        self._heartbeat = threading.Thread(target=_beat, name='queue-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def counts(self) -> Dict[str, int]:
+        with self._db() as db:
+            return dict(db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def active(self) -> int:
+        """Jobs still pending or held under a live lease by any worker."""
+        with self._db() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'pending' "
+                              "OR (state = 'leased' AND lease_until >= ?)", (time.time(),)).fetchone()[0]
+
+    def failures(self, limit: int = 20) -> List[tuple]:
+        with self._db() as db:
+            return db.execute("SELECT key, error FROM jobs WHERE state = 'failed' ORDER BY updated LIMIT ?",
+                              (limit,)).fetchall()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        with self._lock:
+            self._conn.close()